@@ -8,6 +8,8 @@
 import pandas as pd
 import numpy as np
 import sys
+sys.path.append ('../specific_models/cicids')
+from unit import load_cicids, encode_labels
 import matplotlib.pyplot as plt
 
 # Random state for eproducibility
@@ -22,10 +24,11 @@ CICIDS_WEDNESDAY = CICIDS_DIRECTORY + CICIDS_WEDNESDAY_FILENAME
 ###############################################################################
 ## Load dataset
 ###############################################################################
-df = pd.read_csv (CICIDS_WEDNESDAY)
-
 ## Fraction dataframe for quicker testing (copying code is hard)
-df = df.sample (frac = 0.1, replace = True, random_state = STATE)
+## Sampled per label while reading, only the kept lines are parsed into the
+## dataframe. Use files = CICIDS_FILES to load every day.
+df = load_cicids (CICIDS_DIRECTORY, files = [CICIDS_WEDNESDAY_FILENAME],
+                  fraction = 0.1, state = STATE, fill_value = 0)
 print ('Using fractured dataframe.')
 
 ###############################################################################
@@ -34,9 +37,8 @@ print ('Using fractured dataframe.')
 print ('Dataframe shape (lines, collumns):', df.shape, '\n')
 print ('First 5 entries:\n', df [:5], '\n')
 print ('Dataframe attributes:\n', df.keys (), '\n')
-## Note the pesky spaces before ALMOST all attributes
-## This is annoying and could be removed, but we'll try to operate on the
-## dataset "as is"
+## Note: the pesky spaces before ALMOST all attributes are removed by
+## load_cicids (' Label' -> 'Label')
 df.info (verbose = False) # Make it true to find individual atribute types
 print (df.describe ()) # Brief statistical description on NUMERICAL atributes
 print ('Dataframe contains NaN values:', df.isnull ().values.any ())
@@ -65,15 +67,14 @@ print ('NaN columns:', nanColumns)
 ## This may be hard to read for some distributions
 #columnNames = df.columns
 #for column in columnNames:
-#  df.plot.scatter (x = column, y = ' Label')
+#  df.plot.scatter (x = column, y = 'Label')
 #  plt.show ()
 
 ###############################################################################
 ## Display specific (dataset dependent) information, we're using CICIDS
 ###############################################################################
-## Remember the pesky spaces?
-print ('Label types:', df [' Label'].unique ())
-print ('Label distribution:\n', df [' Label'].value_counts ())
+print ('Label types:', df ['Label'].unique ())
+print ('Label distribution:\n', df ['Label'].value_counts ())
 ## Note that we may want to group the attacks together when handling the
 ## target as a categorical attribute, since there are so few samples of some
 ## of them.
@@ -89,10 +90,7 @@ print ('Label distribution:\n', df [' Label'].value_counts ())
 ## selection...) to select features.
 ## You may also choose to convert the dataframe to a numpy array and continue.
 
-## Remove NaN and inf values
-df.replace ('Infinity', np.nan, inplace = True) ## Or other text values
-df.replace (np.inf, np.nan, inplace = True) ## Remove infinity
-df.replace (np.nan, 0, inplace = True)
+## NaN and inf values were replaced by 0 while loading (fill_value)
 ## We can also use scikit-learn to use other strategies for substitution
 print ('Dataframe contains NaN values:', df.isnull ().values.any ())
 nanColumns = [i for i in df.columns if df [i].isnull ().any ()]
@@ -108,7 +106,7 @@ mmScaler = MinMaxScaler ()
 ## Standard feature range: (0, 1)
 df [df.columns [:-1]] = mmScaler.fit_transform (df [df.columns [:-1]])
 ## You may also use set of columns instead of the entire dataframe:
-#df [ [' Flow Duration']] = mmScaler.fit_transform (df [ [' Flow Duration']])
+#df [ ['Flow Duration']] = mmScaler.fit_transform (df [ ['Flow Duration']])
 print ('Description AFTER scaling:')
 print (df.describe ()) # After scaling
 
@@ -145,14 +143,9 @@ print (df.describe ()) # After scaling
 ###############################################################################
 ## Encode categorical attributes (this may be done before finding pearson)
 ###############################################################################
-print ('Label types before conversion:', df [' Label'].unique ())
-df [' Label'] = df [' Label'].replace ('BENIGN', 0)
-df [' Label'] = df [' Label'].replace ('DoS slowloris', 1)
-df [' Label'] = df [' Label'].replace ('DoS Slowhttptest', 2)
-df [' Label'] = df [' Label'].replace ('DoS Hulk', 3)
-df [' Label'] = df [' Label'].replace ('DoS GoldenEye', 4)
-df [' Label'] = df [' Label'].replace ('Heartbleed', 5)
-print ('Label types after conversion:', df [' Label'].unique ())
+print ('Label types before conversion:', df ['Label'].unique ())
+df ['Label'] = encode_labels (df ['Label'], 'multiclass')
+print ('Label types after conversion:', df ['Label'].unique ())
 df.info (verbose = False)
 
 ###############################################################################
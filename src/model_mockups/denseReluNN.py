@@ -1,5 +1,8 @@
 import numpy as np 
 import pandas as pd
+import sys
+sys.path.append('../specific_models/cicids')
+from unit import load_cicids, encode_labels
 
 import tensorflow as tf
 
@@ -17,19 +20,13 @@ CICIDS_WEDNESDAY_FILENAME = 'Wednesday-workingHours.pcap_ISCX.csv'
 CICIDS_MONDAY = CICIDS_DIRECTORY + CICIDS_MONDAY_FILENAME
 CICIDS_WEDNESDAY = CICIDS_DIRECTORY + CICIDS_WEDNESDAY_FILENAME
 
-dataFrame = pd.read_csv(CICIDS_WEDNESDAY)
-## Remove NaN and inf values
-dataFrame.replace ('Infinity', np.nan, inplace = True) ## Or other text values
-dataFrame.replace (np.inf, np.nan, inplace = True) ## Remove infinity
-dataFrame.replace (np.nan, 0, inplace = True)
+#column names are normalized (' Label' -> 'Label') while reading
+## NaN and inf values are replaced by 0 while loading
+dataFrame = load_cicids(CICIDS_DIRECTORY, files=[CICIDS_WEDNESDAY_FILENAME],
+                        fill_value=0)
 
 #converting labels
-dataFrame [' Label'] = dataFrame [' Label'].replace ('BENIGN', 0)
-dataFrame [' Label'] = dataFrame [' Label'].replace ('DoS slowloris', 1)
-dataFrame [' Label'] = dataFrame [' Label'].replace ('DoS Slowhttptest', 2)
-dataFrame [' Label'] = dataFrame [' Label'].replace ('DoS Hulk', 3)
-dataFrame [' Label'] = dataFrame [' Label'].replace ('DoS GoldenEye', 4)
-dataFrame [' Label'] = dataFrame [' Label'].replace ('Heartbleed', 5)
+dataFrame ['Label'] = encode_labels (dataFrame ['Label'], 'multiclass')
 
 #splitting dataset
 train, test = train_test_split(dataFrame, test_size=0.2)
@@ -41,7 +38,7 @@ print(len(test), 'test examples')
 #make dataFrame into a data set
 def df_to_dataset(dataFrame, shuffle=True, batch_size=32):
     dataFrame = dataFrame.copy()
-    labels = dataFrame.pop(' Label')
+    labels = dataFrame.pop('Label')
     data_set = tf.data.Dataset.from_tensor_slices((dict(dataFrame), labels))
     if shuffle:
         data_set = data_set.shuffle(buffer_size=len(dataFrame))
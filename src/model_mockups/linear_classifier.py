@@ -8,6 +8,8 @@
 import pandas as pd
 import numpy as np
 import sys
+sys.path.append ('../specific_models/cicids')
+from unit import load_cicids, encode_labels
 
 # Random state for eproducibility
 STATE = 0
@@ -22,10 +24,11 @@ CICIDS_WEDNESDAY = CICIDS_DIRECTORY + CICIDS_WEDNESDAY_FILENAME
 ###############################################################################
 ## Load dataset
 ###############################################################################
-df = pd.read_csv (CICIDS_WEDNESDAY)
-
 ## Fraction dataframe for quicker testing (copying code is hard)
-df = df.sample (frac = 0.1, replace = True, random_state = 0)
+## Sampled per label while reading, only the kept lines are parsed into the
+## dataframe. Use files = CICIDS_FILES to load every day.
+df = load_cicids (CICIDS_DIRECTORY, files = [CICIDS_WEDNESDAY_FILENAME],
+                  fraction = 0.1, state = 0, fill_value = 0)
 print ('Using fractured dataframe.')
 
 ###############################################################################
@@ -34,9 +37,8 @@ print ('Using fractured dataframe.')
 print ('Dataframe shape (lines, collumns):', df.shape, '\n')
 print ('First 5 entries:\n', df [:5], '\n')
 print ('Dataframe attributes:\n', df.keys (), '\n')
-## Note the pesky spaces before ALMOST all attributes
-## This is annoying and could be removed, but we'll try to operate on the
-## dataset "as is"
+## Note: the pesky spaces before ALMOST all attributes are removed by
+## load_cicids (' Label' -> 'Label')
 df.info (verbose = False) # Make it true to find individual atribute types
 print (df.describe ()) # Brief statistical description on NUMERICAL atributes
 print ('Dataframe contains NaN values:', df.isnull ().values.any ())
@@ -59,9 +61,8 @@ print ('NaN columns:', nanColumns)
 ###############################################################################
 ## Display specific (dataset dependent) information, we're using CICIDS
 ###############################################################################
-## Remember the pesky spaces?
-print ('Label types:', df [' Label'].unique ())
-print ('Label distribution:\n', df [' Label'].value_counts ())
+print ('Label types:', df ['Label'].unique ())
+print ('Label distribution:\n', df ['Label'].value_counts ())
 ## Note that we may want to group the attacks together when handling the
 ## target as a categorical attribute, since there are so few samples of some
 ## of them.
@@ -78,10 +79,7 @@ print ('Label distribution:\n', df [' Label'].value_counts ())
 ## selection...) to select features.
 ## You may also choose to convert the dataframe to a numpy array and continue.
 
-## Remove NaN and inf values
-df.replace ('Infinity', np.nan, inplace = True) ## Or other text values
-df.replace (np.inf, np.nan, inplace = True) ## Remove infinity
-df.replace (np.nan, 0, inplace = True)
+## NaN and inf values were replaced by 0 while loading (fill_value)
 ## We can also use scikit-learn to use other strategies for substitution
 print ('Dataframe contains NaN values:', df.isnull ().values.any ())
 nanColumns = [i for i in df.columns if df [i].isnull ().any ()]
@@ -90,14 +88,9 @@ print ('NaN columns:', nanColumns)
 ###############################################################################
 ## Encode categorical attributes (this may be done before finding pearson)
 ###############################################################################
-print ('Label types before conversion:', df [' Label'].unique ())
-df [' Label'] = df [' Label'].replace ('BENIGN', 0)
-df [' Label'] = df [' Label'].replace ('DoS slowloris', 1)
-df [' Label'] = df [' Label'].replace ('DoS Slowhttptest', 1)
-df [' Label'] = df [' Label'].replace ('DoS Hulk', 1)
-df [' Label'] = df [' Label'].replace ('DoS GoldenEye', 1)
-df [' Label'] = df [' Label'].replace ('Heartbleed', 1)
-print ('Label types after conversion:', df [' Label'].unique ())
+print ('Label types before conversion:', df ['Label'].unique ())
+df ['Label'] = encode_labels (df ['Label'], 'binary')
+print ('Label types after conversion:', df ['Label'].unique ())
 df.info (verbose = False)
 
 ###############################################################################
@@ -19,6 +19,7 @@ import numpy as np
 from numpy import mean, std
 from unit import remove_columns_with_one_value, remove_nan_columns, load_dataset
 from unit import display_general_information, display_feature_distribution
+from unit import successive_halving, TrialScheduler
 from collections import Counter
 #from imblearn.over_sampling import RandomOverSampler, RandomUnderSampler
 import sklearn
@@ -302,20 +303,22 @@ print ('y_test shape:', y_test.shape)
 # Hyperparameter tuning
 test_fold = np.repeat ([-1, 0], [X_train.shape [0], X_val.shape [0]])
 myPreSplit = PredefinedSplit (test_fold)
-def create_model (learn_rate = 0.01, dropout_rate = 0.0, weight_constraint = 0,
-                  metrics = ['mse'], input_layer_neurons,
+def create_model (input_layer_neurons, learn_rate = 0.01, dropout_rate = 0.0,
+                  weight_constraint = 0, metrics = ['mse'],
                   neurons_on_first_layer = 32,
                   second_layer_boolean = False,
                   neurons_on_chokehold_layer = 8):
+  ### K: Mirrored encoder and decoder: first layer, optional second layer
+  ### (half of the first) and the chokehold in between.
   model = Sequential ()
   model.add (Dense (input_layer_neurons, activation = 'relu',
                    input_shape = (input_layer_neurons, )))
+  model.add (Dense (neurons_on_first_layer, activation = 'relu'))
   if (second_layer_boolean):
-    model.add (Dense (neurons_on_first_layer/2, activation = 'relu'))
-  model.add (Dense (neurons_on_second_layer, activation = 'relu'))
+    model.add (Dense (neurons_on_first_layer // 2, activation = 'relu'))
   model.add (Dense (neurons_on_chokehold_layer,  activation = 'relu'))
   if (second_layer_boolean):
-    model.add (Dense (neurons_on_first_layer/2, activation = 'relu'))
+    model.add (Dense (neurons_on_first_layer // 2, activation = 'relu'))
   model.add (Dense (neurons_on_first_layer, activation = 'relu'))
   model.add (Dense (input_layer_neurons, activation = None))
   model.compile (loss = 'mean_squared_error',
@@ -324,8 +327,7 @@ def create_model (learn_rate = 0.01, dropout_rate = 0.0, weight_constraint = 0,
   return model
 
 
-model = KerasRegressor (build_fn = create_model, verbose = 2)
-input_layer_neurons = X_train.shape [1]
+input_layer_neurons = [X_train.shape [1]]
 batch_size = [5000, 10000]
 epochs = [200]
 learn_rate = [0.0001, 0.001]
@@ -341,21 +343,23 @@ param_grid = dict (batch_size = batch_size, epochs = epochs,
                    neurons_on_first_layer = neurons_on_first_layer,
                    second_layer_boolean = second_layer_boolean,
                    neurons_on_chokehold_layer = neurons_on_chokehold_layer)
-grid = GridSearchCV (estimator = model, param_grid = param_grid,
-                    scoring = 'neg_mean_squared_error', cv = myPreSplit,
-                    verbose = 2, n_jobs = 1)
+### K: Successive halving over the epochs (validation MSE): the 32
+### candidates get 2 epochs, 1/3 of them survive each rung (7, 22, 67 and
+### 200 epochs), resuming from the epoch it stopped at (about 400 epochs in
+### total). Each rung runs N_JOBS trials at a time, one process per
+### trial with cpu_count / N_JOBS TensorFlow threads. Trials are printed as
+### they finish. No TensorFlow operation may run before the scheduler starts
+### (the workers are forked, the scheduler raises a RuntimeError otherwise).
+MIN_EPOCHS = 2
+N_JOBS = 4
 startTime = time.time ()
-grid_result = grid.fit (np.vstack ( (X_train, X_val)),#, axis = 1),
-                       np.vstack ( (X_train, X_val)))#, axis = 1))
+with TrialScheduler (create_model, X_train, X_train, X_val, X_val,
+                     n_jobs = N_JOBS) as scheduler:
+  result = successive_halving (scheduler, param_grid, MIN_EPOCHS,
+                               max (epochs))
 print (str (time.time () - startTime), 's to search grid.')
-print (grid_result.best_params_)
-
-print ("Best: %f using %s" % (grid_result.best_score_, grid_result.best_params_))
-means = grid_result.cv_results_ ['mean_test_score']
-stds = grid_result.cv_results_ ['std_test_score']
-params = grid_result.cv_results_ ['params']
-for mean, stdev, param in zip (means, stds, params):
-  print ("%f (%f) with: %r" % (mean, stdev, param))
+
+print ("Best: %f using %s" % (result ['best_score'], result ['best_params']))
 
 ## 9 features:
 ## Best: -0.148847 using {'batch_size': 5000, 'dropout_rate': 0.0, 'epochs': 10, 'learn_rate': 0.001, 'weight_constraint': 0}
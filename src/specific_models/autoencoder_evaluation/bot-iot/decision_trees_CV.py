@@ -12,6 +12,8 @@ import numpy as np
 from numpy import mean, std
 from unit import remove_columns_with_one_value, remove_nan_columns, load_dataset
 from unit import display_general_information, display_feature_distribution
+from unit import memmap_search
+from unit import successive_halving, SubsampleEvaluator, fold_cache
 from collections import Counter
 #from imblearn.over_sampling import RandomOverSampler, RandomUnderSampler
 import sklearn
@@ -159,7 +161,9 @@ for feature in object_features:
   remaining_features.remove (feature)
 remaining_features.remove (TARGET)
 
-standard_scaler_features = remaining_features
+### K: By position, memmap_search hands the workers a plain array.
+standard_scaler_features = [X_train_df.columns.get_loc (feature)
+                            for feature in remaining_features]
 my_scaler = StandardScaler ()
 steps = list ()
 steps.append (('scaler', my_scaler))
@@ -199,9 +203,21 @@ param_grid = {'feature_selector__feature_selector__score_func' : [f_classif],
               'classifier__min_samples_split' : [2, 3, 5]}
 print ('param_grid:', param_grid)
 cv = RepeatedStratifiedKFold (n_splits = 5, n_repeats = 1, random_state = STATE)
+### K: Faster alternative: successive halving. Candidates are scored on 1/27
+### of the rows first and only the best 1/3 move on to 3 times more rows.
+# evaluate = SubsampleEvaluator (clf, X_train_df, y_train_df, cv = cv,
+#                                scoring = 'f1', n_jobs = -1)
+# result = successive_halving (evaluate, param_grid, len (X_train_df) // 27,
+#                              len (X_train_df))
+# print ('Best: %f using %s' % (result ['best_score'], result ['best_params']))
 grid = GridSearchCV (estimator = clf, param_grid = param_grid, scoring = 'f1',
                      verbose = 1, n_jobs = -1, cv = cv)
-grid_result = grid.fit (X_train_df, y_train_df)
+### K: X_train_df is mapped once, each task only gets its fold indices.
+### K: The grid only varies the classifier: the preprocessor and the feature
+### selector are fitted once per fold (fold_cache) and reused.
+with fold_cache () as memory:
+  clf.set_params (memory = memory)
+  grid_result = memmap_search (grid, X_train_df, y_train_df)
 
 print ('Best: %f using %s' % (grid_result.best_score_, grid_result.best_params_))
 means = grid_result.cv_results_ ['mean_test_score']
@@ -2,8 +2,24 @@
 # github.com/kaylani2
 # kaylani AT gta DOT ufrj DOT br
 
+import os
+import sys
+import math
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import contextlib
+import multiprocessing
 import pandas as pd
 import numpy as np
+from joblib import Memory
+from multiprocessing import shared_memory
+from sklearn.base import clone
+from sklearn.model_selection import ParameterGrid, cross_val_score
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
 
 def load_dataset (file_schema, file_range, index_column, nan_values,
                   verbose = True):
@@ -38,59 +54,321 @@ def load_dataset (file_schema, file_range, index_column, nan_values,
     df = pd.concat ([df, aux])
   return df
 
-def display_general_information (df, verbose = True):
+def _hyperloglog (hashes, precision = 14):
+  '''
+  Parameters:
+  -----------
+  hashes: numpy.ndarray (uint64)
+    64 bit hashes of the values (pd.util.hash_pandas_object).
+
+  precision: int, default = 14
+    2**precision registers, ~1.04 / sqrt (2**precision) relative error
+    (0.8% for 14).
+
+  Returns:
+  --------
+  registers: numpy.ndarray (uint8)
+    HyperLogLog sketch. Sketches of different chunks are merged with
+    np.maximum.
+
+  Examples:
+  ---------
+  >>> registers = _hyperloglog (pd.util.hash_pandas_object (
+  ...                           df ['proto'], index = False).values)
+  '''
+  registers = np.zeros (1 << precision, dtype = np.uint8)
+  if (hashes.size == 0):
+    return registers
+  index = (hashes >> np.uint64 (64 - precision)).astype (np.intp)
+  ### K: The guard bit bounds the rank when the remaining bits are all zero.
+  rest = ((hashes << np.uint64 (precision)) |
+          np.uint64 (1 << (precision - 1)))
+  bit_length = np.frexp (rest.astype (np.float64)) [1]
+  rank = (65 - bit_length).astype (np.uint8)
+  np.maximum.at (registers, index, rank)
+  return registers
+
+def _hyperloglog_count (registers):
+  '''
+  Parameters:
+  -----------
+  registers: numpy.ndarray (uint8)
+    Output of _hyperloglog.
+
+  Returns:
+  --------
+  count: int
+    Estimated number of different values (linear counting for small
+    cardinalities).
+
+  Examples:
+  ---------
+  >>> _hyperloglog_count (registers)
+  '''
+  m = registers.size
+  alpha = 0.7213 / (1 + 1.079 / m)
+  estimate = alpha * m * m / np.sum (np.ldexp (1.0, -registers.astype (int)))
+  zeros = np.count_nonzero (registers == 0)
+  if ((estimate <= 5 / 2 * m) and (zeros > 0)):
+    estimate = m * math.log (m / zeros)
+  return int (round (estimate))
+
+def dataset_fingerprint (df, sample_size = 10000):
+  '''
+  Parameters:
+  -----------
+  df: pandas.DataFrame
+
+  sample_size: int, default = 10000
+    Lines (evenly spaced, first and last included) hashed with the shape,
+    columns and types.
+
+  Returns:
+  --------
+  digest: str
+    Cheap identifier of the dataset, used to cache reports. It does not
+    read every line.
+
+  Examples:
+  ---------
+  >>> dataset_fingerprint (df)
+  '''
+  my_hash = hashlib.sha1 (json.dumps ([list (df.shape),
+                                       [str (column) for column in df.columns],
+                                       [str (dtype) for dtype in df.dtypes]]
+                                      ).encode ())
+  if (len (df) > 0):
+    lines = np.unique (np.linspace (0, len (df) - 1,
+                                    min (sample_size, len (df))).astype (int))
+    my_hash.update (pd.util.hash_pandas_object (df.iloc [lines],
+                                                index = True).values.tobytes ())
+  return my_hash.hexdigest ()
+
+def profile_dataset (df, sample = None, precision = 14, state = 0):
+  '''
+  Parameters:
+  -----------
+  df: pandas.DataFrame
+
+  sample: int or float, default = None
+    Quick mode: profile this many lines (or this fraction of the lines)
+    instead of the whole frame. Distinct counts are then those of the sample.
+
+  precision: int, default = 14
+    HyperLogLog precision (see _hyperloglog).
+
+  state: int, default = 0
+    Random state for the sample.
+
+  Returns:
+  --------
+  report: pandas.DataFrame
+    One line per column: dtype, nulls, distinct (approximate), min, max and
+    the values of the columns with fewer than 10 of them.
+
+  Examples:
+  ---------
+  >>> report = profile_dataset (df)
+  >>> report = profile_dataset (df, sample = 100000)
+  '''
+  if (sample is not None):
+    n = int (sample * len (df)) if (isinstance (sample, float)) else sample
+    if (n < len (df)):
+      df = df.sample (n = n, random_state = state)
+
+  ### K: Vectorized over the whole frame, one call each.
+  nulls = df.isna ().sum ()
+  numeric = df.select_dtypes (include = ['number', 'bool']).columns
+  minimum = df [numeric].min ()
+  maximum = df [numeric].max ()
+
+  rows = []
+  for column in df.columns:
+    values = df [column]
+    present = values [values.notna ()] if (nulls [column] > 0) else values
+    hashes = pd.util.hash_pandas_object (present, index = False).values
+    distinct = _hyperloglog_count (_hyperloglog (hashes, precision))
+    examples = None
+    if (distinct < 10):
+      ### K: Cheap, the hash table has at most a few entries.
+      examples = [str (value) for value in present.unique ()]
+      distinct = len (examples)
+    rows.append ({'column': column, 'dtype': str (values.dtype),
+                  'nulls': int (nulls [column]), 'distinct': distinct,
+                  'min': minimum.get (column, np.nan),
+                  'max': maximum.get (column, np.nan),
+                  'values': examples})
+  report = pd.DataFrame (rows).set_index ('column')
+  report.attrs ['lines'] = len (df)
+  report.attrs ['sampled'] = sample is not None
+  return report
+
+def display_general_information (df, verbose = True, sample = None,
+                                 cache_directory = None):
   '''
   Parameters:
   -----------
   df: pandas.DataFrame
 
   verbose: bool, default = True
+    Print every column (otherwise only the summary).
+
+  sample: int or float, default = None
+    Quick mode, see profile_dataset.
+
+  cache_directory: str, default = None
+    Reports are stored in cache_directory/profiles, keyed by
+    dataset_fingerprint, so a known dataset is not profiled again.
 
   Returns:
   --------
-  NULL
+  report: pandas.DataFrame
+    Output of profile_dataset.
 
   Examples:
   ---------
   >>> display_general_information (df)
+  >>> display_general_information (df, sample = 1/10, cache_directory = 'cache')
   '''
   print ('Dataframe shape (lines, columns):', df.shape, '\n')
   print ('First 5 entries:\n', df [:5], '\n')
-  df.info (verbose = verbose)
 
-  print ('Brief description:')
-  df.describe ()
+  startTime = time.time ()
+  report = None
+  if (cache_directory is not None):
+    report_file = os.path.join (cache_directory, 'profiles',
+                                '{}_{}.json'.format (dataset_fingerprint (df),
+                                                     sample))
+    if (os.path.isfile (report_file)):
+      report = pd.read_json (report_file, orient = 'table')
+      print ('Report loaded from:', report_file)
+  if (report is None):
+    report = profile_dataset (df, sample = sample)
+    if (cache_directory is not None):
+      os.makedirs (os.path.dirname (report_file), exist_ok = True)
+      report.to_json (report_file, orient = 'table', default_handler = str)
+  if (sample is not None):
+    print ('Quick mode (sample = {}): counts are those of the sample.'.format (
+           sample))
 
-  print ('\nDataframe contains NaN values:', df.isnull ().values.any ())
-  nanColumns = [i for i in df.columns if df [i].isnull ().any ()]
+  nanColumns = list (report.index [report ['nulls'] > 0])
+  print ('Dataframe contains NaN values:', len (nanColumns) > 0)
   print ('Number of NaN columns:', len (nanColumns))
   print ('NaN columns:', nanColumns, '\n')
 
-  # nUniques = df.nunique () ### K: Takes too long. WHY?
-  print ('\nColumn | # of different values')
-  nUniques = []
-  for column in df.columns:
-    nUnique = df [column].nunique ()
-    nUniques.append (nUnique)
-    print('{:35s} {:15d}  '.format(column, nUnique))
-    #print (column, '|', nUnique)
+  if (verbose):
+    print ('Column | type | # of NaN | # of different values (approx.) | '
+           'min | max')
+    for column, line in report.iterrows ():
+      print ('{:35s} {:10s} {:10d} {:15d} {:>15s} {:>15s}'.format (
+             str (column), line ['dtype'], int (line ['nulls']),
+             int (line ['distinct']), str (line ['min']), str (line ['max'])))
+    print ()
+    for column, line in report.iterrows ():
+      if (isinstance (line ['values'], list)):
+        print (column, line ['values'])
 
-  print ('\nColumn | different values (up to 10)')
-  for column in df.columns:
-    nUnique = df [column].nunique ()
-  for column, nUnique in zip (df.columns, nUniques):
-      if (nUnique < 10):
-        print (column, df [column].unique ())
-      else:
-        print('{:35s} {:15d}  '.format(column, nUnique))
-
-  my_objects = list (df.select_dtypes ( ['object']).columns)
+  my_objects = list (report.index [report ['dtype'].isin (['object', 'str'])])
   print ('\nObjects: (select encoding method)')
   print ('\nCheck for high cardinality.')
   print ('Column | # of different values | values')
   for column in my_objects:
-    print (column, '|', df [column].nunique (), '|', df [column].unique ())
-  print ('Objects:', list (df.select_dtypes (['object']).columns), '\n')
+    print (column, '|', report ['distinct'] [column], '|',
+           report ['values'] [column])
+  print ('Objects:', my_objects, '\n')
+  print (str (time.time () - startTime), 's to profile dataset.')
+  return report
+
+def _constant_values (df):
+  '''
+  Parameters:
+  -----------
+  df: pandas.DataFrame
+
+  Returns:
+  --------
+  constants: dict
+    column -> (constant, value). constant is True when the column has only
+    one (or zero) different non-NaN value, value is that value (NaN if the
+    column is empty). Numerical columns are checked with a single min/max
+    pass (min == max), the others by comparing against their first value.
+
+  Examples:
+  ---------
+  >>> _constant_values (pd.DataFrame ({'a': [1, 1], 'b': ['x', 'y']}))
+  {'a': (True, 1), 'b': (False, 'x')}
+  '''
+  constants = {}
+  numeric = df.select_dtypes (include = ['number', 'bool']).columns
+  if (len (numeric) > 0):
+    minimum = df [numeric].min ()
+    maximum = df [numeric].max ()
+    for column in numeric:
+      constants [column] = (not (minimum [column] < maximum [column]),
+                            minimum [column])
+  for column in df.columns:
+    if (column in constants):
+      continue
+    values = df [column]
+    if (isinstance (values.dtype, pd.CategoricalDtype)):
+      codes = values.cat.codes.values
+      codes = codes [codes >= 0]
+      constants [column] = ((codes.size == 0) or (codes.min () == codes.max ()),
+                            values.cat.categories [codes [0]]
+                            if (codes.size > 0) else np.nan)
+      continue
+    values = values.values
+    values = values [~pd.isna (values)]
+    if (values.size == 0):
+      constants [column] = (True, np.nan)
+    else:
+      constants [column] = (bool ((values == values [0]).all ()), values [0])
+  return {column: constants [column] for column in df.columns}
+
+class ConstantColumns:
+  '''
+  Finds the columns with only one (or zero) different non-NaN value. Works
+  on a whole dataframe or incrementally, one chunk at a time, so constant
+  columns are known before the full dataset is loaded.
+
+  Attributes:
+  -----------
+  values: dict
+    column -> single value seen so far (NaN if none), for the columns that
+    are still constant.
+
+  varying: set
+    Columns with at least two different values.
+
+  Examples:
+  ---------
+  >>> detector = ConstantColumns ()
+  >>> for chunk in pd.read_csv ('IoT-File_1.csv', chunksize = 100000):
+  ...   detector.update (chunk)
+  >>> df = pd.read_csv ('IoT-File_1.csv', usecols = lambda column:
+  ...                   column not in detector.columns)
+  '''
+  def __init__ (self):
+    self.values = {}
+    self.varying = set ()
+
+  def update (self, chunk):
+    candidates = [column for column in chunk.columns
+                  if column not in self.varying]
+    for column, (constant, value) in _constant_values (
+                                     chunk [candidates]).items ():
+      seen = self.values.get (column, np.nan)
+      if ((not constant) or
+          ((not pd.isna (seen)) and (not pd.isna (value)) and (seen != value))):
+        self.varying.add (column)
+        self.values.pop (column, None)
+      elif (pd.isna (seen)):
+        self.values [column] = value
+    return self
+
+  @property
+  def columns (self):
+    return list (self.values)
 
 def remove_columns_with_one_value (df, verbose = True):
   '''
@@ -108,29 +386,17 @@ def remove_columns_with_one_value (df, verbose = True):
 
   Examples:
   ---------
-  >>> df, log = remove_nan_columns (df, verbose = False)
+  >>> df, log = remove_columns_with_one_value (df, verbose = False)
   '''
   nColumns = len (df.columns)
-  nUniques = []
-  if (verbose):
-    print ('\nColumn | # of different values (before dropping).')
-  for column in df.columns:
-    nUnique = df [column].nunique ()
-    nUniques.append (nUnique)
-    if (verbose):
-      print (column, '|', nUnique)
-
+  detector = ConstantColumns ().update (df)
   if (verbose):
     print ('\nRemoving attributes that have only one (or zero) sampled value.')
-  for column, nUnique in zip (df.columns, nUniques):
-    if (nUnique <= 1):
-      df.drop (axis = 'columns', columns = column, inplace = True)
-
-  if (verbose):
-    print ('\nColumn | # of different values (after dropping).')
-    for column in df.columns:
-      nUnique = df [column].nunique ()
-      print (column, '|', nUnique)
+    print ('Column | value')
+    for column in detector.columns:
+      print (column, '|', detector.values [column])
+  ### K: A single drop, instead of one (copying) drop per column.
+  df.drop (axis = 'columns', columns = detector.columns, inplace = True)
 
   log = 'While removing single value columns: '
   if ((len (df.columns)) == nColumns):
@@ -140,6 +406,53 @@ def remove_columns_with_one_value (df, verbose = True):
 
   return df, log
 
+class NullCounter:
+  '''
+  Counts the NaN values of each column. Works on a whole dataframe or
+  incrementally, one chunk (or file) at a time, so the columns with too many
+  NaN values are known before the dataset is loaded.
+
+  Attributes:
+  -----------
+  rows: int
+    Lines seen so far.
+
+  nulls: pandas.Series
+    column -> NaN values seen so far.
+
+  Examples:
+  ---------
+  >>> counter = NullCounter ()
+  >>> for chunk in pd.read_csv ('IoT-File_1.csv', chunksize = 100000):
+  ...   counter.update (chunk)
+  >>> df = pd.read_csv ('IoT-File_1.csv', usecols = counter.keep (1/2))
+  '''
+  def __init__ (self):
+    self.rows = 0
+    self.nulls = pd.Series (dtype = np.int64)
+
+  def update (self, chunk):
+    nulls = chunk.isna ().sum ()
+    order = list (self.nulls.index) + [column for column in nulls.index
+                                       if column not in self.nulls.index]
+    self.nulls = self.nulls.add (nulls, fill_value = 0).reindex (order)
+    self.nulls = self.nulls.astype (np.int64)
+    self.rows += len (chunk)
+    return self
+
+  def keep (self, threshold):
+    '''
+    Columns with at least rows // (1/threshold) non NaN values (the same rule
+    as dropna (thresh = ...) in remove_nan_columns).
+    '''
+    minimum = self.rows // (1/threshold)
+    return [column for column, nulls in self.nulls.items ()
+            if (self.rows - nulls >= minimum)]
+
+  def drop (self, threshold):
+    kept = set (self.keep (threshold))
+    return [column for column in self.nulls.index if column not in kept]
+
 def remove_nan_columns (df, threshold, verbose = True):
   '''
   Parameters:
@@ -147,6 +460,7 @@ def remove_nan_columns (df, threshold, verbose = True):
   df: pandas.DataFrame
 
   threshold: float
+    Keep the columns with at least this fraction of non NaN values.
 
   verbose: bool, default = True
 
@@ -161,18 +475,19 @@ def remove_nan_columns (df, threshold, verbose = True):
   >>> df, log = remove_nan_columns (df, 1/2, verbose = False)
   '''
   nColumns = len (df.columns)
+  counter = NullCounter ().update (df)
   if (verbose):
     print ('Removing attributes with more than half NaN values.')
     print ('\nColumn | NaN values')
-    print (df.isnull ().sum ())
+    print (counter.nulls)
 
-  threshold = 1/threshold
-  df = df.dropna (axis = 'columns', thresh = df.shape [0] // threshold)
+  df = df.drop (columns = counter.drop (threshold))
 
   if (verbose):
-    print ('Dataframe contains NaN values:', df.isnull ().values.any ())
+    nulls = counter.nulls [df.columns]
+    print ('Dataframe contains NaN values:', bool (nulls.any ()))
     print ('\nColumn | NaN values (after dropping columns)')
-    print (df.isnull ().sum ())
+    print (nulls)
 
   log = 'While removing nan value columns: '
   if ((len (df.columns)) == nColumns):
@@ -201,3 +516,580 @@ def display_feature_distribution (df, features):
     print ('Values:', df [feature].unique ())
     print ('Distribution:')
     print (df [feature].value_counts ())
+
+def stratified_subsample (y, size, state = 0):
+  '''
+  Parameters:
+  -----------
+  y: numpy.ndarray
+    Labels.
+
+  size: int or float
+    Number of rows to keep (or fraction of the rows if < 1). Every class keeps
+    the same fraction of its rows, and at least one.
+
+  state: int, default = 0
+
+  Returns:
+  --------
+  indices: numpy.ndarray (int64)
+    Sorted row indices.
+
+  Examples:
+  ---------
+  >>> indices = stratified_subsample (y_train, 0.1)
+  '''
+  y = np.asarray (y).ravel ()
+  fraction = size if (size < 1) else min (1, size / len (y))
+  random = np.random.RandomState (state)
+  _, codes, counts = np.unique (y, return_inverse = True, return_counts = True)
+  order = np.argsort (codes.ravel (), kind = 'stable')
+  indices = []
+  for members in np.split (order, np.cumsum (counts) [:-1]):
+    size = max (1, int (round (fraction * len (members))))
+    indices.append (random.choice (members, size, replace = False))
+  return np.sort (np.concatenate (indices))
+
+def array_fingerprint (*arrays):
+  '''
+  Parameters:
+  -----------
+  arrays: numpy.ndarray
+
+  Returns:
+  --------
+  fingerprint: str
+    SHA-1 of the shapes, dtypes and contents of the arrays.
+
+  Examples:
+  ---------
+  >>> key = array_fingerprint (X_train, y_train)
+  '''
+  my_hash = hashlib.sha1 ()
+  for values in arrays:
+    values = np.ascontiguousarray (values)
+    my_hash.update ('{}:{}'.format (values.shape, values.dtype).encode ())
+    my_hash.update (values.view (np.uint8).ravel ())
+  return my_hash.hexdigest ()
+
+def share_arrays (arrays):
+  '''
+  Parameters:
+  -----------
+  arrays: dict of numpy.ndarray
+    Numeric arrays (object arrays can not be shared).
+
+  Returns:
+  --------
+  memories: list of multiprocessing.shared_memory.SharedMemory
+    Keep them while the arrays are in use, then close and unlink them.
+
+  descriptors: dict
+    name -> (shared memory name, shape, dtype), for attach_arrays.
+
+  Examples:
+  ---------
+  >>> memories, descriptors = share_arrays ({'X': X, 'y': y})
+  '''
+  memories = []
+  descriptors = {}
+  for name, values in arrays.items ():
+    values = np.asarray (values)
+    if (values.dtype.hasobject):
+      raise ValueError ('Can not share object array: ' + name)
+    memory = shared_memory.SharedMemory (create = True,
+                                         size = max (values.nbytes, 1))
+    np.ndarray (values.shape, dtype = values.dtype,
+                buffer = memory.buf) [...] = values
+    memories.append (memory)
+    descriptors [name] = (memory.name, values.shape, values.dtype.str)
+  return memories, descriptors
+
+_SHARED_ARRAYS = {}
+
+def attach_arrays (descriptors):
+  '''
+  Parameters:
+  -----------
+  descriptors: dict
+    Returned by share_arrays.
+
+  Returns:
+  --------
+  arrays: dict of numpy.ndarray
+    Read-only views of the shared memory, nothing is copied. Also kept in
+    _SHARED_ARRAYS for the process pool workers.
+  '''
+  arrays = {}
+  for name, (memory_name, shape, dtype) in descriptors.items ():
+    memory = shared_memory.SharedMemory (name = memory_name)
+    values = np.ndarray (shape, dtype = dtype, buffer = memory.buf)
+    values.flags.writeable = False
+    arrays [name] = values
+    _SHARED_ARRAYS [name] = (memory, values)
+  return arrays
+
+def memmap_arrays (arrays, directory):
+  '''
+  Parameters:
+  -----------
+  arrays: dict of numpy.ndarray
+    Numeric arrays (object arrays can not be mapped).
+
+  directory: str
+    Where the .npy files are written, named by array_fingerprint (an array
+    that is already there is not written again).
+
+  Returns:
+  --------
+  mapped: dict of numpy.memmap
+    Read-only. joblib sends a memmap to its workers as a reference to the
+    file (not the data), each worker maps the same pages.
+
+  Examples:
+  ---------
+  >>> mapped = memmap_arrays ({'X': X_train, 'y': y_train}, 'cache/memmap/')
+  '''
+  os.makedirs (directory, exist_ok = True)
+  mapped = {}
+  for name, values in arrays.items ():
+    values = np.ascontiguousarray (values)
+    if (values.dtype.hasobject):
+      raise ValueError ('Can not map object array: ' + name)
+    file_name = os.path.join (directory,
+                              array_fingerprint (values) [:16] + '.npy')
+    if (not os.path.isfile (file_name)):
+      with open (file_name + '.tmp', 'wb') as f:
+        np.save (f, values)
+      os.replace (file_name + '.tmp', file_name)
+    mapped [name] = np.load (file_name, mmap_mode = 'r')
+  return mapped
+
+def memmap_search (search, X, y, directory = None, verbose = True,
+                   **fit_params):
+  '''
+  Fits a GridSearchCV (or any search with n_jobs) on a memmapped copy of X
+  and y. Each task receives the file reference and its fold indices, instead
+  of a pickled copy of the whole training set, so the cost of starting the
+  tasks does not grow with the dataset times the grid.
+
+  Parameters:
+  -----------
+  search: sklearn.model_selection.GridSearchCV
+    Or RandomizedSearchCV, HalvingGridSearchCV... any search with fit (X, y).
+
+  X: pandas.DataFrame or numpy.ndarray
+    Converted to float64, column names are lost: a ColumnTransformer in the
+    pipeline must select its columns by position.
+
+  y: pandas.Series or numpy.ndarray
+
+  directory: str, default = None
+    Where the arrays are mapped (reused by later searches on the same
+    arrays). Defaults to a temporary directory, removed after the fit.
+
+  verbose: bool, default = True
+
+  fit_params:
+    Passed to search.fit.
+
+  Returns:
+  --------
+  search: fitted search
+
+  Examples:
+  ---------
+  >>> grid = GridSearchCV (estimator = clf, param_grid = param_grid,
+  ...                      scoring = 'f1', n_jobs = -1, cv = cv)
+  >>> grid_result = memmap_search (grid, X_train_df, y_train_df)
+  '''
+  if (isinstance (X, pd.DataFrame)):
+    X = X.to_numpy (dtype = np.float64)
+  if (isinstance (y, (pd.Series, pd.DataFrame))):
+    y = y.to_numpy ()
+  temporary = directory is None
+  if (temporary):
+    directory = tempfile.mkdtemp (prefix = 'search_')
+  try:
+    startTime = time.time ()
+    mapped = memmap_arrays ({'X': X, 'y': y}, directory)
+    if (verbose):
+      print (str (time.time () - startTime), 's to map',
+             X.shape, 'to', directory)
+    search.fit (mapped ['X'], mapped ['y'], **fit_params)
+    del mapped
+  finally:
+    if (temporary):
+      shutil.rmtree (directory, ignore_errors = True)
+  return search
+
+@contextlib.contextmanager
+def fold_cache (directory = None, verbose = 0):
+  '''
+  Cache for the transformer steps of a Pipeline (Pipeline (memory = ...))
+  during a search. The fitted transformers and their outputs are keyed by
+  their parameters and by the rows they are fitted on (the fold), so the
+  preprocessing of a fold is computed once and reused by every classifier
+  configuration that shares the same upstream parameters.
+
+  Parameters:
+  -----------
+  directory: str, default = None
+    Where joblib keeps the cache (it is kept after the search). Defaults to
+    a temporary directory, removed on exit.
+
+  verbose: int, default = 0
+    Passed to joblib.Memory.
+
+  Returns:
+  --------
+  memory: joblib.Memory
+
+  Examples:
+  ---------
+  >>> with fold_cache () as memory:
+  ...   clf.set_params (memory = memory)
+  ...   grid_result = memmap_search (grid, X_train_df, y_train_df)
+  '''
+  temporary = directory is None
+  if (temporary):
+    directory = tempfile.mkdtemp (prefix = 'pipeline_')
+  try:
+    yield Memory (directory, verbose = verbose)
+  finally:
+    if (temporary):
+      shutil.rmtree (directory, ignore_errors = True)
+
+def halving_budgets (min_budget, max_budget, factor = 3):
+  '''
+  Parameters:
+  -----------
+  min_budget, max_budget: int
+    Smallest budget of the first rung and budget of the last rung (rows,
+    epochs...).
+
+  factor: int, default = 3
+
+  Returns:
+  --------
+  budgets: list of int
+    Increasing budgets, one per rung, max_budget divided by powers of factor.
+
+  Examples:
+  ---------
+  >>> halving_budgets (8, 200)
+  [22, 67, 200]
+  '''
+  rungs = int (math.floor (math.log (max_budget / min_budget, factor) + 1e-9))
+  return [max (1, int (round (max_budget / factor ** rung)))
+          for rung in range (rungs, -1, -1)]
+
+def successive_halving (evaluate, candidates, min_budget, max_budget,
+                        factor = 3, verbose = True):
+  '''
+  Successive halving: every candidate is evaluated with the smallest budget,
+  only the best 1/factor move to the next rung (factor times the budget),
+  until the survivors get max_budget. Most candidates are dropped after a
+  fraction of the data or of the epochs.
+
+  Parameters:
+  -----------
+  evaluate: callable
+    evaluate (index, params, budget) -> score (higher is better). index
+    identifies the candidate across rungs. SubsampleEvaluator (sklearn
+    estimators, budget = rows) and TrialScheduler (Keras model factories,
+    budget = epochs). If it has a prune (indices) method, it is called with
+    the survivors of each rung. If it has a map (trials) method, a whole
+    rung is handed to it at once (TrialScheduler runs it in parallel).
+
+  candidates: dict or list of dict
+    A param_grid (as in GridSearchCV) or the list of parameters to try.
+
+  min_budget, max_budget: int
+
+  factor: int, default = 3
+
+  verbose: bool, default = True
+
+  Returns:
+  --------
+  result: dict
+    best_params, best_score and history (one (rung, budget, params, score)
+    per evaluation).
+
+  Examples:
+  ---------
+  >>> evaluate = SubsampleEvaluator (clf, X_train_df, y_train_df, cv = cv)
+  >>> result = successive_halving (evaluate, param_grid,
+  ...                              len (X_train_df) // 27, len (X_train_df))
+  >>> print (result ['best_params'])
+  '''
+  if (isinstance (candidates, dict)):
+    candidates = list (ParameterGrid (candidates))
+  candidates = list (candidates)
+  survivors = list (range (len (candidates)))
+  history = []
+  budgets = halving_budgets (min_budget, max_budget, factor)
+  startTime = time.time ()
+  for rung, budget in enumerate (budgets):
+    if (hasattr (evaluate, 'map')):
+      results = evaluate.map ([(index, candidates [index], budget)
+                               for index in survivors])
+    else:
+      results = ((index, evaluate (index, candidates [index], budget))
+                 for index in survivors)
+    ### K: Printed as the evaluations finish.
+    scores = {}
+    for index, score in results:
+      scores [index] = score
+      history.append ((rung, budget, candidates [index], scores [index]))
+      if (verbose):
+        print ('Rung %d (budget %d): %f with: %r' % (rung, budget,
+               scores [index], candidates [index]))
+    ### K: NaN scores go last.
+    survivors = sorted (survivors, key = lambda index:
+                        -np.inf if np.isnan (scores [index])
+                        else scores [index], reverse = True)
+    if (rung < len (budgets) - 1):
+      survivors = survivors [:max (1, int (math.ceil (len (survivors) /
+                                                      factor)))]
+    if (hasattr (evaluate, 'prune')):
+      evaluate.prune (survivors)
+  best = survivors [0]
+  if (verbose):
+    print (str (time.time () - startTime), 's to search',
+           len (candidates), 'candidates.')
+  return {'best_params': candidates [best], 'best_score': scores [best],
+          'history': history}
+
+class SubsampleEvaluator:
+  '''
+  evaluate for successive_halving: cross validation score of a sklearn
+  estimator (a Pipeline) fitted on a stratified subsample of budget rows.
+
+  Parameters:
+  -----------
+  estimator: sklearn estimator
+    Cloned for each evaluation, candidates are set with set_params.
+
+  X, y: pandas or numpy
+
+  cv, scoring, n_jobs:
+    As in cross_val_score.
+
+  state: int, default = 0
+    Random state of the subsamples.
+
+  Examples:
+  ---------
+  >>> evaluate = SubsampleEvaluator (clf, X_train_df, y_train_df, cv = cv,
+  ...                                scoring = 'f1', n_jobs = -1)
+  '''
+  def __init__ (self, estimator, X, y, cv = 5, scoring = None, n_jobs = None,
+                state = 0):
+    self.estimator = estimator
+    self.X, self.y = X, y
+    self.cv, self.scoring, self.n_jobs = cv, scoring, n_jobs
+    self.state = state
+
+  def __call__ (self, index, params, budget):
+    X, y = self.X, self.y
+    if (budget < len (y)):
+      rows = stratified_subsample (np.asarray (y), budget, self.state)
+      X = X.iloc [rows] if hasattr (X, 'iloc') else X [rows]
+      y = y.iloc [rows] if hasattr (y, 'iloc') else y [rows]
+    estimator = clone (self.estimator).set_params (**params)
+    scores = cross_val_score (estimator, X, y, cv = self.cv,
+                              scoring = self.scoring, n_jobs = self.n_jobs)
+    return scores.mean ()
+
+def _keras_trial (model, data, batch_size, epochs, initial_epoch, score,
+                  verbose):
+  X_train, y_train, X_val, y_val = data
+  model.fit (X_train, y_train, batch_size = batch_size, epochs = epochs,
+             initial_epoch = initial_epoch, verbose = verbose)
+  if (score is None):
+    loss = model.evaluate (X_val, y_val, batch_size = batch_size, verbose = 0)
+    return -(loss [0] if isinstance (loss, list) else loss)
+  return score (y_val, model.predict (X_val, batch_size = batch_size))
+
+def _tensorflow_initialized ():
+  ### K: Importing TensorFlow is fine, running an operation (building or
+  ### fitting a model) starts its runtime, which a forked child inherits
+  ### half-working and with its thread pools already sized.
+  if ('tensorflow' not in sys.modules):
+    return False
+  from tensorflow.python.eager import context
+  return getattr (context.context (), '_context_handle', None) is not None
+
+def _init_trial_worker (descriptors, threads):
+  attach_arrays (descriptors)
+  ### K: TensorFlow fixes its thread pools at the first operation, so they
+  ### are set here, before the worker runs any trial. If they can not be
+  ### set, n_jobs trials would each use every CPU: fail instead.
+  import tensorflow as tf
+  tf.config.threading.set_intra_op_parallelism_threads (threads)
+  tf.config.threading.set_inter_op_parallelism_threads (min (2, threads))
+
+def _run_trial (create_model, names, index, params, epochs, initial_epoch,
+                checkpoint, score, verbose):
+  import tensorflow as tf
+  tf.keras.backend.clear_session ()
+  startTime = time.time ()
+  params = dict (params)
+  batch_size = params.pop ('batch_size', None)
+  params.pop ('epochs', None)
+  data = [_SHARED_ARRAYS [name] [1] for name in names]
+  ### K: A survivor resumes from the model saved at the end of its last rung
+  ### (weights and optimizer state), in whichever worker it lands.
+  if (initial_epoch > 0):
+    model = tf.keras.models.load_model (checkpoint)
+  else:
+    model = create_model (**params)
+  result = _keras_trial (model, data, batch_size, epochs, initial_epoch,
+                         score, verbose)
+  if (checkpoint is not None):
+    model.save (checkpoint)
+  return index, result, time.time () - startTime
+
+class TrialScheduler:
+  '''
+  Runs Keras trials (one model per candidate) in n_jobs processes at the
+  same time. Train and validation sets are shared (share_arrays), each
+  process gets cpu_count / n_jobs TensorFlow threads, and results are
+  yielded as the trials finish. Use it as a context manager (the processes
+  and the shared memory are released on exit).
+
+  Under successive_halving (map), each model is saved in a temporary
+  directory at the end of its rung, so the survivors resume training from
+  the epoch they stopped at.
+
+  Workers are forked: start it before this process runs any TensorFlow
+  operation (building or fitting a model), create_model and score must be
+  module level functions. Importing keras or tensorflow first is fine,
+  __enter__ raises a RuntimeError if the runtime is already running.
+
+  Parameters:
+  -----------
+  create_model: callable
+    create_model (**params) returns a compiled model (batch_size and epochs
+    are not passed to it).
+
+  X_train, y_train, X_val, y_val: numpy.ndarray
+    For an autoencoder, y_train = X_train and y_val = X_val (shared once).
+
+  n_jobs: int, default = -1
+    Concurrent trials. -1 means one per CPU.
+
+  score: callable, default = None
+    score (y_val, y_pred), higher is better. Defaults to minus the
+    validation loss.
+
+  verbose: int, default = 0
+    Passed to model.fit.
+
+  Examples:
+  ---------
+  >>> with TrialScheduler (create_model, X_train, X_train, X_val, X_val,
+  ...                      n_jobs = 4) as scheduler:
+  ...   for params, score, seconds in scheduler.run (param_grid, epochs = 10):
+  ...     print ('%f with: %r' % (score, params))
+  >>> with TrialScheduler (...) as scheduler:
+  ...   result = successive_halving (scheduler, param_grid, 2, 200)
+  '''
+  def __init__ (self, create_model, X_train, y_train, X_val, y_val,
+                n_jobs = -1, score = None, verbose = 0):
+    self.create_model = create_model
+    self.arrays = [X_train, y_train, X_val, y_val]
+    self.n_jobs = os.cpu_count () if (n_jobs == -1) else n_jobs
+    self.score = score
+    self.verbose = verbose
+    self.executor = None
+
+  def __enter__ (self):
+    if (_tensorflow_initialized ()):
+      raise RuntimeError ('TensorFlow already ran an operation in this '
+                          'process, start the TrialScheduler before '
+                          'building or fitting any model.')
+    ### K: An array passed twice (autoencoder targets) is shared once.
+    arrays, self.names = {}, []
+    for role, values in zip (['X_train', 'y_train', 'X_val', 'y_val'],
+                             self.arrays):
+      name = next ((name for name, shared in arrays.items ()
+                    if shared is values), role)
+      arrays [name] = values
+      self.names.append (name)
+    self.memories, descriptors = share_arrays (arrays)
+    self.checkpoints = tempfile.mkdtemp (prefix = 'trials_')
+    self.epochs = {}
+    threads = max (1, os.cpu_count () // self.n_jobs)
+    self.executor = ProcessPoolExecutor (
+                    max_workers = self.n_jobs,
+                    mp_context = multiprocessing.get_context ('fork'),
+                    initializer = _init_trial_worker,
+                    initargs = (descriptors, threads))
+    return self
+
+  def __exit__ (self, *exception):
+    self.executor.shutdown (cancel_futures = True)
+    self.executor = None
+    for memory in self.memories:
+      memory.close ()
+      memory.unlink ()
+    shutil.rmtree (self.checkpoints, ignore_errors = True)
+
+  def _checkpoint (self, index):
+    return os.path.join (self.checkpoints, '{}.keras'.format (index))
+
+  def _stream (self, trials):
+    futures = [self.executor.submit (_run_trial, self.create_model,
+                                     self.names, index, params, epochs,
+                                     initial_epoch, checkpoint, self.score,
+                                     self.verbose)
+               for index, params, epochs, initial_epoch, checkpoint
+               in trials]
+    for future in as_completed (futures):
+      yield future.result ()
+
+  def run (self, candidates, epochs):
+    '''
+    Parameters:
+    -----------
+    candidates: dict or list of dict
+      A param_grid or the list of parameters to try.
+
+    epochs: int
+
+    Returns:
+    --------
+    results: generator of (params, score, seconds)
+      In the order the trials finish.
+    '''
+    if (isinstance (candidates, dict)):
+      candidates = list (ParameterGrid (candidates))
+    candidates = list (candidates)
+    for index, score, seconds in self._stream (
+                               [(index, params, epochs, 0, None)
+                                for index, params in enumerate (candidates)]):
+      yield candidates [index], score, seconds
+
+  def map (self, trials):
+    ### K: Used by successive_halving to run a whole rung at once, yields
+    ### (index, score) as the trials finish. Survivors resume from their
+    ### checkpoint, a rung only pays for its extra epochs.
+    budgets = {index: epochs for index, _, epochs in trials}
+    trials = [(index, params, epochs, self.epochs.get (index, 0),
+               self._checkpoint (index)) for index, params, epochs in trials]
+    for index, score, _ in self._stream (trials):
+      self.epochs [index] = budgets [index]
+      yield index, score
+
+  def prune (self, survivors):
+    ### K: Checkpoints of dropped candidates are removed.
+    for index in list (self.epochs):
+      if (index not in survivors):
+        del self.epochs [index]
+        os.remove (self._checkpoint (index))
+
+  def __call__ (self, index, params, budget):
+    return dict (self.map ([(index, params, budget)])) [index]
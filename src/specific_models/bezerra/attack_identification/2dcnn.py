@@ -32,7 +32,7 @@ except:
   pass
 print ("STATE = ", state)
 
-df = load_dataset ()
+df = load_dataset (n_jobs = -1, use_cache = True)
 print ("Data Loaded")
 remove_columns_with_one_value (df, verbose = False)
 remove_nan_columns (df, 0.6, verbose = False)
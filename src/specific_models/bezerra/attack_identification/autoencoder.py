@@ -16,6 +16,7 @@ import numpy as np
 from numpy import mean, std
 from unit import remove_columns_with_one_value, remove_nan_columns, load_dataset
 from unit import display_general_information, display_feature_distribution
+from unit import binned_mutual_info, rank_features
 from collections import Counter
 from sklearn.impute import SimpleImputer
 from sklearn.svm import SVC, LinearSVC
@@ -34,6 +35,7 @@ from sklearn.model_selection import cross_val_score
 from sklearn.decomposition import PCA
 from sklearn.feature_selection import SelectKBest
 from sklearn.feature_selection import f_classif, chi2, mutual_info_classif
+from functools import partial
 from sklearn.utils import class_weight
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
@@ -70,7 +72,7 @@ print ('STATE:', STATE)
 ####################################################################
 
 
-df = load_dataset ()
+df = load_dataset (n_jobs = -1, use_cache = True)
 print ("Data Loaded")
 remove_columns_with_one_value (df, verbose = False)
 remove_nan_columns (df, 0.6, verbose = False)
@@ -208,8 +210,11 @@ recycled
 NUMBER_OF_FEATURES = 4
 print ('Selecting top', NUMBER_OF_FEATURES, 'features.')
 startTime = time.time ()
-#fs = SelectKBest (score_func = mutual_info_classif, k = NUMBER_OF_FEATURES)
-### K: ~30 minutes to FAIL fit mutual_info_classif to 5% bot-iot
+#fs = SelectKBest (score_func = partial (binned_mutual_info, n_jobs = -1),
+#                  k = NUMBER_OF_FEATURES)
+### K: ~30 minutes to FAIL fit mutual_info_classif to 5% bot-iot, the
+### binned estimate (contingency tables, one thread per feature) takes
+### seconds. Use subsample = ... to score a stratified subsample.
 #fs = SelectKBest (score_func = chi2, k = NUMBER_OF_FEATURES) # X must be >= 0
 ### K: ~4 seconds to fit chi2 to 5% bot-iot (MinMaxScaler (0, 1))
 fs = SelectKBest (score_func = f_classif, k = NUMBER_OF_FEATURES)
@@ -225,12 +230,8 @@ print ('X_val shape:', X_val.shape)
 print ('y_val shape:', y_val.shape)
 print ('X_test shape:', X_test.shape)
 print ('y_test shape:', y_test.shape)
-bestFeatures = []
-for feature in range (len (fs.scores_)):
-  bestFeatures.append ({'f': feature, 's': fs.scores_ [feature]})
-  bestFeatures = sorted (bestFeatures, key = lambda k: k ['s'])
-for feature in bestFeatures:
-  print ('Feature %d: %f' % (feature ['f'], feature ['s']))
+for feature, score in rank_features (fs.scores_):
+  print ('Feature %d: %f' % (feature, score))
 '''
 
 ##############################################################################
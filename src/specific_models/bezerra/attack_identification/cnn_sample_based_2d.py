@@ -29,7 +29,7 @@ NETFLOW_DIRS = ['MC/NetFlow/', 'SC/NetFlow/', 'ST/NetFlow/']
 # MC_L: Has legitimate data, no infection
 
 
-df = load_dataset ()
+df = load_dataset (n_jobs = -1, use_cache = True)
 print ("Data Loaded")
 
 #making the final DataFrame
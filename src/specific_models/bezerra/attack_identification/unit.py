@@ -2,109 +2,674 @@
 # github.com/kaylani2
 # kaylani AT gta DOT ufrj DOT br
 
+import io
+import os
+import math
+import json
+import time
+import shutil
+import fnmatch
+import hashlib
+import tempfile
+import contextlib
+import multiprocessing
 import pandas as pd
 import numpy as np
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-def load_dataset (verbose = False):
+BEZERRA_DIRECTORY = '../../../../datasets/Dataset-IoT/'
+CACHE_DIRECTORY = BEZERRA_DIRECTORY + 'cache/'
+### K: Bump when load_dataset changes, so old cache entries are not reused.
+CACHE_VERSION = 2
+# MC: Multimedia Centre, SC: Surveillance Camera, ST: Surveillance Camera with
+# additional traffic.
+# MC_I_FIRST: Has infected data by Hajime, Aidra and BashLite botnets'
+# MC_I_SECOND: Has infected data from Mirai botnets
+# MC_I_THIR: Has infected data from Mirai, Doflo, Tsunami and Wroba botnets
+# MC_L: Has legitimate data, no infection
+ENVIRONMENTS = ['MC', 'SC', 'ST']
+NETFLOW_FILES = [environment + suffix for environment in ENVIRONMENTS
+                 for suffix in ['_I1', '_I2', '_I3', '_L']]
+
+def memory_report (before, after):
   '''
   Parameters:
   -----------
+  before: pandas.Series
+    df.memory_usage (deep = True) before compacting.
+
+  after: pandas.Series
+    df.memory_usage (deep = True) after compacting.
+
+  Returns:
+  --------
+  NULL
+
+  Examples:
+  ---------
+  >>> memory_report (before, df.memory_usage (deep = True))
+  '''
+  print ('\nColumn | MB (before) | MB (after)')
+  for column in before.index:
+    print ('{:35s} {:12.2f} {:12.2f}'.format (str (column),
+           before [column] / 2**20, after.get (column, 0) / 2**20))
+  print ('{:35s} {:12.2f} {:12.2f}\n'.format ('Total', before.sum () / 2**20,
+         after.sum () / 2**20))
+
+def compact_dataset (df, category_ratio = 1/2, verbose = True):
+  '''
+  Parameters:
+  -----------
+  df: pandas.DataFrame
+
+  category_ratio: float, default = 1/2
+    Object columns with fewer distinct values than category_ratio times the
+    number of lines are stored as categoricals.
+
   verbose: bool, default = True
+    Print the memory used by each column before and after.
 
   Returns:
   --------
   df: pandas.DataFrame
+    Floats downcast to float32 only when every value survives the round trip
+    (epoch timestamps such as stime/ltime stay float64), integers to the
+    smallest signed type that holds their range.
 
   Examples:
   ---------
-  >>> df = load_dataset (verbose = True)
+  >>> df = compact_dataset (df)
+  '''
+  if (verbose):
+    before = df.memory_usage (deep = True)
+  for column in df.columns:
+    values = df [column]
+    if (pd.api.types.is_float_dtype (values.dtype)):
+      if (values.dtype != np.float32):
+        compact_values = values.astype (np.float32)
+        if (((compact_values == values) | values.isna ()).all ()):
+          df [column] = compact_values
+    elif (pd.api.types.is_integer_dtype (values.dtype)):
+      df [column] = pd.to_numeric (values, downcast = 'integer')
+    elif ((pd.api.types.is_object_dtype (values.dtype)) or
+          (isinstance (values.dtype, pd.StringDtype))):
+      if (values.nunique () < category_ratio * len (values)):
+        df [column] = values.astype ('category')
+  if (verbose):
+    memory_report (before, df.memory_usage (deep = True))
+  return df
+
+def hash_files (file_names, cache_directory = None):
+  '''
+  Parameters:
+  -----------
+  file_names: list of str
+
+  cache_directory: str, default = None
+    If given, file digests are remembered (by path, size and modification
+    time) in cache_directory/digests.json, so files are only hashed once.
+
+  Returns:
+  --------
+  digest: str
+    SHA-1 of the names, sizes and contents of the files.
+
+  Examples:
+  ---------
+  >>> digest = hash_files (['IoT-File_1.csv', 'IoT-File_2.csv'])
+  '''
+  known = {}
+  digests_file = None
+  if (cache_directory is not None):
+    digests_file = os.path.join (cache_directory, 'digests.json')
+    if (os.path.isfile (digests_file)):
+      with open (digests_file) as f:
+        known = json.load (f)
+
+  my_hash = hashlib.sha1 ()
+  for file_name in file_names:
+    stat = os.stat (file_name)
+    stamp = '{}:{}:{}'.format (os.path.abspath (file_name), stat.st_size,
+                               stat.st_mtime_ns)
+    if (stamp not in known):
+      file_hash = hashlib.sha1 ()
+      with open (file_name, 'rb') as f:
+        for block in iter (lambda: f.read (2**20), b''):
+          file_hash.update (block)
+      known [stamp] = file_hash.hexdigest ()
+    my_hash.update ('{}:{}:{}'.format (os.path.basename (file_name),
+                                       stat.st_size, known [stamp]).encode ())
+
+  if (digests_file is not None):
+    os.makedirs (cache_directory, exist_ok = True)
+    ### K: Written aside and renamed, a concurrent run never reads half a file.
+    temporary = '{}.{}.tmp'.format (digests_file, os.getpid ())
+    with open (temporary, 'w') as f:
+      json.dump (known, f, indent = 1)
+    os.replace (temporary, digests_file)
+  return my_hash.hexdigest ()
+
+def publish_directory (temporary, directory):
   '''
+  Parameters:
+  -----------
+  temporary: str
+    Complete entry, written aside.
 
-  DATASET_DIR = '../../../../datasets/Dataset-IoT/'
-  NETFLOW_DIRS = ['MC/NetFlow/', 'SC/NetFlow/', 'ST/NetFlow/']
+  directory: str
+    Final name. An incomplete entry (no meta.json) is replaced. If another
+    run published a complete one first, it is kept and temporary is removed.
 
-  # MC_I_FIRST: Has infected data by Hajime, Aidra and BashLite botnets'
-  # MC_I_SECOND: Has infected data from Mirai botnets
-  # MC_I_THIR: Has infected data from Mirai, Doflo, Tsunami and Wroba botnets
-  # MC_L: Has legitimate data, no infection
+  Returns:
+  --------
+  NULL
+  '''
+  if (not os.path.isfile (os.path.join (directory, 'meta.json'))):
+    shutil.rmtree (directory, ignore_errors = True)
+  try:
+    os.replace (temporary, directory)
+  except OSError:
+    shutil.rmtree (temporary, ignore_errors = True)
 
-  path_types = ['MC', 'SC', 'ST']
-  data_set_files = [[r'MC_I{}.csv'.format (index) for index in range (1, 4)],
-                   [r'SC_I{}.csv'.format (index) for index in range (1, 4)],
-                   [r'ST_I{}.csv'.format (index) for index in range (1, 4)] ]
+def save_columnar (df, directory):
+  '''
+  Parameters:
+  -----------
+  df: pandas.DataFrame
 
-  for path, files in zip (path_types, data_set_files):
-    files.append (path + '_L.csv')
+  directory: str
+    One .npy file per column (and one for the index) plus meta.json.
+    Categorical and object columns are stored as integer codes (object
+    columns are restored as object by load_columnar).
 
-  print ("Caminhos construidos")
-  ################
-  ##reading data##
-  ################
+  Returns:
+  --------
+  NULL
 
-  for n, (path, files) in enumerate (zip (NETFLOW_DIRS, data_set_files), start = 1):
-    for csvFile in files:
-        if n == 1:
-            df = pd.read_csv (DATASET_DIR + path + csvFile)
-        else:
-            aux_df = pd.read_csv (DATASET_DIR + path + csvFile)
-            df = pd.concat ( [df, aux_df], ignore_index = True)
+  Examples:
+  ---------
+  >>> save_columnar (df, 'cache/0a1b2c')
+  '''
+  ### K: Unique temporary directory, runs started at the same time (other
+  ### seeds) may be writing the same entry.
+  parent = os.path.dirname (os.path.abspath (directory))
+  os.makedirs (parent, exist_ok = True)
+  temporary = tempfile.mkdtemp (dir = parent,
+                                prefix = os.path.basename (directory) + '.tmp')
+  meta = {'index': df.index.name, 'shape': list (df.shape), 'columns': []}
+  np.save (os.path.join (temporary, 'index.npy'), df.index.to_numpy ())
+  for number, column in enumerate (df.columns):
+    values = df [column]
+    entry = {'name': column, 'file': '{}.npy'.format (number)}
+    if ((pd.api.types.is_object_dtype (values.dtype)) or
+        (isinstance (values.dtype, pd.StringDtype))):
+      entry ['object'] = True
+      values = values.astype ('category')
+    if (isinstance (values.dtype, pd.CategoricalDtype)):
+      entry ['categories'] = [str (category)
+                              for category in values.cat.categories]
+      values = values.cat.codes
+    np.save (os.path.join (temporary, entry ['file']), values.to_numpy ())
+    meta ['columns'].append (entry)
+  with open (os.path.join (temporary, 'meta.json'), 'w') as f:
+    json.dump (meta, f, indent = 1)
+  publish_directory (temporary, directory)
 
+def load_columnar (directory, mmap_mode = None):
+  '''
+  Parameters:
+  -----------
+  directory: str
+    Written by save_columnar.
+
+  mmap_mode: str, default = None
+    Passed to numpy.load ('r' maps the columns instead of reading them).
+
+  Returns:
+  --------
+  df: pandas.DataFrame
+
+  Examples:
+  ---------
+  >>> df = load_columnar ('cache/0a1b2c')
+  '''
+  with open (os.path.join (directory, 'meta.json')) as f:
+    meta = json.load (f)
+  data = {}
+  for entry in meta ['columns']:
+    values = np.load (os.path.join (directory, entry ['file']),
+                      mmap_mode = mmap_mode)
+    if ('categories' in entry):
+      values = pd.Categorical.from_codes (values, entry ['categories'])
+      if (entry.get ('object')):
+        values = np.asarray (values, dtype = object)
+    data [entry ['name']] = values
+  index = pd.Index (np.load (os.path.join (directory, 'index.npy')),
+                    name = meta ['index'])
+  return pd.DataFrame (data, index = index, copy = False)
+
+def _read_netflow (file_name):
+  '''
+  Parameters:
+  -----------
+  file_name: str
+
+  Returns:
+  --------
+  df: pandas.DataFrame
+
+  Examples:
+  ---------
+  >>> df = _read_netflow ('MC/NetFlow/MC_L.csv')
+  '''
+  return pd.read_csv (file_name, low_memory = False)
+
+def _fork_context ():
+  ### K: The scripts call the loaders at module level, without a __main__
+  ### guard, so spawned (or forkserver) workers would run the whole script
+  ### again. Where fork is not available the files are read in this process.
+  if ('fork' in multiprocessing.get_all_start_methods ()):
+    return multiprocessing.get_context ('fork')
+  return None
+
+def load_dataset (verbose = False, compact = False, files = None, n_jobs = 1,
+                  use_cache = False, cache_directory = CACHE_DIRECTORY):
+  '''
+  Parameters:
+  -----------
+  verbose: bool, default = True
+
+  compact: bool, default = False
+    Downcast the loaded frame with compact_dataset.
+
+  files: list of str, default = None
+    Subset of NETFLOW_FILES to load, shell patterns are accepted (like
+    ['MC_L', 'MC_I*']). None loads all 12 files.
+
+  n_jobs: int, default = 1
+    Number of processes used to parse the files. -1 means one process per
+    CPU. The files are concatenated once, after all of them have been read.
+    Forked processes only, the files are read one by one where fork is not
+    available (Windows).
+
+  use_cache: bool, default = False
+    Store the parsed frame in cache_directory (keyed by the contents of the
+    files and the parameters above) and reuse it on the next runs.
+
+  cache_directory: str, default = CACHE_DIRECTORY
+
+  Returns:
+  --------
+  df: pandas.DataFrame
+
+  Examples:
+  ---------
+  >>> df = load_dataset (verbose = True)
+  >>> df = load_dataset (compact = True)
+  >>> df = load_dataset (files = ['MC_L', 'MC_I*'], n_jobs = -1, use_cache = True)
+  '''
+  if (files is None):
+    files = NETFLOW_FILES
+  selected = [name for name in NETFLOW_FILES
+              if any (fnmatch.fnmatch (name, pattern) for pattern in files)]
+  if (not selected):
+    raise ValueError ('No NetFlow file matches ' + str (files))
+  file_names = [BEZERRA_DIRECTORY + name [:2] + '/NetFlow/' + name + '.csv'
+                for name in selected]
+  if (verbose):
+    print ('Files:', selected)
+
+  if (use_cache):
+    parameters = json.dumps ({'version': CACHE_VERSION, 'files': selected,
+                              'compact': compact}, sort_keys = True)
+    my_hash = hashlib.sha1 (hash_files (file_names, cache_directory).encode ())
+    my_hash.update (parameters.encode ())
+    directory = os.path.join (cache_directory, my_hash.hexdigest ())
+    if (os.path.isfile (os.path.join (directory, 'meta.json'))):
+      if (verbose):
+        print ('Loading dataset from cache:', directory)
+      return load_columnar (directory)
+
+  if (n_jobs == -1):
+    n_jobs = os.cpu_count ()
+  context = _fork_context ()
+  if (context is None):
+    n_jobs = 1
+  n_jobs = max (1, min (n_jobs, len (file_names)))
+  if (n_jobs == 1):
+    frames = [_read_netflow (file_name) for file_name in file_names]
+  else:
+    with ProcessPoolExecutor (max_workers = n_jobs,
+                              mp_context = context) as executor:
+      frames = list (executor.map (_read_netflow, file_names))
+  df = pd.concat (frames, ignore_index = True)
+  del frames
+
+  if (compact):
+    df = compact_dataset (df, verbose = verbose)
+  if (use_cache):
+    save_columnar (df, directory)
+    if (verbose):
+      print ('Dataset cached at:', directory)
   return df
 
 
-def display_general_information (df, verbose = True):
+def _hyperloglog (hashes, precision = 14):
+  '''
+  Parameters:
+  -----------
+  hashes: numpy.ndarray (uint64)
+    64 bit hashes of the values (pd.util.hash_pandas_object).
+
+  precision: int, default = 14
+    2**precision registers, ~1.04 / sqrt (2**precision) relative error
+    (0.8% for 14).
+
+  Returns:
+  --------
+  registers: numpy.ndarray (uint8)
+    HyperLogLog sketch. Sketches of different chunks are merged with
+    np.maximum.
+
+  Examples:
+  ---------
+  >>> registers = _hyperloglog (pd.util.hash_pandas_object (
+  ...                           df ['proto'], index = False).values)
+  '''
+  registers = np.zeros (1 << precision, dtype = np.uint8)
+  if (hashes.size == 0):
+    return registers
+  index = (hashes >> np.uint64 (64 - precision)).astype (np.intp)
+  ### K: The guard bit bounds the rank when the remaining bits are all zero.
+  rest = ((hashes << np.uint64 (precision)) |
+          np.uint64 (1 << (precision - 1)))
+  bit_length = np.frexp (rest.astype (np.float64)) [1]
+  rank = (65 - bit_length).astype (np.uint8)
+  np.maximum.at (registers, index, rank)
+  return registers
+
+def _hyperloglog_count (registers):
+  '''
+  Parameters:
+  -----------
+  registers: numpy.ndarray (uint8)
+    Output of _hyperloglog.
+
+  Returns:
+  --------
+  count: int
+    Estimated number of different values (linear counting for small
+    cardinalities).
+
+  Examples:
+  ---------
+  >>> _hyperloglog_count (registers)
+  '''
+  m = registers.size
+  alpha = 0.7213 / (1 + 1.079 / m)
+  estimate = alpha * m * m / np.sum (np.ldexp (1.0, -registers.astype (int)))
+  zeros = np.count_nonzero (registers == 0)
+  if ((estimate <= 5 / 2 * m) and (zeros > 0)):
+    estimate = m * math.log (m / zeros)
+  return int (round (estimate))
+
+def dataset_fingerprint (df, sample_size = 10000):
+  '''
+  Parameters:
+  -----------
+  df: pandas.DataFrame
+
+  sample_size: int, default = 10000
+    Lines (evenly spaced, first and last included) hashed with the shape,
+    columns and types.
+
+  Returns:
+  --------
+  digest: str
+    Cheap identifier of the dataset, used to cache reports. It does not
+    read every line.
+
+  Examples:
+  ---------
+  >>> dataset_fingerprint (df)
+  '''
+  my_hash = hashlib.sha1 (json.dumps ([list (df.shape),
+                                       [str (column) for column in df.columns],
+                                       [str (dtype) for dtype in df.dtypes]]
+                                      ).encode ())
+  if (len (df) > 0):
+    lines = np.unique (np.linspace (0, len (df) - 1,
+                                    min (sample_size, len (df))).astype (int))
+    my_hash.update (pd.util.hash_pandas_object (df.iloc [lines],
+                                                index = True).values.tobytes ())
+  return my_hash.hexdigest ()
+
+def profile_dataset (df, sample = None, precision = 14, state = 0):
+  '''
+  Parameters:
+  -----------
+  df: pandas.DataFrame
+
+  sample: int or float, default = None
+    Quick mode: profile this many lines (or this fraction of the lines)
+    instead of the whole frame. Distinct counts are then those of the sample.
+
+  precision: int, default = 14
+    HyperLogLog precision (see _hyperloglog).
+
+  state: int, default = 0
+    Random state for the sample.
+
+  Returns:
+  --------
+  report: pandas.DataFrame
+    One line per column: dtype, nulls, distinct (approximate), min, max and
+    the values of the columns with fewer than 10 of them.
+
+  Examples:
+  ---------
+  >>> report = profile_dataset (df)
+  >>> report = profile_dataset (df, sample = 100000)
+  '''
+  if (sample is not None):
+    n = int (sample * len (df)) if (isinstance (sample, float)) else sample
+    if (n < len (df)):
+      df = df.sample (n = n, random_state = state)
+
+  ### K: Vectorized over the whole frame, one call each.
+  nulls = df.isna ().sum ()
+  numeric = df.select_dtypes (include = ['number', 'bool']).columns
+  minimum = df [numeric].min ()
+  maximum = df [numeric].max ()
+
+  rows = []
+  for column in df.columns:
+    values = df [column]
+    present = values [values.notna ()] if (nulls [column] > 0) else values
+    hashes = pd.util.hash_pandas_object (present, index = False).values
+    distinct = _hyperloglog_count (_hyperloglog (hashes, precision))
+    examples = None
+    if (distinct < 10):
+      ### K: Cheap, the hash table has at most a few entries.
+      examples = [str (value) for value in present.unique ()]
+      distinct = len (examples)
+    rows.append ({'column': column, 'dtype': str (values.dtype),
+                  'nulls': int (nulls [column]), 'distinct': distinct,
+                  'min': minimum.get (column, np.nan),
+                  'max': maximum.get (column, np.nan),
+                  'values': examples})
+  report = pd.DataFrame (rows).set_index ('column')
+  report.attrs ['lines'] = len (df)
+  report.attrs ['sampled'] = sample is not None
+  return report
+
+def display_general_information (df, verbose = True, sample = None,
+                                 cache_directory = None):
   '''
   Parameters:
   -----------
   df: pandas.DataFrame
 
   verbose: bool, default = True
+    Print every column (otherwise only the summary).
+
+  sample: int or float, default = None
+    Quick mode, see profile_dataset.
+
+  cache_directory: str, default = None
+    Reports are stored in cache_directory/profiles, keyed by
+    dataset_fingerprint, so a known dataset is not profiled again.
 
   Returns:
   --------
-  NULL
+  report: pandas.DataFrame
+    Output of profile_dataset.
 
   Examples:
   ---------
   >>> display_general_information (df)
+  >>> display_general_information (df, sample = 1/10, cache_directory = 'cache')
   '''
   print ('Dataframe shape (lines, columns):', df.shape, '\n')
   print ('First 5 entries:\n', df [:5], '\n')
-  df.info (verbose = verbose)
 
-  print ('Brief description:')
-  df.describe ()
+  startTime = time.time ()
+  report = None
+  if (cache_directory is not None):
+    report_file = os.path.join (cache_directory, 'profiles',
+                                '{}_{}.json'.format (dataset_fingerprint (df),
+                                                     sample))
+    if (os.path.isfile (report_file)):
+      report = pd.read_json (report_file, orient = 'table')
+      print ('Report loaded from:', report_file)
+  if (report is None):
+    report = profile_dataset (df, sample = sample)
+    if (cache_directory is not None):
+      os.makedirs (os.path.dirname (report_file), exist_ok = True)
+      report.to_json (report_file, orient = 'table', default_handler = str)
+  if (sample is not None):
+    print ('Quick mode (sample = {}): counts are those of the sample.'.format (
+           sample))
 
-  print ('\nDataframe contains NaN values:', df.isnull ().values.any ())
-  nanColumns = [i for i in df.columns if df [i].isnull ().any ()]
+  nanColumns = list (report.index [report ['nulls'] > 0])
+  print ('Dataframe contains NaN values:', len (nanColumns) > 0)
   print ('Number of NaN columns:', len (nanColumns))
   print ('NaN columns:', nanColumns, '\n')
 
-  # nUniques = df.nunique () ### K: Takes too long. WHY?
-  print ('\nColumn | # of different values')
-  nUniques = []
-  for column in df.columns:
-    nUnique = df [column].nunique ()
-    nUniques.append (nUnique)
-    print ('{:35s} {:15d}  '.format (column, nUnique))
-    #print (column, '|', nUnique)
+  if (verbose):
+    print ('Column | type | # of NaN | # of different values (approx.) | '
+           'min | max')
+    for column, line in report.iterrows ():
+      print ('{:35s} {:10s} {:10d} {:15d} {:>15s} {:>15s}'.format (
+             str (column), line ['dtype'], int (line ['nulls']),
+             int (line ['distinct']), str (line ['min']), str (line ['max'])))
+    print ()
+    for column, line in report.iterrows ():
+      if (isinstance (line ['values'], list)):
+        print (column, line ['values'])
 
-  print ()
-  for column in df.columns:
-    nUnique = df [column].nunique ()
-  for column, nUnique in zip (df.columns, nUniques):
-      if (nUnique < 10):
-        print (column, df [column].unique ())
-      else:
-        print ('{:35s} {:15d}  '.format (column, nUnique))
-
-  my_objects = list (df.select_dtypes ( ['object']).columns)
+  my_objects = list (report.index [report ['dtype'].isin (['object', 'str'])])
   print ('\nObjects: (select encoding method)')
   print ('\nCheck for high cardinality.')
   print ('Column | # of different values | values')
   for column in my_objects:
-    print (column, '|', df [column].nunique (), '|', df [column].unique ())
-  print ('Objects:', list (df.select_dtypes ( ['object']).columns), '\n')
+    print (column, '|', report ['distinct'] [column], '|',
+           report ['values'] [column])
+  print ('Objects:', my_objects, '\n')
+  print (str (time.time () - startTime), 's to profile dataset.')
+  return report
+
+def _constant_values (df):
+  '''
+  Parameters:
+  -----------
+  df: pandas.DataFrame
+
+  Returns:
+  --------
+  constants: dict
+    column -> (constant, value). constant is True when the column has only
+    one (or zero) different non-NaN value, value is that value (NaN if the
+    column is empty). Numerical columns are checked with a single min/max
+    pass (min == max), the others by comparing against their first value.
+
+  Examples:
+  ---------
+  >>> _constant_values (pd.DataFrame ({'a': [1, 1], 'b': ['x', 'y']}))
+  {'a': (True, 1), 'b': (False, 'x')}
+  '''
+  constants = {}
+  numeric = df.select_dtypes (include = ['number', 'bool']).columns
+  if (len (numeric) > 0):
+    minimum = df [numeric].min ()
+    maximum = df [numeric].max ()
+    for column in numeric:
+      constants [column] = (not (minimum [column] < maximum [column]),
+                            minimum [column])
+  for column in df.columns:
+    if (column in constants):
+      continue
+    values = df [column]
+    if (isinstance (values.dtype, pd.CategoricalDtype)):
+      codes = values.cat.codes.values
+      codes = codes [codes >= 0]
+      constants [column] = ((codes.size == 0) or (codes.min () == codes.max ()),
+                            values.cat.categories [codes [0]]
+                            if (codes.size > 0) else np.nan)
+      continue
+    values = values.values
+    values = values [~pd.isna (values)]
+    if (values.size == 0):
+      constants [column] = (True, np.nan)
+    else:
+      constants [column] = (bool ((values == values [0]).all ()), values [0])
+  return {column: constants [column] for column in df.columns}
+
+class ConstantColumns:
+  '''
+  Finds the columns with only one (or zero) different non-NaN value. Works
+  on a whole dataframe or incrementally, one chunk at a time, so constant
+  columns are known before the full dataset is loaded.
+
+  Attributes:
+  -----------
+  values: dict
+    column -> single value seen so far (NaN if none), for the columns that
+    are still constant.
+
+  varying: set
+    Columns with at least two different values.
+
+  Examples:
+  ---------
+  >>> detector = ConstantColumns ()
+  >>> for chunk in pd.read_csv ('IoT-File_1.csv', chunksize = 100000):
+  ...   detector.update (chunk)
+  >>> df = pd.read_csv ('IoT-File_1.csv', usecols = lambda column:
+  ...                   column not in detector.columns)
+  '''
+  def __init__ (self):
+    self.values = {}
+    self.varying = set ()
+
+  def update (self, chunk):
+    candidates = [column for column in chunk.columns
+                  if column not in self.varying]
+    for column, (constant, value) in _constant_values (
+                                     chunk [candidates]).items ():
+      seen = self.values.get (column, np.nan)
+      if ((not constant) or
+          ((not pd.isna (seen)) and (not pd.isna (value)) and (seen != value))):
+        self.varying.add (column)
+        self.values.pop (column, None)
+      elif (pd.isna (seen)):
+        self.values [column] = value
+    return self
+
+  @property
+  def columns (self):
+    return list (self.values)
 
 def remove_columns_with_one_value (df, verbose = True):
   '''
@@ -122,29 +687,17 @@ def remove_columns_with_one_value (df, verbose = True):
 
   Examples:
   ---------
-  >>> df, log = remove_nan_columns (df, verbose = False)
+  >>> df, log = remove_columns_with_one_value (df, verbose = False)
   '''
   nColumns = len (df.columns)
-  nUniques = []
-  if (verbose):
-    print ('\nColumn | # of different values (before dropping).')
-  for column in df.columns:
-    nUnique = df [column].nunique ()
-    nUniques.append (nUnique)
-    if (verbose):
-      print (column, '|', nUnique)
-
+  detector = ConstantColumns ().update (df)
   if (verbose):
     print ('\nRemoving attributes that have only one (or zero) sampled value.')
-  for column, nUnique in zip (df.columns, nUniques):
-    if (nUnique <= 1):
-      df.drop (axis = 'columns', columns = column, inplace = True)
-
-  if (verbose):
-    print ('\nColumn | # of different values (after dropping).')
-    for column in df.columns:
-      nUnique = df [column].nunique ()
-      print (column, '|', nUnique)
+    print ('Column | value')
+    for column in detector.columns:
+      print (column, '|', detector.values [column])
+  ### K: A single drop, instead of one (copying) drop per column.
+  df.drop (axis = 'columns', columns = detector.columns, inplace = True)
 
   log = 'While removing single value columns: '
   if ((len (df.columns)) == nColumns):
@@ -154,6 +707,53 @@ def remove_columns_with_one_value (df, verbose = True):
 
   return df, log
 
+class NullCounter:
+  '''
+  Counts the NaN values of each column. Works on a whole dataframe or
+  incrementally, one chunk (or file) at a time, so the columns with too many
+  NaN values are known before the dataset is loaded.
+
+  Attributes:
+  -----------
+  rows: int
+    Lines seen so far.
+
+  nulls: pandas.Series
+    column -> NaN values seen so far.
+
+  Examples:
+  ---------
+  >>> counter = NullCounter ()
+  >>> for chunk in pd.read_csv ('IoT-File_1.csv', chunksize = 100000):
+  ...   counter.update (chunk)
+  >>> df = pd.read_csv ('IoT-File_1.csv', usecols = counter.keep (1/2))
+  '''
+  def __init__ (self):
+    self.rows = 0
+    self.nulls = pd.Series (dtype = np.int64)
+
+  def update (self, chunk):
+    nulls = chunk.isna ().sum ()
+    order = list (self.nulls.index) + [column for column in nulls.index
+                                       if column not in self.nulls.index]
+    self.nulls = self.nulls.add (nulls, fill_value = 0).reindex (order)
+    self.nulls = self.nulls.astype (np.int64)
+    self.rows += len (chunk)
+    return self
+
+  def keep (self, threshold):
+    '''
+    Columns with at least rows // (1/threshold) non NaN values (the same rule
+    as dropna (thresh = ...) in remove_nan_columns).
+    '''
+    minimum = self.rows // (1/threshold)
+    return [column for column, nulls in self.nulls.items ()
+            if (self.rows - nulls >= minimum)]
+
+  def drop (self, threshold):
+    kept = set (self.keep (threshold))
+    return [column for column in self.nulls.index if column not in kept]
+
 def remove_nan_columns (df, threshold, verbose = True):
   '''
   Parameters:
@@ -161,6 +761,7 @@ def remove_nan_columns (df, threshold, verbose = True):
   df: pandas.DataFrame
 
   threshold: float
+    Keep the columns with at least this fraction of non NaN values.
 
   verbose: bool, default = True
 
@@ -175,18 +776,19 @@ def remove_nan_columns (df, threshold, verbose = True):
   >>> df, log = remove_nan_columns (df, 1/2, verbose = False)
   '''
   nColumns = len (df.columns)
+  counter = NullCounter ().update (df)
   if (verbose):
     print ('Removing attributes with more than half NaN values.')
     print ('\nColumn | NaN values')
-    print (df.isnull ().sum ())
+    print (counter.nulls)
 
-  threshold = 1/threshold
-  df = df.dropna (axis = 'columns', thresh = df.shape [0] // threshold)
+  df = df.drop (columns = counter.drop (threshold))
 
   if (verbose):
-    print ('Dataframe contains NaN values:', df.isnull ().values.any ())
+    nulls = counter.nulls [df.columns]
+    print ('Dataframe contains NaN values:', bool (nulls.any ()))
     print ('\nColumn | NaN values (after dropping columns)')
-    print (df.isnull ().sum ())
+    print (nulls)
 
   log = 'While removing nan value columns: '
   if ((len (df.columns)) == nColumns):
@@ -215,3 +817,284 @@ def display_feature_distribution (df, features):
     print ('Values:', df [feature].unique ())
     print ('Distribution:')
     print (df [feature].value_counts ())
+
+def stratified_subsample (y, size, state = 0):
+  '''
+  Parameters:
+  -----------
+  y: numpy.ndarray
+    Labels.
+
+  size: int or float
+    Number of rows to keep (or fraction of the rows if < 1). Every class keeps
+    the same fraction of its rows, and at least one.
+
+  state: int, default = 0
+
+  Returns:
+  --------
+  indices: numpy.ndarray (int64)
+    Sorted row indices.
+
+  Examples:
+  ---------
+  >>> indices = stratified_subsample (y_train, 0.1)
+  '''
+  y = np.asarray (y).ravel ()
+  fraction = size if (size < 1) else min (1, size / len (y))
+  random = np.random.RandomState (state)
+  _, codes, counts = np.unique (y, return_inverse = True, return_counts = True)
+  order = np.argsort (codes.ravel (), kind = 'stable')
+  indices = []
+  for members in np.split (order, np.cumsum (counts) [:-1]):
+    size = max (1, int (round (fraction * len (members))))
+    indices.append (random.choice (members, size, replace = False))
+  return np.sort (np.concatenate (indices))
+
+def _binned_mutual_info (x, codes, classes, bins, strategy):
+  x = np.asarray (x, dtype = np.float64)
+  if (strategy == 'quantile'):
+    ### K: Repeated quantiles collapse, so discrete features get one bin per
+    ### value (up to bins values).
+    edges = np.unique (np.quantile (x, np.linspace (0, 1, bins + 1) [1:-1]))
+  else:
+    edges = np.linspace (x.min (), x.max (), bins + 1) [1:-1]
+  binned = np.searchsorted (edges, x, side = 'right')
+  ### K: Contingency table (bin x class) in one bincount.
+  joint = np.bincount (binned * classes + codes,
+                       minlength = (len (edges) + 1) * classes)
+  joint = joint.reshape (-1, classes) / len (x)
+  expected = (joint.sum (axis = 1, keepdims = True) *
+              joint.sum (axis = 0, keepdims = True))
+  nonzero = joint > 0
+  return np.sum (joint [nonzero] * np.log (joint [nonzero] /
+                                           expected [nonzero]))
+
+def binned_mutual_info (X, y, bins = 32, strategy = 'quantile', n_jobs = 1,
+                        subsample = None, state = 0):
+  '''
+  Mutual information between each feature and the label, estimated from a
+  contingency table of binned values. A drop-in score_func for SelectKBest
+  (use functools.partial to set the parameters), much faster than
+  mutual_info_classif (nearest neighbors) on large sets.
+
+  Parameters:
+  -----------
+  X: numpy.ndarray
+    Finite values (impute and remove infinities first).
+
+  y: numpy.ndarray
+    Labels.
+
+  bins: int, default = 32
+    Maximum number of bins per feature.
+
+  strategy: str, default = 'quantile'
+    'quantile' (bins with the same number of rows, robust to heavy tails) or
+    'uniform' (bins with the same width).
+
+  n_jobs: int, default = 1
+    Threads, one feature per task. -1 means one thread per CPU.
+
+  subsample: int or float, default = None
+    Score a stratified subsample of this size (or fraction) instead of every
+    row.
+
+  state: int, default = 0
+    Random state for the subsample.
+
+  Returns:
+  --------
+  scores: numpy.ndarray
+    Mutual information (nats) of each feature.
+
+  Examples:
+  ---------
+  >>> from functools import partial
+  >>> fs = SelectKBest (score_func = partial (binned_mutual_info, n_jobs = -1),
+  ...                   k = 10)
+  >>> scores = binned_mutual_info (X_train, y_train, subsample = 100000)
+  '''
+  y = np.asarray (y).ravel ()
+  if (subsample is not None):
+    rows = stratified_subsample (y, subsample, state)
+    X, y = X [rows], y [rows]
+  _, codes = np.unique (y, return_inverse = True)
+  codes = codes.ravel ()
+  classes = codes.max () + 1
+  if (n_jobs == -1):
+    n_jobs = os.cpu_count ()
+  score = lambda j: _binned_mutual_info (X [:, j], codes, classes, bins,
+                                         strategy)
+  if (n_jobs <= 1):
+    return np.array ([score (j) for j in range (X.shape [1])])
+  with ThreadPoolExecutor (max_workers = n_jobs) as executor:
+    return np.array (list (executor.map (score, range (X.shape [1]))))
+
+def rank_features (scores, names = None):
+  '''
+  Parameters:
+  -----------
+  scores: numpy.ndarray
+
+  names: list, default = None
+    Defaults to the feature positions.
+
+  Returns:
+  --------
+  ranking: list of (name, score)
+    Sorted by increasing score (best feature last), with a single argsort.
+    NaN scores come first.
+
+  Examples:
+  ---------
+  >>> for feature, score in rank_features (fs.scores_):
+  ...   print ('Feature %d: %f' % (feature, score))
+  '''
+  scores = np.asarray (scores, dtype = np.float64)
+  if (names is None):
+    names = range (len (scores))
+  names = list (names)
+  order = np.argsort (np.where (np.isnan (scores), -np.inf, scores),
+                      kind = 'mergesort')
+  return [(names [i], scores [i]) for i in order]
+
+### K: Seeds of the repeated experiments (std_dev.py averages them).
+STATES = [0, 10, 100, 1000, 10000]
+
+def share_arrays (arrays):
+  '''
+  Parameters:
+  -----------
+  arrays: dict of numpy.ndarray
+    Numeric arrays (object arrays can not be shared).
+
+  Returns:
+  --------
+  memories: list of multiprocessing.shared_memory.SharedMemory
+    Keep them while the arrays are in use, then close and unlink them.
+
+  descriptors: dict
+    name -> (shared memory name, shape, dtype), for attach_arrays.
+
+  Examples:
+  ---------
+  >>> memories, descriptors = share_arrays ({'X': X, 'y': y})
+  '''
+  memories = []
+  descriptors = {}
+  for name, values in arrays.items ():
+    values = np.asarray (values)
+    if (values.dtype.hasobject):
+      raise ValueError ('Can not share object array: ' + name)
+    memory = shared_memory.SharedMemory (create = True,
+                                         size = max (values.nbytes, 1))
+    np.ndarray (values.shape, dtype = values.dtype,
+                buffer = memory.buf) [...] = values
+    memories.append (memory)
+    descriptors [name] = (memory.name, values.shape, values.dtype.str)
+  return memories, descriptors
+
+_SHARED_ARRAYS = {}
+
+def attach_arrays (descriptors):
+  '''
+  Parameters:
+  -----------
+  descriptors: dict
+    Returned by share_arrays.
+
+  Returns:
+  --------
+  arrays: dict of numpy.ndarray
+    Read-only views of the shared memory, nothing is copied. Also kept in
+    _SHARED_ARRAYS for the process pool workers.
+  '''
+  arrays = {}
+  for name, (memory_name, shape, dtype) in descriptors.items ():
+    memory = shared_memory.SharedMemory (name = memory_name)
+    values = np.ndarray (shape, dtype = dtype, buffer = memory.buf)
+    values.flags.writeable = False
+    arrays [name] = values
+    _SHARED_ARRAYS [name] = (memory, values)
+  return arrays
+
+def _run_state (experiment, state):
+  ### K: Output is captured so the logs of each seed come out whole and in
+  ### order (std_dev.py parses them).
+  output = io.StringIO ()
+  arrays = {name: values for name, (_, values) in _SHARED_ARRAYS.items ()}
+  with contextlib.redirect_stdout (output):
+    result = experiment (arrays, state)
+  return result, output.getvalue ()
+
+def run_states (prepare, experiment, states = STATES, n_jobs = -1,
+                verbose = True):
+  '''
+  Loads and preprocesses the dataset once and runs one experiment per seed
+  in a process pool. The base arrays live in shared memory, the workers
+  read them without copying.
+
+  Parameters:
+  -----------
+  prepare: callable
+    Returns a dict of numeric numpy arrays (X, y...). Called once.
+
+  experiment: callable
+    experiment (arrays, state) splits, fits and evaluates for one seed and
+    returns something picklable (metrics). Must be defined at module level,
+    with the script body under if (__name__ == '__main__').
+
+  states: list of int, default = STATES
+
+  n_jobs: int, default = -1
+    Processes. -1 means one per seed (up to the number of CPUs). With 1,
+    every seed runs in this process, without shared memory.
+
+  verbose: bool, default = True
+    Print the output of each seed (in the order of states).
+
+  Returns:
+  --------
+  results: dict
+    state -> value returned by experiment.
+
+  Examples:
+  ---------
+  >>> results = run_states (prepare, experiment, STATES)
+  '''
+  states = list (states)
+  if (n_jobs == -1):
+    n_jobs = os.cpu_count ()
+  n_jobs = max (1, min (n_jobs, len (states)))
+  startTime = time.time ()
+  arrays = prepare ()
+  if (verbose):
+    print (str (time.time () - startTime), 's to prepare the dataset.')
+
+  results = {}
+  if (n_jobs == 1):
+    for state in states:
+      if (verbose):
+        print ('STATE:', state)
+      results [state] = experiment (arrays, state)
+    return results
+
+  memories, descriptors = share_arrays (arrays)
+  del arrays
+  try:
+    with ProcessPoolExecutor (max_workers = n_jobs,
+                              initializer = attach_arrays,
+                              initargs = (descriptors,)) as executor:
+      futures = [executor.submit (_run_state, experiment, state)
+                 for state in states]
+      for state, future in zip (states, futures):
+        results [state], output = future.result ()
+        if (verbose):
+          print ('STATE:', state)
+          print (output, end = '')
+  finally:
+    for memory in memories:
+      memory.close ()
+      memory.unlink ()
+  return results
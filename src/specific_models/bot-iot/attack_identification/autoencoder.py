@@ -11,7 +11,10 @@ import math
 import numpy as np
 from numpy import mean, std
 from unit import remove_columns_with_one_value, remove_nan_columns, load_dataset
+from unit import load_schema, load_clean_dataset, feature_store
 from unit import display_general_information, display_feature_distribution
+from unit import binned_mutual_info, feature_scores, PrecomputedScores
+from unit import rank_features, successive_halving, EpochEvaluator
 from collections import Counter
 #from imblearn.over_sampling import RandomOverSampler, RandomUnderSampler
 import sklearn
@@ -34,6 +37,7 @@ from sklearn.model_selection import cross_val_score
 from sklearn.decomposition import PCA
 from sklearn.feature_selection import SelectKBest
 from sklearn.feature_selection import f_classif, chi2, mutual_info_classif
+from functools import partial
 from sklearn.utils import class_weight
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
@@ -61,10 +65,15 @@ BOT_IOT_FILE_FULL_SCHEMA = 'UNSW_2018_IoT_Botnet_Dataset_{}.csv' # 1 - 74
 FULL_FILES = 74
 FILE_NAME = BOT_IOT_DIRECTORY + BOT_IOT_FILE_5_PERCENT_SCHEMA
 FEATURES = BOT_IOT_DIRECTORY + BOT_IOT_FEATURE_NAMES
+CACHE_DIRECTORY = BOT_IOT_DIRECTORY + 'cache/'
 NAN_VALUES = ['?', '.']
 TARGET = 'attack'
 INDEX_COLUMN = 'pkSeqID'
 LABELS = ['attack', 'category', 'subcategory']
+CATEGORICAL_COLUMNS = ['flgs', 'proto', 'sport', 'dport', 'state']
+FEATURE_DIRECTORY = CACHE_DIRECTORY + 'features/'
+VALIDATION_SIZE = 1/4
+NUMBER_OF_FEATURES = 9 #'all'
 STATE = 0
 try:
   STATE = int (sys.argv [1])
@@ -76,171 +85,184 @@ print ('STATE:', STATE)
 
 
 ###############################################################################
-## Load dataset
-###############################################################################
-df = load_dataset (FILE_NAME, FIVE_PERCENT_FILES, INDEX_COLUMN, NAN_VALUES)
-
-
-###############################################################################
-## Clean dataset
-###############################################################################
-###############################################################################
-### Remove columns with only one value
-df, log = remove_columns_with_one_value (df, verbose = False)
-print (log)
-
-
-###############################################################################
-### Remove redundant columns, useless columns and unused targets
-### K: _number columns are numerical representations of other existing columns.
-### K: category and subcategory are other labels.
-### K: saddr and daddr may specialize the model to a single network
-redundant_columns = ['state_number', 'proto_number', 'flgs_number']
-other_targets = ['category', 'subcategory']
-misc_columns = ['saddr', 'daddr']
-print ('Removing redundant columns:', redundant_columns)
-print ('Removing useless targets:', other_targets)
-print ('Removing misc columns:', misc_columns)
-columns_to_remove = redundant_columns + other_targets + misc_columns
-df.drop (axis = 'columns', columns = columns_to_remove, inplace = True)
-
-###############################################################################
-### Remove NaN columns (with a lot of NaN values)
-df, log = remove_nan_columns (df, 1/2, verbose = False)
-print (log)
-
-###############################################################################
-### Encode categorical features
-print ('Encoding categorical features (ordinal encoding).')
-my_encoder = OrdinalEncoder ()
-df ['flgs'] = my_encoder.fit_transform (df ['flgs'].values.reshape (-1, 1))
-df ['proto'] = my_encoder.fit_transform (df ['proto'].values.reshape (-1, 1))
-df ['sport'] = my_encoder.fit_transform (df ['sport'].astype (str).values.reshape (-1, 1))
-df ['dport'] = my_encoder.fit_transform (df ['dport'].astype (str).values.reshape (-1, 1))
-df ['state'] = my_encoder.fit_transform (df ['state'].values.reshape (-1, 1))
-print ('Objects:', list (df.select_dtypes ( ['object']).columns))
-
-
-###############################################################################
-## Quick sanity check
-###############################################################################
-display_general_information (df)
-
-
-###############################################################################
-## Split dataset into train, validation and test sets
+## Build features (load, clean, split, normalize, select)
 ###############################################################################
-### Isolate attack and normal samples
-## K: Dataset is too big? Drop.
-#drop_indices = np.random.choice (df.index, int (df.shape [0] * 0.5),
-#                                 replace = False)
-#df = df.drop (drop_indices)
-mask = df [TARGET] == 0
-# 0 == normal
-df_normal = df [mask]
-# 1 == attack
-df_attack = df [~mask]
-
-print ('Attack set:')
-print (df_attack [TARGET].value_counts ())
-print ('Normal set:')
-print (df_normal [TARGET].value_counts ())
-
-### Sample and drop random attacks
-df_random_attacks = df_attack.sample (n = df_normal.shape [0], random_state = STATE)
-df_attack = df_attack.drop (df_random_attacks.index)
-
-### Assemble test set
-df_test = pd.DataFrame ()
-df_test = pd.concat ( [df_test, df_normal])
-df_test = pd.concat ( [df_test, df_random_attacks])
-print ('Test set:')
-print (df_test [TARGET].value_counts ())
-X_test_df = df_test.iloc [:, :-1]
-y_test_df = df_test.iloc [:, -1]
-### K: y_test is required to plot the roc curve in the end
-
-df_train = df_attack
-VALIDATION_SIZE = 1/4
-print ('\nSplitting dataset (validation/train):', VALIDATION_SIZE)
-X_train_df, X_val_df, y_train_df, y_val_df = train_test_split (
-                                             df.loc [:, df.columns != TARGET],
-                                             df [TARGET],
-                                             test_size = VALIDATION_SIZE,
-                                             random_state = STATE,)
-
-
-print ('X_train_df shape:', X_train_df.shape)
-print ('y_train_df shape:', y_train_df.shape)
-print ('X_val_df shape:', X_val_df.shape)
-print ('y_val_df shape:', y_val_df.shape)
-print ('X_test_df shape:', X_test_df.shape)
-print ('y_test_df shape:', y_test_df.shape)
+### K: Everything below runs only when the feature store has no entry
+### for this STATE. The dataframes and intermediate copies are local and
+### released when build_features returns.
+def build_features ():
+  #############################################################################
+  ## Load and clean dataset
+  #############################################################################
+  ### K: _number columns are numerical representations of other existing columns.
+  ### K: category and subcategory are other labels.
+  ### K: saddr and daddr may specialize the model to a single network
+  redundant_columns = ['state_number', 'proto_number', 'flgs_number']
+  other_targets = ['category', 'subcategory']
+  misc_columns = ['saddr', 'daddr']
+  print ('Removing redundant columns:', redundant_columns)
+  print ('Removing useless targets:', other_targets)
+  print ('Removing misc columns:', misc_columns)
+  columns_to_remove = redundant_columns + other_targets + misc_columns
+  ### K: Removed columns are never parsed. The cleaned dataset is cached, warm
+  ### runs skip the CSV files (python dataset_cache.py {list,clear}).
+  schema = load_schema (FEATURES, drop_columns = columns_to_remove)
+  df = load_clean_dataset (FILE_NAME, FIVE_PERCENT_FILES, INDEX_COLUMN,
+                           NAN_VALUES, columns_to_remove = columns_to_remove,
+                           nan_threshold = 1/2,
+                           categorical_columns = CATEGORICAL_COLUMNS,
+                           string_columns = ['sport', 'dport'],
+                           cache_directory = CACHE_DIRECTORY, n_jobs = -1,
+                           schema = schema, compact = True)
+
+
+  #############################################################################
+  ## Quick sanity check
+  #############################################################################
+  display_general_information (df, cache_directory = CACHE_DIRECTORY)
+
+
+  #############################################################################
+  ## Split dataset into train, validation and test sets
+  #############################################################################
+  ### Isolate attack and normal samples
+  ## K: Dataset is too big? Drop.
+  #drop_indices = np.random.choice (df.index, int (df.shape [0] * 0.5),
+  #                                 replace = False)
+  #df = df.drop (drop_indices)
+  mask = df [TARGET] == 0
+  # 0 == normal
+  df_normal = df [mask]
+  # 1 == attack
+  df_attack = df [~mask]
+
+  print ('Attack set:')
+  print (df_attack [TARGET].value_counts ())
+  print ('Normal set:')
+  print (df_normal [TARGET].value_counts ())
+
+  ### Sample and drop random attacks
+  df_random_attacks = df_attack.sample (n = df_normal.shape [0], random_state = STATE)
+  df_attack = df_attack.drop (df_random_attacks.index)
+
+  ### Assemble test set
+  df_test = pd.DataFrame ()
+  df_test = pd.concat ( [df_test, df_normal])
+  df_test = pd.concat ( [df_test, df_random_attacks])
+  print ('Test set:')
+  print (df_test [TARGET].value_counts ())
+  X_test_df = df_test.iloc [:, :-1]
+  y_test_df = df_test.iloc [:, -1]
+  ### K: y_test is required to plot the roc curve in the end
+
+  df_train = df_attack
+  print ('\nSplitting dataset (validation/train):', VALIDATION_SIZE)
+  X_train_df, X_val_df, y_train_df, y_val_df = train_test_split (
+                                               df.loc [:, df.columns != TARGET],
+                                               df [TARGET],
+                                               test_size = VALIDATION_SIZE,
+                                               random_state = STATE,)
+
+
+  print ('X_train_df shape:', X_train_df.shape)
+  print ('y_train_df shape:', y_train_df.shape)
+  print ('X_val_df shape:', X_val_df.shape)
+  print ('y_val_df shape:', y_val_df.shape)
+  print ('X_test_df shape:', X_test_df.shape)
+  print ('y_test_df shape:', y_test_df.shape)
+
+
+  #############################################################################
+  ## Convert dataframe to a numpy array
+  #############################################################################
+  print ('\nConverting dataframe to numpy array.')
+  X_train = X_train_df.values
+  y_train = y_train_df.values
+  X_val = X_val_df.values
+  y_val = y_val_df.values
+  X_test = X_test_df.values
+  y_test = y_test_df.values
+  print ('X_train shape:', X_train.shape)
+  print ('y_train shape:', y_train.shape)
+  print ('X_val shape:', X_val.shape)
+  print ('y_val shape:', y_val.shape)
+  print ('X_test shape:', X_test.shape)
+  print ('y_test shape:', y_test.shape)
+
+
+  #############################################################################
+  ## Apply normalization
+  #############################################################################
+  ### K: NOTE: Only use derived information from the train set to avoid leakage.
+  print ('\nApplying normalization.')
+  startTime = time.time ()
+  scaler = StandardScaler ()
+  scaler.fit (X_train)
+  X_train = scaler.transform (X_train)
+  X_val = scaler.transform (X_val)
+  X_test = scaler.transform (X_test)
+  print (str (time.time () - startTime), 'to normalize data.')
+
+
+  #############################################################################
+  ## Perform feature selection
+  #############################################################################
+  ### K: Let the autoencoder reconstruct the data.
+  #############################################################################
+  print ('\nSelecting top', NUMBER_OF_FEATURES, 'features.')
+  startTime = time.time ()
+  #fs = SelectKBest (score_func = partial (binned_mutual_info, n_jobs = -1),
+  #                  k = NUMBER_OF_FEATURES)
+  ### K: ~30 minutes to FAIL fit mutual_info_classif to 5% bot-iot, the
+  ### binned estimate (contingency tables, one thread per feature) takes
+  ### seconds. Use subsample = ... to score a stratified subsample.
+  #fs = SelectKBest (score_func = chi2, k = NUMBER_OF_FEATURES) # X must be >= 0
+  ### K: ~4 seconds to fit chi2 to 5% bot-iot (MinMaxScaler (0, 1))
+  ### K: Scores are computed once per split and cached, fitting the
+  ### selector only picks the best ones. Only f_classif is used here, add
+  ### 'chi2' or 'mutual_info' to scorers to switch.
+  scores = feature_scores (X_train, y_train, scorers = ('f_classif',),
+                           cache_directory = CACHE_DIRECTORY)
+  fs = SelectKBest (score_func = PrecomputedScores (scores ['f_classif']),
+                    k = NUMBER_OF_FEATURES)
+  ### K: ~4 seconds to fit f_classif to 5% bot-iot
+  fs.fit (X_train, y_train)
+  X_train = fs.transform (X_train)
+  X_val = fs.transform (X_val)
+  X_test = fs.transform (X_test)
+  print (str (time.time () - startTime), 'to select features.')
+  print ('X_train shape:', X_train.shape)
+  print ('y_train shape:', y_train.shape)
+  print ('X_val shape:', X_val.shape)
+  print ('y_val shape:', y_val.shape)
+  print ('X_test shape:', X_test.shape)
+  print ('y_test shape:', y_test.shape)
+  for feature, score in rank_features (fs.scores_):
+    print ('Feature %d: %f' % (feature, score))
+  return {'X_train': X_train, 'y_train': y_train, 'X_val': X_val,
+          'y_val': y_val, 'X_test': X_test, 'y_test': y_test}
 
 
 ###############################################################################
-## Convert dataframe to a numpy array
+## Load features (memory-mapped)
 ###############################################################################
-print ('\nConverting dataframe to numpy array.')
-X_train = X_train_df.values
-y_train = y_train_df.values
-X_val = X_val_df.values
-y_val = y_val_df.values
-X_test = X_test_df.values
-y_test = y_test_df.values
-print ('X_train shape:', X_train.shape)
-print ('y_train shape:', y_train.shape)
-print ('X_val shape:', X_val.shape)
-print ('y_val shape:', y_val.shape)
-print ('X_test shape:', X_test.shape)
-print ('y_test shape:', y_test.shape)
-
-
-###############################################################################
-## Apply normalization
-###############################################################################
-### K: NOTE: Only use derived information from the train set to avoid leakage.
-print ('\nApplying normalization.')
-startTime = time.time ()
-scaler = StandardScaler ()
-scaler.fit (X_train)
-X_train = scaler.transform (X_train)
-X_val = scaler.transform (X_val)
-X_test = scaler.transform (X_test)
-print (str (time.time () - startTime), 'to normalize data.')
-
-
-###############################################################################
-## Perform feature selection
-###############################################################################
-### K: Let the autoencoder reconstruct the data.
-###############################################################################
-NUMBER_OF_FEATURES = 9 #'all'
-print ('\nSelecting top', NUMBER_OF_FEATURES, 'features.')
-startTime = time.time ()
-#fs = SelectKBest (score_func = mutual_info_classif, k = NUMBER_OF_FEATURES)
-### K: ~30 minutes to FAIL fit mutual_info_classif to 5% bot-iot
-#fs = SelectKBest (score_func = chi2, k = NUMBER_OF_FEATURES) # X must be >= 0
-### K: ~4 seconds to fit chi2 to 5% bot-iot (MinMaxScaler (0, 1))
-fs = SelectKBest (score_func = f_classif, k = NUMBER_OF_FEATURES)
-### K: ~4 seconds to fit f_classif to 5% bot-iot
-fs.fit (X_train, y_train)
-X_train = fs.transform (X_train)
-X_val = fs.transform (X_val)
-X_test = fs.transform (X_test)
-print (str (time.time () - startTime), 'to select features.')
+### K: The entry is keyed by STATE, the source of build_features and the
+### constants it reads, editing any of them builds a new one.
+features = feature_store (FEATURE_DIRECTORY, build_features, STATE,
+                          {'script': 'autoencoder', 'k': NUMBER_OF_FEATURES,
+                           'validation': VALIDATION_SIZE,
+                           'target': TARGET, 'index': INDEX_COLUMN,
+                           'nan_values': NAN_VALUES, 'schema': FEATURES,
+                           'categorical': CATEGORICAL_COLUMNS},
+                          file_names = [FILE_NAME.format (file_number)
+                                        for file_number in
+                                        range (1, FIVE_PERCENT_FILES + 1)])
+X_train, y_train = features ['X_train'], features ['y_train']
+X_val, y_val = features ['X_val'], features ['y_val']
+X_test, y_test = features ['X_test'], features ['y_test']
 print ('X_train shape:', X_train.shape)
-print ('y_train shape:', y_train.shape)
 print ('X_val shape:', X_val.shape)
-print ('y_val shape:', y_val.shape)
 print ('X_test shape:', X_test.shape)
-print ('y_test shape:', y_test.shape)
-bestFeatures = []
-for feature in range (len (fs.scores_)):
-  bestFeatures.append ({'f': feature, 's': fs.scores_ [feature]})
-  bestFeatures = sorted (bestFeatures, key = lambda k: k ['s'])
-for feature in bestFeatures:
-  print ('Feature %d: %f' % (feature ['f'], feature ['s']))
 
 
 ###############################################################################
@@ -266,7 +288,6 @@ def create_model (learn_rate = 0.01, dropout_rate = 0.0, weight_constraint = 0,
  return model
 
 
-model = KerasRegressor (build_fn = create_model, verbose = 2)
 batch_size = [5000, 10000]#, 50]
 epochs = [10]#, 5, 10]
 learn_rate = [0.001, 0.01, 0.1]#, 0.2, 0.3]
@@ -275,19 +296,14 @@ weight_constraint = [0]#1, 2, 3, 4, 5]
 param_grid = dict (batch_size = batch_size, epochs = epochs,
                    dropout_rate = dropout_rate, learn_rate = learn_rate,
                    weight_constraint = weight_constraint)
-grid = GridSearchCV (estimator = model, param_grid = param_grid,
-                     scoring = 'neg_mean_squared_error', cv = myPreSplit,
-                     verbose = 2, n_jobs = 1)
-grid_result = grid.fit (np.vstack ( (X_train, X_val)),#, axis = 1),
-                       np.vstack ( (X_train, X_val)))#, axis = 1))
-print (grid_result.best_params_)
-
-print ("Best: %f using %s" % (grid_result.best_score_, grid_result.best_params_))
-means = grid_result.cv_results_ ['mean_test_score']
-stds = grid_result.cv_results_ ['std_test_score']
-params = grid_result.cv_results_ ['params']
-for mean, stdev, param in zip (means, stds, params):
-  print ("%f (%f) with: %r" % (mean, stdev, param))
+### K: Successive halving over the epochs (validation MSE, higher -MSE is
+### better): 1/3 of the candidates survive each rung, survivors resume
+### training instead of starting over.
+MIN_EPOCHS = 1
+evaluate = EpochEvaluator (create_model, X_train, X_train, X_val, X_val)
+result = successive_halving (evaluate, param_grid, MIN_EPOCHS, max (epochs))
+
+print ("Best: %f using %s" % (result ['best_score'], result ['best_params']))
 
 '''
 
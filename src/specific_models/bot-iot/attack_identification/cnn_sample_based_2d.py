@@ -11,6 +11,7 @@ import math
 import numpy as np
 from numpy import mean, std
 from unit import remove_columns_with_one_value, remove_nan_columns, load_dataset
+from unit import load_schema, load_clean_dataset, feature_store
 from unit import display_general_information, display_feature_distribution
 from collections import Counter
 #from imblearn.over_sampling import RandomOverSampler, RandomUnderSampler
@@ -61,10 +62,15 @@ BOT_IOT_FILE_FULL_SCHEMA = 'UNSW_2018_IoT_Botnet_Dataset_{}.csv' # 1 - 74
 FULL_FILES = 74
 FILE_NAME = BOT_IOT_DIRECTORY + BOT_IOT_FILE_5_PERCENT_SCHEMA
 FEATURES = BOT_IOT_DIRECTORY + BOT_IOT_FEATURE_NAMES
+CACHE_DIRECTORY = BOT_IOT_DIRECTORY + 'cache/'
 NAN_VALUES = ['?', '.']
 TARGET = 'attack'
 INDEX_COLUMN = 'pkSeqID'
 LABELS = ['attack', 'category', 'subcategory']
+CATEGORICAL_COLUMNS = ['flgs', 'proto', 'sport', 'dport', 'state']
+FEATURE_DIRECTORY = CACHE_DIRECTORY + 'features/'
+TEST_SIZE = 3/10
+VALIDATION_SIZE = 1/4
 STATE = 0
 try:
   STATE = int (sys.argv [1])
@@ -76,142 +82,154 @@ print ('STATE:', STATE)
 
 
 ###############################################################################
-## Load dataset
-###############################################################################
-df = load_dataset (FILE_NAME, FIVE_PERCENT_FILES, INDEX_COLUMN, NAN_VALUES)
-
-
-###############################################################################
-## Clean dataset
-###############################################################################
-###############################################################################
-### Remove columns with only one value
-df, log = remove_columns_with_one_value (df, verbose = False)
-print (log)
-
-
-###############################################################################
-### Remove redundant columns, useless columns and unused targets
-### K: _number columns are numerical representations of other existing columns.
-### K: category and subcategory are other labels.
-### K: saddr and daddr may specialize the model to a single network
-redundant_columns = ['state_number', 'proto_number', 'flgs_number']
-other_targets = ['category', 'subcategory']
-misc_columns = ['saddr', 'daddr']
-print ('Removing redundant columns:', redundant_columns)
-print ('Removing useless targets:', other_targets)
-print ('Removing misc columns:', misc_columns)
-columns_to_remove = redundant_columns + other_targets + misc_columns
-df.drop (axis = 'columns', columns = columns_to_remove, inplace = True)
-
-###############################################################################
-### Remove NaN columns (with a lot of NaN values)
-df, log = remove_nan_columns (df, 1/2, verbose = False)
-print (log)
-
-###############################################################################
-### Encode categorical features
-print ('Encoding categorical features (ordinal encoding).')
-my_encoder = OrdinalEncoder ()
-df ['flgs'] = my_encoder.fit_transform (df ['flgs'].values.reshape (-1, 1))
-df ['proto'] = my_encoder.fit_transform (df ['proto'].values.reshape (-1, 1))
-df ['sport'] = my_encoder.fit_transform (df ['sport'].astype (str).values.reshape (-1, 1))
-df ['dport'] = my_encoder.fit_transform (df ['dport'].astype (str).values.reshape (-1, 1))
-df ['state'] = my_encoder.fit_transform (df ['state'].values.reshape (-1, 1))
-print ('Objects:', list (df.select_dtypes ( ['object']).columns))
-
-
-###############################################################################
-## Quick sanity check
-###############################################################################
-display_general_information (df)
-
-
-###############################################################################
-## Split dataset into train and test sets
+## Build features (load, clean, split, normalize, select)
 ###############################################################################
-### K: Dataset is too big? Drop.
-# drop_indices = np.random.choice (df.index, int (df.shape [0] * 0.5),
-#                                  replace = False)
-# df = df.drop (drop_indices)
-TEST_SIZE = 3/10
-VALIDATION_SIZE = 1/4
-print ('Splitting dataset (test/train):', TEST_SIZE)
-X_train_df, X_test_df, y_train_df, y_test_df = train_test_split (
-                                               df.loc [:, df.columns != TARGET],
-                                               df [TARGET],
-                                               test_size = TEST_SIZE,
+### K: Everything below runs only when the feature store has no entry
+### for this STATE. The dataframes and intermediate copies are local and
+### released when build_features returns.
+def build_features ():
+  #############################################################################
+  ## Load and clean dataset
+  #############################################################################
+  ### K: _number columns are numerical representations of other existing columns.
+  ### K: category and subcategory are other labels.
+  ### K: saddr and daddr may specialize the model to a single network
+  redundant_columns = ['state_number', 'proto_number', 'flgs_number']
+  other_targets = ['category', 'subcategory']
+  misc_columns = ['saddr', 'daddr']
+  print ('Removing redundant columns:', redundant_columns)
+  print ('Removing useless targets:', other_targets)
+  print ('Removing misc columns:', misc_columns)
+  columns_to_remove = redundant_columns + other_targets + misc_columns
+  ### K: Removed columns are never parsed. The cleaned dataset is cached, warm
+  ### runs skip the CSV files (python dataset_cache.py {list,clear}).
+  schema = load_schema (FEATURES, drop_columns = columns_to_remove)
+  df = load_clean_dataset (FILE_NAME, FIVE_PERCENT_FILES, INDEX_COLUMN,
+                           NAN_VALUES, columns_to_remove = columns_to_remove,
+                           nan_threshold = 1/2,
+                           categorical_columns = CATEGORICAL_COLUMNS,
+                           string_columns = ['sport', 'dport'],
+                           cache_directory = CACHE_DIRECTORY, n_jobs = -1,
+                           schema = schema, compact = True)
+
+
+  #############################################################################
+  ## Quick sanity check
+  #############################################################################
+  display_general_information (df, cache_directory = CACHE_DIRECTORY)
+
+
+  #############################################################################
+  ## Split dataset into train and test sets
+  #############################################################################
+  ### K: Dataset is too big? Drop.
+  # drop_indices = np.random.choice (df.index, int (df.shape [0] * 0.5),
+  #                                  replace = False)
+  # df = df.drop (drop_indices)
+  print ('Splitting dataset (test/train):', TEST_SIZE)
+  X_train_df, X_test_df, y_train_df, y_test_df = train_test_split (
+                                                 df.loc [:, df.columns != TARGET],
+                                                 df [TARGET],
+                                                 test_size = TEST_SIZE,
+                                                 random_state = STATE,)
+  print ('Splitting dataset (validation/train):', VALIDATION_SIZE)
+  X_train_df, X_val_df, y_train_df, y_val_df = train_test_split (
+                                               X_train_df,
+                                               y_train_df,
+                                               test_size = VALIDATION_SIZE,
                                                random_state = STATE,)
-print ('Splitting dataset (validation/train):', VALIDATION_SIZE)
-X_train_df, X_val_df, y_train_df, y_val_df = train_test_split (
-                                             X_train_df,
-                                             y_train_df,
-                                             test_size = VALIDATION_SIZE,
-                                             random_state = STATE,)
-print ('X_train_df shape:', X_train_df.shape)
-print ('y_train_df shape:', y_train_df.shape)
-print ('X_val_df shape:', X_val_df.shape)
-print ('y_val_df shape:', y_val_df.shape)
-print ('X_test_df shape:', X_test_df.shape)
-print ('y_test_df shape:', y_test_df.shape)
+  print ('X_train_df shape:', X_train_df.shape)
+  print ('y_train_df shape:', y_train_df.shape)
+  print ('X_val_df shape:', X_val_df.shape)
+  print ('y_val_df shape:', y_val_df.shape)
+  print ('X_test_df shape:', X_test_df.shape)
+  print ('y_test_df shape:', y_test_df.shape)
+
+
+  #############################################################################
+  ## Convert dataframe to a numpy array
+  #############################################################################
+  print ('\nConverting dataframe to numpy array.')
+  X_train = X_train_df.values
+  y_train = y_train_df.values
+  X_val = X_val_df.values
+  y_val = y_val_df.values
+  X_test = X_test_df.values
+  y_test = y_test_df.values
+  print ('X_train shape:', X_train.shape)
+  print ('y_train shape:', y_train.shape)
+  print ('X_val shape:', X_val.shape)
+  print ('y_val shape:', y_val.shape)
+  print ('X_test shape:', X_test.shape)
+  print ('y_test shape:', y_test.shape)
+
+
+  #############################################################################
+  ## Apply normalization
+  #############################################################################
+  ### K: NOTE: Only use derived information from the train set to avoid leakage.
+  print ('\nApplying normalization.')
+  startTime = time.time ()
+  scaler = StandardScaler ()
+  #scaler = MinMaxScaler (feature_range = (0, 1))
+  scaler.fit (X_train)
+  X_train = scaler.transform (X_train)
+  X_val = scaler.transform (X_val)
+  X_test = scaler.transform (X_test)
+  print (str (time.time () - startTime), 'to normalize data.')
+
+  #############################################################################
+  ## Perform feature selection
+  #############################################################################
+  ### K: The convolutional layers will handle it.
+
+
+  #############################################################################
+  ## Reshape samples into 2D
+  #############################################################################
+  SAMPLE_2D_SIZE = math.ceil (math.sqrt (X_train.shape [1]))# 7x7
+  SIZE = math.ceil (math.sqrt (X_train.shape [1]))# 7x7
+  print (SAMPLE_2D_SIZE)
+
+  X_train.resize ((X_train.shape[0], SAMPLE_2D_SIZE, SAMPLE_2D_SIZE))
+  X_train = X_train.reshape ((X_train.shape[0], SIZE, SIZE, 1))
+  X_val.resize ((X_val.shape[0], SAMPLE_2D_SIZE, SAMPLE_2D_SIZE))
+  X_val = X_val.reshape ((X_val.shape[0], SIZE, SIZE, 1))
+  X_test.resize ((X_test.shape[0], SAMPLE_2D_SIZE, SAMPLE_2D_SIZE))
+  X_test = X_test.reshape ((X_test.shape[0], SIZE, SIZE, 1))
+  print (X_train.shape)
+  print (X_val.shape)
+  print (X_test.shape)
+  return {'X_train': X_train, 'y_train': y_train, 'X_val': X_val,
+          'y_val': y_val, 'X_test': X_test, 'y_test': y_test}
 
 
 ###############################################################################
-## Convert dataframe to a numpy array
+## Load features (memory-mapped)
 ###############################################################################
-print ('\nConverting dataframe to numpy array.')
-X_train = X_train_df.values
-y_train = y_train_df.values
-X_val = X_val_df.values
-y_val = y_val_df.values
-X_test = X_test_df.values
-y_test = y_test_df.values
+### K: The entry is keyed by STATE, the source of build_features and the
+### constants it reads, editing any of them builds a new one.
+features = feature_store (FEATURE_DIRECTORY, build_features, STATE,
+                          {'script': 'cnn_sample_based_2d', 'test': TEST_SIZE,
+                           'validation': VALIDATION_SIZE,
+                           'target': TARGET, 'index': INDEX_COLUMN,
+                           'nan_values': NAN_VALUES, 'schema': FEATURES,
+                           'categorical': CATEGORICAL_COLUMNS},
+                          file_names = [FILE_NAME.format (file_number)
+                                        for file_number in
+                                        range (1, FIVE_PERCENT_FILES + 1)])
+X_train, y_train = features ['X_train'], features ['y_train']
+X_val, y_val = features ['X_val'], features ['y_val']
+X_test, y_test = features ['X_test'], features ['y_test']
+SIZE = X_train.shape [1]
 print ('X_train shape:', X_train.shape)
-print ('y_train shape:', y_train.shape)
 print ('X_val shape:', X_val.shape)
-print ('y_val shape:', y_val.shape)
 print ('X_test shape:', X_test.shape)
-print ('y_test shape:', y_test.shape)
-
-
-###############################################################################
-## Apply normalization
-###############################################################################
-### K: NOTE: Only use derived information from the train set to avoid leakage.
-print ('\nApplying normalization.')
-startTime = time.time ()
-scaler = StandardScaler ()
-#scaler = MinMaxScaler (feature_range = (0, 1))
-scaler.fit (X_train)
-X_train = scaler.transform (X_train)
-X_val = scaler.transform (X_val)
-X_test = scaler.transform (X_test)
-print (str (time.time () - startTime), 'to normalize data.')
-
-###############################################################################
-## Perform feature selection
-###############################################################################
-### K: The convolutional layers will handle it.
 
 
 ###############################################################################
 ## Create learning model (2D CNN) and tune hyperparameters
 ###############################################################################
-###############################################################################
-## Data reshaping
-SAMPLE_2D_SIZE = math.ceil (math.sqrt (X_train.shape [1]))# 7x7
-SIZE = math.ceil (math.sqrt (X_train.shape [1]))# 7x7
-print (SAMPLE_2D_SIZE)
-
-X_train.resize ((X_train.shape[0], SAMPLE_2D_SIZE, SAMPLE_2D_SIZE))
-X_train = X_train.reshape ((X_train.shape[0], SIZE, SIZE, 1))
-X_val.resize ((X_val.shape[0], SAMPLE_2D_SIZE, SAMPLE_2D_SIZE))
-X_val = X_val.reshape ((X_val.shape[0], SIZE, SIZE, 1))
-X_test.resize ((X_test.shape[0], SAMPLE_2D_SIZE, SAMPLE_2D_SIZE))
-X_test = X_test.reshape ((X_test.shape[0], SIZE, SIZE, 1))
-print (X_train.shape)
-print (X_val.shape)
-print (X_test.shape)
 
 ################################################################################
 ### Hyperparameter tuning
@@ -322,7 +340,7 @@ print ('\nPerformance on TRAIN set:')
 y_pred = clf.predict (X_train)
 y_pred = y_pred.round ()
 my_confusion_matrix = confusion_matrix (y_train, y_pred,
-                                        labels = df [TARGET].unique ())
+                                        labels = [0, 1])
 tn, fp, fn, tp = my_confusion_matrix.ravel ()
 print ('Confusion matrix:')
 print (my_confusion_matrix)
@@ -331,7 +349,7 @@ print ('Precision:', precision_score (y_train, y_pred, average = 'macro'))
 print ('Recall:', recall_score (y_train, y_pred, average = 'macro'))
 print ('F1:', f1_score (y_train, y_pred, average = 'macro'))
 print ('Cohen Kappa:', cohen_kappa_score (y_train, y_pred,
-                       labels = df [TARGET].unique ()))
+                       labels = [0, 1]))
 print ('TP:', tp)
 print ('TN:', tn)
 print ('FP:', fp)
@@ -343,7 +361,7 @@ print ('\nPerformance on TEST set:')
 y_pred = clf.predict (X_test)
 y_pred = y_pred.round ()
 my_confusion_matrix = confusion_matrix (y_test, y_pred,
-                                        labels = df [TARGET].unique ())
+                                        labels = [0, 1])
 tn, fp, fn, tp = my_confusion_matrix.ravel ()
 print ('Confusion matrix:')
 print (my_confusion_matrix)
@@ -352,7 +370,7 @@ print ('Precision:', precision_score (y_test, y_pred, average = 'macro'))
 print ('Recall:', recall_score (y_test, y_pred, average = 'macro'))
 print ('F1:', f1_score (y_test, y_pred, average = 'macro'))
 print ('Cohen Kappa:', cohen_kappa_score (y_test, y_pred,
-                       labels = df [TARGET].unique ()))
+                       labels = [0, 1]))
 print ('TP:', tp)
 print ('TN:', tn)
 print ('FP:', fp)
@@ -0,0 +1,48 @@
+# Author: Kaylani Bochie
+# github.com/kaylani2
+# kaylani AT gta DOT ufrj DOT br
+
+### K: Inspect or invalidate the cleaned dataset cache (see load_clean_dataset)
+### and the feature store (see feature_store).
+import sys
+from unit import list_cache, clear_cache
+
+
+###############################################################################
+## Define constants
+###############################################################################
+BOT_IOT_DIRECTORY = '../../../../datasets/bot-iot/'
+CACHE_DIRECTORY = BOT_IOT_DIRECTORY + 'cache/'
+FEATURE_DIRECTORY = CACHE_DIRECTORY + 'features/'
+USAGE = 'Usage: python dataset_cache.py {list,clear} [key]'
+
+try:
+  command = sys.argv [1]
+except:
+  print (USAGE)
+  sys.exit (1)
+
+
+if (command == 'list'):
+  for directory in [CACHE_DIRECTORY, FEATURE_DIRECTORY]:
+    entries = list_cache (directory)
+    print ('Key | shape | MB | created')
+    for entry in entries:
+      print (entry ['key'], '|', entry ['shape'], '|',
+             round (entry ['size'] / 2**20, 2), '|', entry ['created'])
+      for file_name in entry ['files']:
+        print ('   ', file_name)
+    print (len (entries), 'entries in', directory, '\n')
+elif (command == 'clear'):
+  key = None
+  if (len (sys.argv) > 2):
+    key = sys.argv [2]
+  removed = []
+  for directory in [CACHE_DIRECTORY, FEATURE_DIRECTORY]:
+    removed += clear_cache (directory, key)
+  for key in removed:
+    print ('Removed', key)
+  print (len (removed), 'entries removed.')
+else:
+  print (USAGE)
+  sys.exit (1)
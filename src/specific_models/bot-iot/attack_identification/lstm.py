@@ -11,7 +11,10 @@ import math
 import numpy as np
 from numpy import mean, std
 from unit import remove_columns_with_one_value, remove_nan_columns, load_dataset
+from unit import load_schema, load_clean_dataset, feature_store
 from unit import display_general_information, display_feature_distribution
+from unit import binned_mutual_info, feature_scores, PrecomputedScores
+from unit import rank_features, successive_halving, EpochEvaluator
 from collections import Counter
 #from imblearn.over_sampling import RandomOverSampler, RandomUnderSampler
 import sklearn
@@ -34,6 +37,7 @@ from sklearn.model_selection import cross_val_score
 from sklearn.decomposition import PCA
 from sklearn.feature_selection import SelectKBest
 from sklearn.feature_selection import f_classif, chi2, mutual_info_classif
+from functools import partial
 from sklearn.utils import class_weight
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
@@ -61,10 +65,17 @@ BOT_IOT_FILE_FULL_SCHEMA = 'UNSW_2018_IoT_Botnet_Dataset_{}.csv' # 1 - 74
 FULL_FILES = 74
 FILE_NAME = BOT_IOT_DIRECTORY + BOT_IOT_FILE_5_PERCENT_SCHEMA
 FEATURES = BOT_IOT_DIRECTORY + BOT_IOT_FEATURE_NAMES
+CACHE_DIRECTORY = BOT_IOT_DIRECTORY + 'cache/'
 NAN_VALUES = ['?', '.']
 TARGET = 'attack'
 INDEX_COLUMN = 'pkSeqID'
 LABELS = ['attack', 'category', 'subcategory']
+CATEGORICAL_COLUMNS = ['flgs', 'proto', 'sport', 'dport', 'state']
+FEATURE_DIRECTORY = CACHE_DIRECTORY + 'features/'
+TEST_SIZE = 3/10
+VALIDATION_SIZE = 1/4
+NUMBER_OF_FEATURES = 9 #'all'
+STEPS = 3
 STATE = 0
 try:
   STATE = int (sys.argv [1])
@@ -76,188 +87,200 @@ print ('STATE:', STATE)
 
 
 ###############################################################################
-## Load dataset
-###############################################################################
-df = load_dataset (FILE_NAME, FIVE_PERCENT_FILES, INDEX_COLUMN, NAN_VALUES)
-
-
-###############################################################################
-## Clean dataset
-###############################################################################
-###############################################################################
-### Remove columns with only one value
-df, log = remove_columns_with_one_value (df, verbose = False)
-print (log)
-
-
-###############################################################################
-### Remove redundant columns, useless columns and unused targets
-### K: _number columns are numerical representations of other existing columns.
-### K: category and subcategory are other labels.
-### K: saddr and daddr may specialize the model to a single network
-redundant_columns = ['state_number', 'proto_number', 'flgs_number']
-other_targets = ['category', 'subcategory']
-misc_columns = ['saddr', 'daddr']
-print ('Removing redundant columns:', redundant_columns)
-print ('Removing useless targets:', other_targets)
-print ('Removing misc columns:', misc_columns)
-columns_to_remove = redundant_columns + other_targets + misc_columns
-df.drop (axis = 'columns', columns = columns_to_remove, inplace = True)
-
+## Build features (load, clean, split, normalize, select)
 ###############################################################################
-### Remove NaN columns (with a lot of NaN values)
-df, log = remove_nan_columns (df, 1/2, verbose = False)
-print (log)
-
-###############################################################################
-### Encode categorical features
-print ('Encoding categorical features (ordinal encoding).')
-my_encoder = OrdinalEncoder ()
-df ['flgs'] = my_encoder.fit_transform (df ['flgs'].values.reshape (-1, 1))
-df ['proto'] = my_encoder.fit_transform (df ['proto'].values.reshape (-1, 1))
-df ['sport'] = my_encoder.fit_transform (df ['sport'].astype (str).values.reshape (-1, 1))
-df ['dport'] = my_encoder.fit_transform (df ['dport'].astype (str).values.reshape (-1, 1))
-df ['state'] = my_encoder.fit_transform (df ['state'].values.reshape (-1, 1))
-print ('Objects:', list (df.select_dtypes ( ['object']).columns))
-
-
-###############################################################################
-## Quick sanity check
-###############################################################################
-display_general_information (df)
-
-
-###############################################################################
-## Split dataset into train and test sets
-###############################################################################
-### K: Dataset is too big? Drop.
-# drop_indices = np.random.choice (df.index, int (df.shape [0] * 0.5),
-#                                  replace = False)
-# df = df.drop (drop_indices)
-TEST_SIZE = 3/10
-VALIDATION_SIZE = 1/4
-print ('Splitting dataset (test/train):', TEST_SIZE)
-X_train_df, X_test_df, y_train_df, y_test_df = train_test_split (
-                                               df.loc [:, df.columns != TARGET],
-                                               df [TARGET],
-                                               test_size = TEST_SIZE,
+### K: Everything below runs only when the feature store has no entry
+### for this STATE. The dataframes and intermediate copies are local and
+### released when build_features returns.
+def build_features ():
+  #############################################################################
+  ## Load and clean dataset
+  #############################################################################
+  ### K: _number columns are numerical representations of other existing columns.
+  ### K: category and subcategory are other labels.
+  ### K: saddr and daddr may specialize the model to a single network
+  redundant_columns = ['state_number', 'proto_number', 'flgs_number']
+  other_targets = ['category', 'subcategory']
+  misc_columns = ['saddr', 'daddr']
+  print ('Removing redundant columns:', redundant_columns)
+  print ('Removing useless targets:', other_targets)
+  print ('Removing misc columns:', misc_columns)
+  columns_to_remove = redundant_columns + other_targets + misc_columns
+  ### K: Removed columns are never parsed. The cleaned dataset is cached, warm
+  ### runs skip the CSV files (python dataset_cache.py {list,clear}).
+  schema = load_schema (FEATURES, drop_columns = columns_to_remove)
+  df = load_clean_dataset (FILE_NAME, FIVE_PERCENT_FILES, INDEX_COLUMN,
+                           NAN_VALUES, columns_to_remove = columns_to_remove,
+                           nan_threshold = 1/2,
+                           categorical_columns = CATEGORICAL_COLUMNS,
+                           string_columns = ['sport', 'dport'],
+                           cache_directory = CACHE_DIRECTORY, n_jobs = -1,
+                           schema = schema, compact = True)
+
+
+  #############################################################################
+  ## Quick sanity check
+  #############################################################################
+  display_general_information (df, cache_directory = CACHE_DIRECTORY)
+
+
+  #############################################################################
+  ## Split dataset into train and test sets
+  #############################################################################
+  ### K: Dataset is too big? Drop.
+  # drop_indices = np.random.choice (df.index, int (df.shape [0] * 0.5),
+  #                                  replace = False)
+  # df = df.drop (drop_indices)
+  print ('Splitting dataset (test/train):', TEST_SIZE)
+  X_train_df, X_test_df, y_train_df, y_test_df = train_test_split (
+                                                 df.loc [:, df.columns != TARGET],
+                                                 df [TARGET],
+                                                 test_size = TEST_SIZE,
+                                                 random_state = STATE,)
+  print ('Splitting dataset (validation/train):', VALIDATION_SIZE)
+  X_train_df, X_val_df, y_train_df, y_val_df = train_test_split (
+                                               X_train_df,
+                                               y_train_df,
+                                               test_size = VALIDATION_SIZE,
                                                random_state = STATE,)
-print ('Splitting dataset (validation/train):', VALIDATION_SIZE)
-X_train_df, X_val_df, y_train_df, y_val_df = train_test_split (
-                                             X_train_df,
-                                             y_train_df,
-                                             test_size = VALIDATION_SIZE,
-                                             random_state = STATE,)
-X_train_df.sort_index (inplace = True)
-y_train_df.sort_index (inplace = True)
-X_val_df.sort_index (inplace = True)
-y_val_df.sort_index (inplace = True)
-X_test_df.sort_index (inplace = True)
-y_test_df.sort_index (inplace = True)
-print ('X_train_df shape:', X_train_df.shape)
-print ('y_train_df shape:', y_train_df.shape)
-print ('X_val_df shape:', X_val_df.shape)
-print ('y_val_df shape:', y_val_df.shape)
-print ('X_test_df shape:', X_test_df.shape)
-print ('y_test_df shape:', y_test_df.shape)
-
-
-###############################################################################
-## Convert dataframe to a numpy array
-###############################################################################
-print ('\nConverting dataframe to numpy array.')
-X_train = X_train_df.values
-y_train = y_train_df.values
-X_val = X_val_df.values
-y_val = y_val_df.values
-X_test = X_test_df.values
-y_test = y_test_df.values
-print ('X_train shape:', X_train.shape)
-print ('y_train shape:', y_train.shape)
-print ('X_val shape:', X_val.shape)
-print ('y_val shape:', y_val.shape)
-print ('X_test shape:', X_test.shape)
-print ('y_test shape:', y_test.shape)
-
-
-###############################################################################
-## Apply normalization
-###############################################################################
-### K: NOTE: Only use derived information from the train set to avoid leakage.
-print ('\nApplying normalization.')
-startTime = time.time ()
-scaler = StandardScaler ()
-#scaler = MinMaxScaler (feature_range = (0, 1))
-scaler.fit (X_train)
-X_train = scaler.transform (X_train)
-X_val = scaler.transform (X_val)
-X_test = scaler.transform (X_test)
-print (str (time.time () - startTime), 'to normalize data.')
+  X_train_df.sort_index (inplace = True)
+  y_train_df.sort_index (inplace = True)
+  X_val_df.sort_index (inplace = True)
+  y_val_df.sort_index (inplace = True)
+  X_test_df.sort_index (inplace = True)
+  y_test_df.sort_index (inplace = True)
+  print ('X_train_df shape:', X_train_df.shape)
+  print ('y_train_df shape:', y_train_df.shape)
+  print ('X_val_df shape:', X_val_df.shape)
+  print ('y_val_df shape:', y_val_df.shape)
+  print ('X_test_df shape:', X_test_df.shape)
+  print ('y_test_df shape:', y_test_df.shape)
+
+
+  #############################################################################
+  ## Convert dataframe to a numpy array
+  #############################################################################
+  print ('\nConverting dataframe to numpy array.')
+  X_train = X_train_df.values
+  y_train = y_train_df.values
+  X_val = X_val_df.values
+  y_val = y_val_df.values
+  X_test = X_test_df.values
+  y_test = y_test_df.values
+  print ('X_train shape:', X_train.shape)
+  print ('y_train shape:', y_train.shape)
+  print ('X_val shape:', X_val.shape)
+  print ('y_val shape:', y_val.shape)
+  print ('X_test shape:', X_test.shape)
+  print ('y_test shape:', y_test.shape)
+
+
+  #############################################################################
+  ## Apply normalization
+  #############################################################################
+  ### K: NOTE: Only use derived information from the train set to avoid leakage.
+  print ('\nApplying normalization.')
+  startTime = time.time ()
+  scaler = StandardScaler ()
+  #scaler = MinMaxScaler (feature_range = (0, 1))
+  scaler.fit (X_train)
+  X_train = scaler.transform (X_train)
+  X_val = scaler.transform (X_val)
+  X_test = scaler.transform (X_test)
+  print (str (time.time () - startTime), 'to normalize data.')
+
+
+  #############################################################################
+  ## Perform feature selection
+  #############################################################################
+  print ('\nSelecting top', NUMBER_OF_FEATURES, 'features.')
+  startTime = time.time ()
+  #fs = SelectKBest (score_func = partial (binned_mutual_info, n_jobs = -1),
+  #                  k = NUMBER_OF_FEATURES)
+  ### K: ~30 minutes to FAIL fit mutual_info_classif to 5% bot-iot, the
+  ### binned estimate (contingency tables, one thread per feature) takes
+  ### seconds. Use subsample = ... to score a stratified subsample.
+  #fs = SelectKBest (score_func = chi2, k = NUMBER_OF_FEATURES) # X must be >= 0
+  ### K: ~4 seconds to fit chi2 to 5% bot-iot (MinMaxScaler (0, 1))
+  ### K: Scores are computed once per split and cached, fitting the
+  ### selector only picks the best ones. Only f_classif is used here, add
+  ### 'chi2' or 'mutual_info' to scorers to switch.
+  scores = feature_scores (X_train, y_train, scorers = ('f_classif',),
+                           cache_directory = CACHE_DIRECTORY)
+  fs = SelectKBest (score_func = PrecomputedScores (scores ['f_classif']),
+                    k = NUMBER_OF_FEATURES)
+  ### K: ~4 seconds to fit f_classif to 5% bot-iot
+  fs.fit (X_train, y_train)
+  X_train = fs.transform (X_train)
+  X_val = fs.transform (X_val)
+  X_test = fs.transform (X_test)
+  print (str (time.time () - startTime), 'to select features.')
+  print ('X_train shape:', X_train.shape)
+  print ('y_train shape:', y_train.shape)
+  print ('X_val shape:', X_val.shape)
+  print ('y_val shape:', y_val.shape)
+  print ('X_test shape:', X_test.shape)
+  print ('y_test shape:', y_test.shape)
+  for feature, score in rank_features (fs.scores_):
+    print ('Feature %d: %f' % (feature, score))
+
+
+  #############################################################################
+  ## Rearrange samples for RNN
+  #############################################################################
+  print ('\nRearranging dataset for the RNN.')
+  print ('X_train shape:', X_train.shape)
+  print ('y_train shape:', y_train.shape)
+  print ('X_val shape:', X_val.shape)
+  print ('y_val shape:', y_val.shape)
+  print ('y_test shape:', y_test.shape)
+
+  NUMBER_OF_INPUTS = X_train.shape [1]
+  def window_stack (a, stride = 1, numberOfSteps = 3):
+      return np.hstack ( [ a [i:1+i-numberOfSteps or None:stride] for i in range (0,numberOfSteps) ])
+
+  X_train = window_stack (X_train, stride = 1, numberOfSteps = STEPS)
+  X_train = X_train.reshape (X_train.shape [0], STEPS, NUMBER_OF_INPUTS)
+  X_val = window_stack (X_val, stride = 1, numberOfSteps = STEPS)
+  X_val = X_val.reshape (X_val.shape [0], STEPS, NUMBER_OF_INPUTS)
+  X_test = window_stack (X_test, stride = 1, numberOfSteps = STEPS)
+  X_test = X_test.reshape (X_test.shape [0], STEPS, NUMBER_OF_INPUTS)
+
+  y_train = y_train [ (STEPS - 1):]
+  y_val = y_val [ (STEPS - 1):]
+  y_test = y_test [ (STEPS - 1):]
+
+  print ('X_train shape:', X_train.shape)
+  print ('y_train shape:', y_train.shape)
+  print ('X_val shape:', X_val.shape)
+  print ('y_val shape:', y_val.shape)
+  print ('X_test shape:', X_test.shape)
+  print ('y_test shape:', y_test.shape)
+  return {'X_train': X_train, 'y_train': y_train, 'X_val': X_val,
+          'y_val': y_val, 'X_test': X_test, 'y_test': y_test}
 
 
 ###############################################################################
-## Perform feature selection
+## Load features (memory-mapped)
 ###############################################################################
-NUMBER_OF_FEATURES = 9 #'all'
-print ('\nSelecting top', NUMBER_OF_FEATURES, 'features.')
-startTime = time.time ()
-#fs = SelectKBest (score_func = mutual_info_classif, k = NUMBER_OF_FEATURES)
-### K: ~30 minutes to FAIL fit mutual_info_classif to 5% bot-iot
-#fs = SelectKBest (score_func = chi2, k = NUMBER_OF_FEATURES) # X must be >= 0
-### K: ~4 seconds to fit chi2 to 5% bot-iot (MinMaxScaler (0, 1))
-fs = SelectKBest (score_func = f_classif, k = NUMBER_OF_FEATURES)
-### K: ~4 seconds to fit f_classif to 5% bot-iot
-fs.fit (X_train, y_train)
-X_train = fs.transform (X_train)
-X_val = fs.transform (X_val)
-X_test = fs.transform (X_test)
-print (str (time.time () - startTime), 'to select features.')
-print ('X_train shape:', X_train.shape)
-print ('y_train shape:', y_train.shape)
-print ('X_val shape:', X_val.shape)
-print ('y_val shape:', y_val.shape)
-print ('X_test shape:', X_test.shape)
-print ('y_test shape:', y_test.shape)
-bestFeatures = []
-for feature in range (len (fs.scores_)):
-  bestFeatures.append ({'f': feature, 's': fs.scores_ [feature]})
-bestFeatures = sorted (bestFeatures, key = lambda k: k ['s'])
-for feature in bestFeatures:
-  print ('Feature %d: %f' % (feature ['f'], feature ['s']))
-
-
-###############################################################################
-## Rearrange samples for RNN
-###############################################################################
-print ('\nRearranging dataset for the RNN.')
-print ('X_train shape:', X_train.shape)
-print ('y_train shape:', y_train.shape)
-print ('X_val shape:', X_val.shape)
-print ('y_val shape:', y_val.shape)
-print ('y_test shape:', y_test.shape)
-
-STEPS = 3
-FEATURES = X_train.shape [1]
-def window_stack (a, stride = 1, numberOfSteps = 3):
-    return np.hstack ( [ a [i:1+i-numberOfSteps or None:stride] for i in range (0,numberOfSteps) ])
-
-X_train = window_stack (X_train, stride = 1, numberOfSteps = STEPS)
-X_train = X_train.reshape (X_train.shape [0], STEPS, FEATURES)
-X_val = window_stack (X_val, stride = 1, numberOfSteps = STEPS)
-X_val = X_val.reshape (X_val.shape [0], STEPS, FEATURES)
-X_test = window_stack (X_test, stride = 1, numberOfSteps = STEPS)
-X_test = X_test.reshape (X_test.shape [0], STEPS, FEATURES)
-
-y_train = y_train [ (STEPS - 1):]
-y_val = y_val [ (STEPS - 1):]
-y_test = y_test [ (STEPS - 1):]
-
+### K: The entry is keyed by STATE, the source of build_features and the
+### constants it reads, editing any of them builds a new one.
+features = feature_store (FEATURE_DIRECTORY, build_features, STATE,
+                          {'script': 'lstm', 'test': TEST_SIZE,
+                           'validation': VALIDATION_SIZE,
+                           'k': NUMBER_OF_FEATURES, 'steps': STEPS,
+                           'target': TARGET, 'index': INDEX_COLUMN,
+                           'nan_values': NAN_VALUES, 'schema': FEATURES,
+                           'categorical': CATEGORICAL_COLUMNS},
+                          file_names = [FILE_NAME.format (file_number)
+                                        for file_number in
+                                        range (1, FIVE_PERCENT_FILES + 1)])
+X_train, y_train = features ['X_train'], features ['y_train']
+X_val, y_val = features ['X_val'], features ['y_val']
+X_test, y_test = features ['X_test'], features ['y_test']
 print ('X_train shape:', X_train.shape)
-print ('y_train shape:', y_train.shape)
 print ('X_val shape:', X_val.shape)
-print ('y_val shape:', y_val.shape)
 print ('X_test shape:', X_test.shape)
-print ('y_test shape:', y_test.shape)
 
 
 ###############################################################################
@@ -276,7 +299,6 @@ def create_model (learn_rate = 0.01, dropout_rate = 0.0, weight_constraint = 0,
   model.compile (optimizer = 'adam', loss = 'binary_crossentropy',)
   return model
 
-model = KerasClassifier (build_fn = create_model, verbose = 2)
 batch_size = [5000, 1000]#10, 30, 50]
 epochs = [5]#, 5, 10]
 learn_rate = [0.001, 0.01, 0.1]
@@ -286,20 +308,15 @@ units = [10, 50, 100]
 param_grid = dict (batch_size = batch_size, epochs = epochs,
                    dropout_rate = dropout_rate, learn_rate = learn_rate,
                    weight_constraint = weight_constraint, units = units)
-grid = GridSearchCV (estimator = model, param_grid = param_grid,
-                     scoring = 'f1_weighted', cv = myPreSplit, verbose = 2,
-                     n_jobs = -1)
-
-grid_result = grid.fit (np.concatenate ( (X_train, X_val), axis = 0),
-                        np.concatenate ( (y_train, y_val), axis = 0))
-print (grid_result.best_params_)
-
-print ("Best: %f using %s" % (grid_result.best_score_, grid_result.best_params_))
-means = grid_result.cv_results_ ['mean_test_score']
-stds = grid_result.cv_results_ ['std_test_score']
-params = grid_result.cv_results_ ['params']
-for mean, stdev, param in zip (means, stds, params):
-  print ("%f (%f) with: %r" % (mean, stdev, param))
+### K: Successive halving over the epochs (validation f1_weighted): 1/3 of
+### the candidates survive each rung, survivors resume training.
+MIN_EPOCHS = 1
+evaluate = EpochEvaluator (create_model, X_train, y_train, X_val, y_val,
+                           score = lambda y, y_pred: f1_score (y, y_pred > 0.5,
+                                                     average = 'weighted'))
+result = successive_halving (evaluate, param_grid, MIN_EPOCHS, max (epochs))
+
+print ("Best: %f using %s" % (result ['best_score'], result ['best_params']))
 sys.exit ()
 '''
 
@@ -360,7 +377,7 @@ print ('\nPerformance on TRAIN set:')
 y_pred = clf.predict (X_train)
 y_pred = y_pred.round ()
 my_confusion_matrix = confusion_matrix (y_train, y_pred,
-                                        labels = df [TARGET].unique ())
+                                        labels = [0, 1])
 tn, fp, fn, tp = my_confusion_matrix.ravel ()
 print ('Confusion matrix:')
 print (my_confusion_matrix)
@@ -369,7 +386,7 @@ print ('Precision:', precision_score (y_train, y_pred, average = 'macro'))
 print ('Recall:', recall_score (y_train, y_pred, average = 'macro'))
 print ('F1:', f1_score (y_train, y_pred, average = 'macro'))
 print ('Cohen Kappa:', cohen_kappa_score (y_train, y_pred,
-                       labels = df [TARGET].unique ()))
+                       labels = [0, 1]))
 print ('TP:', tp)
 print ('TN:', tn)
 print ('FP:', fp)
@@ -382,7 +399,7 @@ print ('\nPerformance on TEST set:')
 y_pred = clf.predict (X_test)
 y_pred = y_pred.round ()
 my_confusion_matrix = confusion_matrix (y_test, y_pred,
-                                        labels = df [TARGET].unique ())
+                                        labels = [0, 1])
 tn, fp, fn, tp = my_confusion_matrix.ravel ()
 print ('Confusion matrix:')
 print (my_confusion_matrix)
@@ -391,7 +408,7 @@ print ('Precision:', precision_score (y_test, y_pred, average = 'macro'))
 print ('Recall:', recall_score (y_test, y_pred, average = 'macro'))
 print ('F1:', f1_score (y_test, y_pred, average = 'macro'))
 print ('Cohen Kappa:', cohen_kappa_score (y_test, y_pred,
-                       labels = df [TARGET].unique ()))
+                       labels = [0, 1]))
 print ('TP:', tp)
 print ('TN:', tn)
 print ('FP:', fp)
@@ -11,6 +11,7 @@ import math
 import numpy as np
 from numpy import mean, std
 from unit import remove_columns_with_one_value, remove_nan_columns, load_dataset
+from unit import load_schema, load_clean_dataset
 from unit import display_general_information, display_feature_distribution
 from collections import Counter
 #from imblearn.over_sampling import RandomOverSampler, RandomUnderSampler
@@ -61,10 +62,12 @@ BOT_IOT_FILE_FULL_SCHEMA = 'UNSW_2018_IoT_Botnet_Dataset_{}.csv' # 1 - 74
 FULL_FILES = 74
 FILE_NAME = BOT_IOT_DIRECTORY + BOT_IOT_FILE_5_PERCENT_SCHEMA
 FEATURES = BOT_IOT_DIRECTORY + BOT_IOT_FEATURE_NAMES
+CACHE_DIRECTORY = BOT_IOT_DIRECTORY + 'cache/'
 NAN_VALUES = ['?', '.']
 TARGET = 'attack'
 INDEX_COLUMN = 'pkSeqID'
 LABELS = ['attack', 'category', 'subcategory']
+CATEGORICAL_COLUMNS = ['flgs', 'proto', 'sport', 'dport', 'state']
 STATE = 0
 try:
   STATE = int (sys.argv [1])
@@ -76,22 +79,8 @@ print ('STATE:', STATE)
 
 
 ###############################################################################
-## Load dataset
+## Load and clean dataset
 ###############################################################################
-df = load_dataset (FILE_NAME, FIVE_PERCENT_FILES, INDEX_COLUMN, NAN_VALUES)
-
-
-###############################################################################
-## Clean dataset
-###############################################################################
-###############################################################################
-### Remove columns with only one value
-df, log = remove_columns_with_one_value (df, verbose = False)
-print (log)
-
-
-###############################################################################
-### Remove redundant columns, useless columns and unused targets
 ### K: _number columns are numerical representations of other existing columns.
 ### K: category and subcategory are other labels.
 ### K: saddr and daddr may specialize the model to a single network
@@ -102,29 +91,22 @@ print ('Removing redundant columns:', redundant_columns)
 print ('Removing useless targets:', other_targets)
 print ('Removing misc columns:', misc_columns)
 columns_to_remove = redundant_columns + other_targets + misc_columns
-df.drop (axis = 'columns', columns = columns_to_remove, inplace = True)
-
-###############################################################################
-### Remove NaN columns (with a lot of NaN values)
-df, log = remove_nan_columns (df, 1/2, verbose = False)
-print (log)
-
-###############################################################################
-### Encode categorical features
-print ('Encoding categorical features (ordinal encoding).')
-my_encoder = OrdinalEncoder ()
-df ['flgs'] = my_encoder.fit_transform (df ['flgs'].values.reshape (-1, 1))
-df ['proto'] = my_encoder.fit_transform (df ['proto'].values.reshape (-1, 1))
-df ['sport'] = my_encoder.fit_transform (df ['sport'].astype (str).values.reshape (-1, 1))
-df ['dport'] = my_encoder.fit_transform (df ['dport'].astype (str).values.reshape (-1, 1))
-df ['state'] = my_encoder.fit_transform (df ['state'].values.reshape (-1, 1))
-print ('Objects:', list (df.select_dtypes ( ['object']).columns))
+### K: Removed columns are never parsed. The cleaned dataset is cached, warm
+### runs skip the CSV files (python dataset_cache.py {list,clear}).
+schema = load_schema (FEATURES, drop_columns = columns_to_remove)
+df = load_clean_dataset (FILE_NAME, FIVE_PERCENT_FILES, INDEX_COLUMN,
+                         NAN_VALUES, columns_to_remove = columns_to_remove,
+                         nan_threshold = 1/2,
+                         categorical_columns = CATEGORICAL_COLUMNS,
+                         string_columns = ['sport', 'dport'],
+                         cache_directory = CACHE_DIRECTORY, n_jobs = -1,
+                         schema = schema, compact = True)
 
 
 ###############################################################################
 ## Quick sanity check
 ###############################################################################
-display_general_information (df)
+display_general_information (df, cache_directory = CACHE_DIRECTORY)
 
 
 ###############################################################################
@@ -0,0 +1,138 @@
+# Author: Kaylani Bochie
+# github.com/kaylani2
+# kaylani AT gta DOT ufrj DOT br
+
+### K: Model: Multilayer Perceptron (full dataset, out-of-core)
+### K: The full dataset does not fit in memory. Cleaning, encoding, scaling and
+### feature selection are fitted in one streaming pass (StreamingPipeline) and
+### the network is trained from batch generators, so memory is bounded by
+### CHUNK_SIZE instead of the dataset size.
+import sys
+import time
+import numpy as np
+from functools import partial
+from unit import load_schema, stream_dataset, StreamingPipeline
+from sklearn.metrics import confusion_matrix
+import keras.utils
+from keras.models import Sequential
+from keras.layers import Dense, Dropout
+from keras.optimizers import Adam
+
+
+###############################################################################
+## Define constants
+###############################################################################
+BOT_IOT_DIRECTORY = '../../../../datasets/bot-iot/'
+BOT_IOT_FEATURE_NAMES = 'UNSW_2018_IoT_Botnet_Dataset_Feature_Names.csv'
+BOT_IOT_FILE_5_PERCENT_SCHEMA = 'UNSW_2018_IoT_Botnet_Full5pc_{}.csv' # 1 - 4
+FIVE_PERCENT_FILES = 4
+BOT_IOT_FILE_FULL_SCHEMA = 'UNSW_2018_IoT_Botnet_Dataset_{}.csv' # 1 - 74
+FULL_FILES = 74
+FILE_NAME = BOT_IOT_DIRECTORY + BOT_IOT_FILE_FULL_SCHEMA
+FEATURES = BOT_IOT_DIRECTORY + BOT_IOT_FEATURE_NAMES
+NAN_VALUES = ['?', '.']
+TARGET = 'attack'
+INDEX_COLUMN = 'pkSeqID'
+CATEGORICAL_COLUMNS = ['flgs', 'proto', 'sport', 'dport', 'state']
+CHUNK_SIZE = 500000
+STATE = 0
+try:
+  STATE = int (sys.argv [1])
+except:
+  pass
+np.random.seed (STATE)
+print ('STATE:', STATE)
+
+
+###############################################################################
+## Stream dataset
+###############################################################################
+### K: saddr, daddr, _number columns and the other targets are never parsed.
+schema = load_schema (FEATURES)
+chunks = partial (stream_dataset, FILE_NAME, FULL_FILES, INDEX_COLUMN,
+                  NAN_VALUES, schema, chunksize = CHUNK_SIZE, verbose = False)
+
+
+###############################################################################
+## Fit cleaning, encoding, normalization and feature selection (train only)
+###############################################################################
+TEST_SIZE = 3/10
+NUMBER_OF_FEATURES = 9
+print ('\nFitting streaming pipeline (test/train):', TEST_SIZE)
+startTime = time.time ()
+pipeline = StreamingPipeline (TARGET, CATEGORICAL_COLUMNS,
+                              string_columns = ['sport', 'dport'],
+                              nan_threshold = 1/2,
+                              number_of_features = NUMBER_OF_FEATURES,
+                              test_size = TEST_SIZE, state = STATE)
+pipeline.fit (chunks)
+print (str (time.time () - startTime), 's to fit pipeline.')
+print ('Samples:', pipeline.rows)
+print ('Dropped columns:', pipeline.dropped_columns)
+print ('Selected features:', pipeline.selected_columns)
+bestFeatures = sorted (zip (pipeline.columns, pipeline.scores_),
+                       key = lambda k: -np.inf if np.isnan (k [1]) else k [1])
+for feature, score in bestFeatures:
+  print ('Feature %s: %f' % (feature, score))
+
+
+###############################################################################
+## Create learning model (MLP)
+###############################################################################
+BATCH_SIZE = 5000
+NUMBER_OF_EPOCHS = 3
+LEARNING_RATE = 0.001
+DROPOUT_RATE = 0.0
+print ('\nCreating learning model.')
+clf = Sequential ()
+clf.add (Dense (units = 64, activation = 'relu',
+                input_shape = (len (pipeline.selected_columns), )))
+clf.add (Dropout (DROPOUT_RATE))
+clf.add (Dense (32, activation = 'relu'))
+clf.add (Dense (1, activation = 'sigmoid'))
+clf.compile (loss = 'binary_crossentropy',
+             optimizer = Adam (lr = LEARNING_RATE),
+             metrics = ['accuracy'])
+clf.summary ()
+
+
+###############################################################################
+## Fit the network
+###############################################################################
+print ('\nFitting the network.')
+startTime = time.time ()
+history = clf.fit (pipeline.batches (chunks, BATCH_SIZE, subset = 'train'),
+                   steps_per_epoch = pipeline.steps (BATCH_SIZE, 'train'),
+                   epochs = NUMBER_OF_EPOCHS,
+                   verbose = 2) #1 = progress bar, not useful for logging
+print (str (time.time () - startTime), 's to train model.')
+
+
+###############################################################################
+## Evaluate performance
+###############################################################################
+def evaluate (subset):
+  my_confusion_matrix = np.zeros ((2, 2), dtype = np.int64)
+  for X, y in pipeline.batches (chunks, BATCH_SIZE, subset = subset,
+                                loop = False):
+    y_pred = (clf.predict (X) > 0.5).astype (int).ravel ()
+    my_confusion_matrix += confusion_matrix (y, y_pred, labels = [0, 1])
+  tn, fp, fn, tp = my_confusion_matrix.ravel ()
+  print ('Confusion matrix:')
+  print (my_confusion_matrix)
+  print ('Accuracy:', (tp + tn) / my_confusion_matrix.sum ())
+  print ('Precision:', tp / max (tp + fp, 1))
+  print ('Recall:', tp / max (tp + fn, 1))
+  print ('F1:', 2 * tp / max (2 * tp + fp + fn, 1))
+  print ('TP:', tp)
+  print ('TN:', tn)
+  print ('FP:', fp)
+  print ('FN:', fn)
+
+print ('\nPerformance on TRAIN set:')
+evaluate ('train')
+
+### K: Only before publishing... Don't peek.
+sys.exit ()
+print ('\nPerformance on TEST set:')
+evaluate ('test')
@@ -11,6 +11,7 @@ import math
 import numpy as np
 from numpy import mean, std
 from unit import remove_columns_with_one_value, remove_nan_columns, load_dataset
+from unit import load_schema, load_clean_dataset, run_states, STATES
 from unit import display_general_information, display_feature_distribution
 from collections import Counter
 #from imblearn.over_sampling import RandomOverSampler, RandomUnderSampler
@@ -61,173 +62,148 @@ BOT_IOT_FILE_FULL_SCHEMA = 'UNSW_2018_IoT_Botnet_Dataset_{}.csv' # 1 - 74
 FULL_FILES = 74
 FILE_NAME = BOT_IOT_DIRECTORY + BOT_IOT_FILE_5_PERCENT_SCHEMA
 FEATURES = BOT_IOT_DIRECTORY + BOT_IOT_FEATURE_NAMES
+CACHE_DIRECTORY = BOT_IOT_DIRECTORY + 'cache/'
 NAN_VALUES = ['?', '.']
 TARGET = 'attack'
 INDEX_COLUMN = 'pkSeqID'
 LABELS = ['attack', 'category', 'subcategory']
-STATE = 0
-try:
-  STATE = int (sys.argv [1])
-except:
-  pass
-#for STATE in [1, 2, 3, 4, 5]:
-np.random.seed (STATE)
-print ('STATE:', STATE)
-
-
-###############################################################################
-## Load dataset
-###############################################################################
-df = load_dataset (FILE_NAME, FIVE_PERCENT_FILES, INDEX_COLUMN, NAN_VALUES)
-
-
-###############################################################################
-## Clean dataset
-###############################################################################
-###############################################################################
-### Remove columns with only one value
-df, log = remove_columns_with_one_value (df, verbose = False)
-print (log)
-
-
-###############################################################################
-### Remove redundant columns, useless columns and unused targets
-### K: _number columns are numerical representations of other existing columns.
-### K: category and subcategory are other labels.
-### K: saddr and daddr may specialize the model to a single network
-redundant_columns = ['state_number', 'proto_number', 'flgs_number']
-other_targets = ['category', 'subcategory']
-misc_columns = ['saddr', 'daddr']
-print ('Removing redundant columns:', redundant_columns)
-print ('Removing useless targets:', other_targets)
-print ('Removing misc columns:', misc_columns)
-columns_to_remove = redundant_columns + other_targets + misc_columns
-df.drop (axis = 'columns', columns = columns_to_remove, inplace = True)
-
-###############################################################################
-### Remove NaN columns (with a lot of NaN values)
-df, log = remove_nan_columns (df, 1/2, verbose = False)
-print (log)
-
-###############################################################################
-### Encode categorical features
-print ('Encoding categorical features (ordinal encoding).')
-my_encoder = OrdinalEncoder ()
-df ['flgs'] = my_encoder.fit_transform (df ['flgs'].values.reshape (-1, 1))
-df ['proto'] = my_encoder.fit_transform (df ['proto'].values.reshape (-1, 1))
-df ['sport'] = my_encoder.fit_transform (df ['sport'].astype (str).values.reshape (-1, 1))
-df ['dport'] = my_encoder.fit_transform (df ['dport'].astype (str).values.reshape (-1, 1))
-df ['state'] = my_encoder.fit_transform (df ['state'].values.reshape (-1, 1))
-print ('Objects:', list (df.select_dtypes ( ['object']).columns))
-
-
-###############################################################################
-## Quick sanity check
-###############################################################################
-display_general_information (df)
-
-
-###############################################################################
-## Split dataset into train and test sets
-###############################################################################
-### K: Dataset is too big? Drop.
-# drop_indices = np.random.choice (df.index, int (df.shape [0] * 0.5),
-#                                  replace = False)
-# df = df.drop (drop_indices)
-TEST_SIZE = 3/10
-print ('Splitting dataset (test/train):', TEST_SIZE)
-X_train_df, X_test_df, y_train_df, y_test_df = train_test_split (
-                                               df.loc [:, df.columns != TARGET],
-                                               df [TARGET],
-                                               test_size = TEST_SIZE,
-                                               random_state = STATE,)
-print ('X_train_df shape:', X_train_df.shape)
-print ('y_train_df shape:', y_train_df.shape)
-print ('X_test_df shape:', X_test_df.shape)
-print ('y_test_df shape:', y_test_df.shape)
-
-
-###############################################################################
-## Define processing pipeline for training (hyperparameter are optimized)
-###############################################################################
-###############################################################################
-### standard_scaler ### K: Non object features
-object_features = (list (df.select_dtypes ( ['object']).columns))
-remaining_features = list (df.columns)
-for feature in object_features:
-  remaining_features.remove (feature)
-remaining_features.remove (TARGET)
-
-standard_scaler_features = remaining_features
-my_scaler = StandardScaler ()
-steps = list ()
-steps.append (('scaler', my_scaler))
-standard_scaler_transformer = Pipeline (steps)
-
-###############################################################################
-### Assemble column transformer
-preprocessor = ColumnTransformer (transformers = [
-              ('sca', standard_scaler_transformer, standard_scaler_features)])
-
-###############################################################################
-### feature selector
-NUMBER_OF_FEATURES = 9
-SCORE_FUNCTION = f_classif
-my_feature_selector = SelectKBest (score_func = SCORE_FUNCTION, k = NUMBER_OF_FEATURES)
-steps = list ()
-steps.append (('feature_selector', my_feature_selector))
-feature_selector_transformer = Pipeline (steps)
-
-###############################################################################
-### Assemble pipeline for training
-clf = GaussianNB ()
-clf = Pipeline (steps = [ ('preprocessor', preprocessor),
-                        ('feature_selector', feature_selector_transformer),
-                        ('classifier', clf)],
-                verbose = True)
-
-###############################################################################
-### Train
-startTime = time.time ()
-clf = clf.fit (X_train_df, y_train_df)
-print (str (time.time () - startTime), 's to train model.')
-
-
-###############################################################################
-## Evaluate performance
-###############################################################################
-print ('\nPerformance on TRAIN set:')
-y_pred = clf.predict (X_train_df)
-my_confusion_matrix = confusion_matrix (y_train_df, y_pred, labels = df [TARGET].unique ())
-tn, fp, fn, tp = my_confusion_matrix.ravel ()
-print ('Confusion matrix:')
-print (my_confusion_matrix)
-print ('Accuracy:', accuracy_score (y_train_df, y_pred))
-print ('Precision:', precision_score (y_train_df, y_pred, average = 'macro'))
-print ('Recall:', recall_score (y_train_df, y_pred, average = 'macro'))
-print ('F1:', f1_score (y_train_df, y_pred, average = 'macro'))
-print ('Cohen Kappa:', cohen_kappa_score (y_train_df, y_pred,
-                       labels = df [TARGET].unique ()))
-print ('TP:', tp)
-print ('TN:', tn)
-print ('FP:', fp)
-print ('FN:', fn)
-
+CATEGORICAL_COLUMNS = ['flgs', 'proto', 'sport', 'dport', 'state']
 ### K: Only before publishing... Don't peek.
-sys.exit ()
-print ('\nPerformance on TEST set:')
-y_pred = clf.predict (X_test_df)
-my_confusion_matrix = confusion_matrix (y_test_df, y_pred, labels = df [TARGET].unique ())
-tn, fp, fn, tp = my_confusion_matrix.ravel ()
-print ('Confusion matrix:')
-print (my_confusion_matrix)
-print ('Accuracy:', accuracy_score (y_test_df, y_pred))
-print ('Precision:', precision_score (y_test_df, y_pred, average = 'macro'))
-print ('Recall:', recall_score (y_test_df, y_pred, average = 'macro'))
-print ('F1:', f1_score (y_test_df, y_pred, average = 'macro'))
-print ('Cohen Kappa:', cohen_kappa_score (y_test_df, y_pred,
-                       labels = df [TARGET].unique ()))
-print ('TP:', tp)
-print ('TN:', tn)
-print ('FP:', fp)
-print ('FN:', fn)
+EVALUATE_TEST = False
+
+
+###############################################################################
+## Load and clean dataset (once, every state reuses it)
+###############################################################################
+def prepare ():
+  ### K: _number columns are numerical representations of other existing
+  ### columns.
+  ### K: category and subcategory are other labels.
+  ### K: saddr and daddr may specialize the model to a single network
+  redundant_columns = ['state_number', 'proto_number', 'flgs_number']
+  other_targets = ['category', 'subcategory']
+  misc_columns = ['saddr', 'daddr']
+  print ('Removing redundant columns:', redundant_columns)
+  print ('Removing useless targets:', other_targets)
+  print ('Removing misc columns:', misc_columns)
+  columns_to_remove = redundant_columns + other_targets + misc_columns
+  ### K: Removed columns are never parsed. The cleaned dataset is cached, warm
+  ### runs skip the CSV files (python dataset_cache.py {list,clear}).
+  schema = load_schema (FEATURES, drop_columns = columns_to_remove)
+  df = load_clean_dataset (FILE_NAME, FIVE_PERCENT_FILES, INDEX_COLUMN,
+                           NAN_VALUES, columns_to_remove = columns_to_remove,
+                           nan_threshold = 1/2,
+                           categorical_columns = CATEGORICAL_COLUMNS,
+                           string_columns = ['sport', 'dport'],
+                           cache_directory = CACHE_DIRECTORY, n_jobs = -1,
+                           schema = schema, compact = True)
+
+  #############################################################################
+  ## Quick sanity check
+  #############################################################################
+  display_general_information (df, cache_directory = CACHE_DIRECTORY)
+
+  ### K: Only the non object features are used (standard_scaler features).
+  ### K: Plain arrays, so the process pool can share them.
+  features = df.drop (columns = [TARGET]).select_dtypes (exclude = ['object'])
+  return {'X': features.to_numpy (dtype = np.float64),
+          'y': df [TARGET].to_numpy ()}
+
+
+###############################################################################
+## Split, train and evaluate (one state)
+###############################################################################
+def experiment (arrays, state):
+  np.random.seed (state)
+  X, y = arrays ['X'], arrays ['y']
+  ### K: Same order as df [TARGET].unique ().
+  labels = pd.unique (y)
+
+  #############################################################################
+  ## Split dataset into train and test sets
+  #############################################################################
+  TEST_SIZE = 3/10
+  print ('Splitting dataset (test/train):', TEST_SIZE)
+  X_train, X_test, y_train, y_test = train_test_split (X, y,
+                                                       test_size = TEST_SIZE,
+                                                       random_state = state,)
+  print ('X_train shape:', X_train.shape)
+  print ('y_train shape:', y_train.shape)
+  print ('X_test shape:', X_test.shape)
+  print ('y_test shape:', y_test.shape)
+
+  #############################################################################
+  ## Define processing pipeline for training (hyperparameter are optimized)
+  #############################################################################
+  ### standard_scaler ### K: Non object features (all columns of X)
+  my_scaler = StandardScaler ()
+
+  ### feature selector
+  NUMBER_OF_FEATURES = 9
+  SCORE_FUNCTION = f_classif
+  my_feature_selector = SelectKBest (score_func = SCORE_FUNCTION,
+                                     k = NUMBER_OF_FEATURES)
+
+  ### Assemble pipeline for training
+  clf = GaussianNB ()
+  clf = Pipeline (steps = [ ('scaler', my_scaler),
+                          ('feature_selector', my_feature_selector),
+                          ('classifier', clf)],
+                  verbose = True)
+
+  ### Train
+  startTime = time.time ()
+  clf = clf.fit (X_train, y_train)
+  print (str (time.time () - startTime), 's to train model.')
+
+  #############################################################################
+  ## Evaluate performance
+  #############################################################################
+  print ('\nPerformance on TRAIN set:')
+  y_pred = clf.predict (X_train)
+  my_confusion_matrix = confusion_matrix (y_train, y_pred, labels = labels)
+  tn, fp, fn, tp = my_confusion_matrix.ravel ()
+  print ('Confusion matrix:')
+  print (my_confusion_matrix)
+  print ('Accuracy:', accuracy_score (y_train, y_pred))
+  print ('Precision:', precision_score (y_train, y_pred, average = 'macro'))
+  print ('Recall:', recall_score (y_train, y_pred, average = 'macro'))
+  print ('F1:', f1_score (y_train, y_pred, average = 'macro'))
+  print ('Cohen Kappa:', cohen_kappa_score (y_train, y_pred, labels = labels))
+  print ('TP:', tp)
+  print ('TN:', tn)
+  print ('FP:', fp)
+  print ('FN:', fn)
+
+  ### K: Only before publishing... Don't peek (EVALUATE_TEST).
+  if (not EVALUATE_TEST):
+    return {'tp': tp, 'tn': tn, 'fp': fp, 'fn': fn}
+  print ('\nPerformance on TEST set:')
+  y_pred = clf.predict (X_test)
+  my_confusion_matrix = confusion_matrix (y_test, y_pred, labels = labels)
+  tn, fp, fn, tp = my_confusion_matrix.ravel ()
+  print ('Confusion matrix:')
+  print (my_confusion_matrix)
+  print ('Accuracy:', accuracy_score (y_test, y_pred))
+  print ('Precision:', precision_score (y_test, y_pred, average = 'macro'))
+  print ('Recall:', recall_score (y_test, y_pred, average = 'macro'))
+  print ('F1:', f1_score (y_test, y_pred, average = 'macro'))
+  print ('Cohen Kappa:', cohen_kappa_score (y_test, y_pred, labels = labels))
+  print ('TP:', tp)
+  print ('TN:', tn)
+  print ('FP:', fp)
+  print ('FN:', fn)
+  return {'tp': tp, 'tn': tn, 'fp': fp, 'fn': fn}
+
+
+###############################################################################
+## Run every state (python naive_bayes_CV.py [STATE] runs a single one)
+###############################################################################
+if (__name__ == '__main__'):
+  states = STATES
+  try:
+    states = [int (sys.argv [1])]
+  except:
+    pass
+  ### K: The dataset is loaded once and shared with one process per state.
+  run_states (prepare, experiment, states, n_jobs = -1)
@@ -2,11 +2,281 @@
 # github.com/kaylani2
 # kaylani AT gta DOT ufrj DOT br
 
+import io
+import os
+import math
+import json
+import time
+import shutil
+import hashlib
+import inspect
+import tempfile
+import contextlib
+import multiprocessing
 import pandas as pd
 import numpy as np
+from joblib import Memory
+from functools import partial
+from multiprocessing import shared_memory
+from sklearn.base import clone
+from sklearn.feature_selection import f_classif
+from sklearn.model_selection import ParameterGrid, cross_val_score
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+### K: Compact types for the columns listed in the Bot-IoT feature names file.
+### Columns that are not listed here (like the extra 5% features) are inferred.
+BOT_IOT_DTYPES = {'pkSeqID': np.int32, 'stime': np.float64,
+                  'flgs': 'category', 'flgs_number': np.int8,
+                  'proto': 'category', 'proto_number': np.int8,
+                  'saddr': 'category', 'sport': 'category',
+                  'daddr': 'category', 'dport': 'category',
+                  'pkts': np.int32, 'bytes': np.int64,
+                  'state': 'category', 'state_number': np.int8,
+                  'ltime': np.float64, 'seq': np.int32, 'dur': np.float32,
+                  'mean': np.float32, 'stddev': np.float32,
+                  'sum': np.float32, 'min': np.float32, 'max': np.float32,
+                  'spkts': np.int32, 'dpkts': np.int32,
+                  'sbytes': np.int64, 'dbytes': np.int64,
+                  'rate': np.float32, 'srate': np.float32,
+                  'drate': np.float32, 'attack': np.int8,
+                  'category': 'category', 'subcategory': 'category'}
+### K: _number columns are numerical representations of other existing columns.
+### K: category and subcategory are other labels.
+### K: saddr and daddr may specialize the model to a single network
+BOT_IOT_UNUSED_COLUMNS = ['state_number', 'proto_number', 'flgs_number',
+                          'category', 'subcategory', 'saddr', 'daddr']
+
+def load_schema (feature_file, drop_columns = BOT_IOT_UNUSED_COLUMNS,
+                 dtypes = BOT_IOT_DTYPES):
+  '''
+  Parameters:
+  -----------
+  feature_file: str
+    Bot-IoT feature names file (a single line of names separated by ';' or
+    ',').
+
+  drop_columns: list of str, default = BOT_IOT_UNUSED_COLUMNS
+    Columns that are never parsed.
+
+  dtypes: dict, default = BOT_IOT_DTYPES
+
+  Returns:
+  --------
+  schema: dict
+    'names' (every column, in file order), 'dtype' (for the parsed columns)
+    and 'drop' (columns skipped by read_csv).
+
+  Examples:
+  ---------
+  >>> schema = load_schema ('UNSW_2018_IoT_Botnet_Dataset_Feature_Names.csv')
+  '''
+  with open (feature_file) as f:
+    line = f.readline ().strip ()
+  separator = ';' if (';' in line) else ','
+  names = [name.strip ().strip ('"') for name in line.split (separator)]
+  names = [name for name in names if name]
+  drop_columns = list (drop_columns)
+  dtype = {name: dtypes [name] for name in names
+           if ((name in dtypes) and (name not in drop_columns))}
+  return {'names': names, 'dtype': dtype, 'drop': drop_columns}
+
+def _read_csv_arguments (file_name, index_column, nan_values, schema,
+                         relax_integers = False):
+  '''
+  Parameters:
+  -----------
+  file_name: str
+
+  index_column: str
+
+  nan_values: list of str
+
+  schema: dict
+    Output of load_schema.
+
+  relax_integers: bool, default = False
+    Read integer columns (except the index) as float64, since integer columns
+    can not hold NaN values. float64 is exact up to 2**53, float32 would
+    round the byte counters above 2**24.
+
+  Returns:
+  --------
+  arguments: dict
+    Keyword arguments for pandas.read_csv.
+
+  Examples:
+  ---------
+  >>> df = pd.read_csv ('IoT-File_1.csv', **_read_csv_arguments (
+                        'IoT-File_1.csv', 'package_ID', ['?'], schema))
+  '''
+  header = list (pd.read_csv (file_name, nrows = 0).columns)
+  if (index_column in header):
+    names = None
+  else:
+    ### K: Full dataset files do not have a header.
+    header = schema ['names']
+    names = header
+  usecols = [column for column in header if column not in schema ['drop']]
+  dtype = {column: schema ['dtype'] [column] for column in usecols
+           if column in schema ['dtype']}
+  if (relax_integers):
+    for column, column_type in dtype.items ():
+      if ((column_type != 'category') and
+          (np.issubdtype (column_type, np.integer))):
+        dtype [column] = np.float64
+  dtype [index_column] = np.int32
+  return {'header': None if names else 'infer', 'names': names,
+          'usecols': usecols, 'dtype': dtype, 'index_col': index_column,
+          'na_values': nan_values, 'low_memory': False}
+
+def _read_file (file_name, index_column, nan_values, schema = None):
+  '''
+  Parameters:
+  -----------
+  file_name: str
+
+  index_column: str
+
+  nan_values: list of str
+
+  schema: dict, default = None
+    Output of load_schema. Files without a header take their column names
+    from it.
+
+  Returns:
+  --------
+  df: pandas.DataFrame
+
+  elapsed: float
+
+  size: int
+
+  Examples:
+  ---------
+  >>> df, elapsed, size = _read_file ('IoT-File_1.csv', 'package_ID', ['?'])
+  '''
+  startTime = time.time ()
+  if (schema is None):
+    df = pd.read_csv (file_name,
+                      index_col = index_column,
+                      dtype = {index_column: np.int32},
+                      na_values = nan_values,
+                      low_memory = False)
+    return df, time.time () - startTime, os.path.getsize (file_name)
+
+  try:
+    df = pd.read_csv (file_name, **_read_csv_arguments (
+                      file_name, index_column, nan_values, schema))
+  except ValueError:
+    ### K: Integer columns can not hold NaN values, read them as floats.
+    df = pd.read_csv (file_name, **_read_csv_arguments (
+                      file_name, index_column, nan_values, schema,
+                      relax_integers = True))
+  return df, time.time () - startTime, os.path.getsize (file_name)
+
+def _unify_categories (frames):
+  '''
+  Parameters:
+  -----------
+  frames: list of pandas.DataFrame
+
+  Returns:
+  --------
+  frames: list of pandas.DataFrame
+    Categorical columns share the same (sorted) categories, so pd.concat
+    keeps them categorical instead of falling back to object.
+
+  Examples:
+  ---------
+  >>> frames = _unify_categories ([df_1, df_2])
+  '''
+  columns = frames [0].select_dtypes (['category']).columns
+  for column in columns:
+    categories = pd.api.types.union_categoricals (
+                 [frame [column] for frame in frames],
+                 sort_categories = True).categories
+    for frame in frames:
+      frame [column] = frame [column].cat.set_categories (categories)
+  return frames
+
+def memory_report (before, after):
+  '''
+  Parameters:
+  -----------
+  before: pandas.Series
+    df.memory_usage (deep = True) before compacting.
+
+  after: pandas.Series
+    df.memory_usage (deep = True) after compacting.
+
+  Returns:
+  --------
+  NULL
+
+  Examples:
+  ---------
+  >>> memory_report (before, df.memory_usage (deep = True))
+  '''
+  print ('\nColumn | MB (before) | MB (after)')
+  for column in before.index:
+    print ('{:35s} {:12.2f} {:12.2f}'.format (str (column),
+           before [column] / 2**20, after.get (column, 0) / 2**20))
+  print ('{:35s} {:12.2f} {:12.2f}\n'.format ('Total', before.sum () / 2**20,
+         after.sum () / 2**20))
+
+def compact_dataset (df, category_ratio = 1/2, verbose = True):
+  '''
+  Parameters:
+  -----------
+  df: pandas.DataFrame
+
+  category_ratio: float, default = 1/2
+    Object columns with fewer distinct values than category_ratio times the
+    number of lines are stored as categoricals.
+
+  verbose: bool, default = True
+    Print the memory used by each column before and after.
+
+  Returns:
+  --------
+  df: pandas.DataFrame
+    Floats downcast to float32 only when every value survives the round trip
+    (epoch timestamps such as stime/ltime stay float64), integers to the
+    smallest signed type that holds their range.
+
+  Examples:
+  ---------
+  >>> df = compact_dataset (df)
+  '''
+  if (verbose):
+    before = df.memory_usage (deep = True)
+  for column in df.columns:
+    values = df [column]
+    if (pd.api.types.is_float_dtype (values.dtype)):
+      if (values.dtype != np.float32):
+        compact_values = values.astype (np.float32)
+        if (((compact_values == values) | values.isna ()).all ()):
+          df [column] = compact_values
+    elif (pd.api.types.is_integer_dtype (values.dtype)):
+      df [column] = pd.to_numeric (values, downcast = 'integer')
+    elif ((pd.api.types.is_object_dtype (values.dtype)) or
+          (isinstance (values.dtype, pd.StringDtype))):
+      if (values.nunique () < category_ratio * len (values)):
+        df [column] = values.astype ('category')
+  if (verbose):
+    memory_report (before, df.memory_usage (deep = True))
+  return df
+
+def _fork_context ():
+  ### K: The scripts call the loaders at module level, without a __main__
+  ### guard, so spawned (or forkserver) workers would run the whole script
+  ### again. Where fork is not available the files are read in this process.
+  if ('fork' in multiprocessing.get_all_start_methods ()):
+    return multiprocessing.get_context ('fork')
+  return None
 
 def load_dataset (file_schema, file_range, index_column, nan_values,
-                  verbose = True):
+                  verbose = True, n_jobs = 1, schema = None, compact = False):
   '''
   Parameters:
   -----------
@@ -18,6 +288,21 @@ def load_dataset (file_schema, file_range, index_column, nan_values,
 
   nan_values: list of str
 
+  verbose: bool, default = True
+
+  n_jobs: int, default = 1
+    Number of processes used to parse the files. -1 means one process per
+    CPU. The files are concatenated once, after all of them have been read.
+    Forked processes only, the files are read one by one where fork is not
+    available (Windows).
+
+  schema: dict, default = None
+    Output of load_schema. Applies explicit dtypes and never parses the
+    dropped columns. Required for the full dataset (files without header).
+
+  compact: bool, default = False
+    Downcast the loaded frame with compact_dataset.
+
   Returns:
   --------
   df: pandas.DataFrame
@@ -25,72 +310,373 @@ def load_dataset (file_schema, file_range, index_column, nan_values,
   Examples:
   ---------
   >>> df = load_dataset ('IoT-File_{}.csv', 4, 'package_ID', ['?', 'UNDEFINED'])
+  >>> df = load_dataset ('IoT-File_{}.csv', 74, 'package_ID', ['?'], n_jobs = -1,
+                         schema = load_schema ('IoT-Features.csv'))
   '''
-  df = pd.DataFrame ()
-  for file_number in range (1, file_range + 1):
+  file_names = [file_schema.format (str (file_number))
+                for file_number in range (1, file_range + 1)]
+  if (n_jobs == -1):
+    n_jobs = os.cpu_count ()
+  context = _fork_context ()
+  if (context is None):
+    n_jobs = 1
+  n_jobs = max (1, min (n_jobs, len (file_names)))
+
+  startTime = time.time ()
+  if (n_jobs == 1):
+    results = []
+    for file_name in file_names:
+      if (verbose):
+        print ('Reading', file_name)
+      results.append (_read_file (file_name, index_column, nan_values,
+                                  schema))
+  else:
     if (verbose):
-      print ('Reading', file_schema.format (str (file_number)))
-    aux = pd.read_csv (file_schema.format (str (file_number)),
-                       index_col = index_column,
-                       dtype = {index_column: np.int32},
-                       na_values = nan_values,
-                       low_memory = False)
-    df = pd.concat ([df, aux])
+      print ('Reading', len (file_names), 'files with', n_jobs, 'processes.')
+    with ProcessPoolExecutor (max_workers = n_jobs,
+                              mp_context = context) as executor:
+      results = list (executor.map (_read_file, file_names,
+                                    [index_column] * len (file_names),
+                                    [nan_values] * len (file_names),
+                                    [schema] * len (file_names)))
+
+  if (verbose):
+    print ('\nFile | lines | seconds | MB/s | lines/s')
+    for file_name, (aux, elapsed, size) in zip (file_names, results):
+      elapsed = max (elapsed, 1e-9)
+      print ('{:50s} {:10d} {:8.2f} {:8.2f} {:12.0f}'.format (
+             os.path.basename (file_name), aux.shape [0], elapsed,
+             size / 2**20 / elapsed, aux.shape [0] / elapsed))
+
+  frames = [aux for aux, _, _ in results]
+  if (schema is not None):
+    frames = _unify_categories (frames)
+  df = pd.concat (frames)
+  if (verbose):
+    elapsed = time.time () - startTime
+    size = sum (size for _, _, size in results)
+    print ('Total:', df.shape [0], 'lines,', round (size / 2**20, 2), 'MB in',
+           round (elapsed, 2), 's (', round (size / 2**20 / elapsed, 2),
+           'MB/s ).\n')
+  if (compact):
+    df = compact_dataset (df, verbose = verbose)
   return df
 
-def display_general_information (df, verbose = True):
+def _hyperloglog (hashes, precision = 14):
+  '''
+  Parameters:
+  -----------
+  hashes: numpy.ndarray (uint64)
+    64 bit hashes of the values (pd.util.hash_pandas_object).
+
+  precision: int, default = 14
+    2**precision registers, ~1.04 / sqrt (2**precision) relative error
+    (0.8% for 14).
+
+  Returns:
+  --------
+  registers: numpy.ndarray (uint8)
+    HyperLogLog sketch. Sketches of different chunks are merged with
+    np.maximum.
+
+  Examples:
+  ---------
+  >>> registers = _hyperloglog (pd.util.hash_pandas_object (
+  ...                           df ['proto'], index = False).values)
+  '''
+  registers = np.zeros (1 << precision, dtype = np.uint8)
+  if (hashes.size == 0):
+    return registers
+  index = (hashes >> np.uint64 (64 - precision)).astype (np.intp)
+  ### K: The guard bit bounds the rank when the remaining bits are all zero.
+  rest = ((hashes << np.uint64 (precision)) |
+          np.uint64 (1 << (precision - 1)))
+  bit_length = np.frexp (rest.astype (np.float64)) [1]
+  rank = (65 - bit_length).astype (np.uint8)
+  np.maximum.at (registers, index, rank)
+  return registers
+
+def _hyperloglog_count (registers):
+  '''
+  Parameters:
+  -----------
+  registers: numpy.ndarray (uint8)
+    Output of _hyperloglog.
+
+  Returns:
+  --------
+  count: int
+    Estimated number of different values (linear counting for small
+    cardinalities).
+
+  Examples:
+  ---------
+  >>> _hyperloglog_count (registers)
+  '''
+  m = registers.size
+  alpha = 0.7213 / (1 + 1.079 / m)
+  estimate = alpha * m * m / np.sum (np.ldexp (1.0, -registers.astype (int)))
+  zeros = np.count_nonzero (registers == 0)
+  if ((estimate <= 5 / 2 * m) and (zeros > 0)):
+    estimate = m * math.log (m / zeros)
+  return int (round (estimate))
+
+def dataset_fingerprint (df, sample_size = 10000):
+  '''
+  Parameters:
+  -----------
+  df: pandas.DataFrame
+
+  sample_size: int, default = 10000
+    Lines (evenly spaced, first and last included) hashed with the shape,
+    columns and types.
+
+  Returns:
+  --------
+  digest: str
+    Cheap identifier of the dataset, used to cache reports. It does not
+    read every line.
+
+  Examples:
+  ---------
+  >>> dataset_fingerprint (df)
+  '''
+  my_hash = hashlib.sha1 (json.dumps ([list (df.shape),
+                                       [str (column) for column in df.columns],
+                                       [str (dtype) for dtype in df.dtypes]]
+                                      ).encode ())
+  if (len (df) > 0):
+    lines = np.unique (np.linspace (0, len (df) - 1,
+                                    min (sample_size, len (df))).astype (int))
+    my_hash.update (pd.util.hash_pandas_object (df.iloc [lines],
+                                                index = True).values.tobytes ())
+  return my_hash.hexdigest ()
+
+def profile_dataset (df, sample = None, precision = 14, state = 0):
+  '''
+  Parameters:
+  -----------
+  df: pandas.DataFrame
+
+  sample: int or float, default = None
+    Quick mode: profile this many lines (or this fraction of the lines)
+    instead of the whole frame. Distinct counts are then those of the sample.
+
+  precision: int, default = 14
+    HyperLogLog precision (see _hyperloglog).
+
+  state: int, default = 0
+    Random state for the sample.
+
+  Returns:
+  --------
+  report: pandas.DataFrame
+    One line per column: dtype, nulls, distinct (approximate), min, max and
+    the values of the columns with fewer than 10 of them.
+
+  Examples:
+  ---------
+  >>> report = profile_dataset (df)
+  >>> report = profile_dataset (df, sample = 100000)
+  '''
+  if (sample is not None):
+    n = int (sample * len (df)) if (isinstance (sample, float)) else sample
+    if (n < len (df)):
+      df = df.sample (n = n, random_state = state)
+
+  ### K: Vectorized over the whole frame, one call each.
+  nulls = df.isna ().sum ()
+  numeric = df.select_dtypes (include = ['number', 'bool']).columns
+  minimum = df [numeric].min ()
+  maximum = df [numeric].max ()
+
+  rows = []
+  for column in df.columns:
+    values = df [column]
+    present = values [values.notna ()] if (nulls [column] > 0) else values
+    hashes = pd.util.hash_pandas_object (present, index = False).values
+    distinct = _hyperloglog_count (_hyperloglog (hashes, precision))
+    examples = None
+    if (distinct < 10):
+      ### K: Cheap, the hash table has at most a few entries.
+      examples = [str (value) for value in present.unique ()]
+      distinct = len (examples)
+    rows.append ({'column': column, 'dtype': str (values.dtype),
+                  'nulls': int (nulls [column]), 'distinct': distinct,
+                  'min': minimum.get (column, np.nan),
+                  'max': maximum.get (column, np.nan),
+                  'values': examples})
+  report = pd.DataFrame (rows).set_index ('column')
+  report.attrs ['lines'] = len (df)
+  report.attrs ['sampled'] = sample is not None
+  return report
+
+def display_general_information (df, verbose = True, sample = None,
+                                 cache_directory = None):
   '''
   Parameters:
   -----------
   df: pandas.DataFrame
 
   verbose: bool, default = True
+    Print every column (otherwise only the summary).
+
+  sample: int or float, default = None
+    Quick mode, see profile_dataset.
+
+  cache_directory: str, default = None
+    Reports are stored in cache_directory/profiles, keyed by
+    dataset_fingerprint, so a known dataset is not profiled again.
 
   Returns:
   --------
-  NULL
+  report: pandas.DataFrame
+    Output of profile_dataset.
 
   Examples:
   ---------
   >>> display_general_information (df)
+  >>> display_general_information (df, sample = 1/10, cache_directory = 'cache')
   '''
   print ('Dataframe shape (lines, columns):', df.shape, '\n')
   print ('First 5 entries:\n', df [:5], '\n')
-  df.info (verbose = verbose)
 
-  print ('Brief description:')
-  df.describe ()
+  startTime = time.time ()
+  report = None
+  if (cache_directory is not None):
+    report_file = os.path.join (cache_directory, 'profiles',
+                                '{}_{}.json'.format (dataset_fingerprint (df),
+                                                     sample))
+    if (os.path.isfile (report_file)):
+      report = pd.read_json (report_file, orient = 'table')
+      print ('Report loaded from:', report_file)
+  if (report is None):
+    report = profile_dataset (df, sample = sample)
+    if (cache_directory is not None):
+      os.makedirs (os.path.dirname (report_file), exist_ok = True)
+      report.to_json (report_file, orient = 'table', default_handler = str)
+  if (sample is not None):
+    print ('Quick mode (sample = {}): counts are those of the sample.'.format (
+           sample))
 
-  print ('\nDataframe contains NaN values:', df.isnull ().values.any ())
-  nanColumns = [i for i in df.columns if df [i].isnull ().any ()]
+  nanColumns = list (report.index [report ['nulls'] > 0])
+  print ('Dataframe contains NaN values:', len (nanColumns) > 0)
   print ('Number of NaN columns:', len (nanColumns))
   print ('NaN columns:', nanColumns, '\n')
 
-  # nUniques = df.nunique () ### K: Takes too long. WHY?
-  print ('\nColumn | # of different values')
-  nUniques = []
-  for column in df.columns:
-    nUnique = df [column].nunique ()
-    nUniques.append (nUnique)
-    print('{:35s} {:15d}  '.format(column, nUnique))
-    #print (column, '|', nUnique)
+  if (verbose):
+    print ('Column | type | # of NaN | # of different values (approx.) | '
+           'min | max')
+    for column, line in report.iterrows ():
+      print ('{:35s} {:10s} {:10d} {:15d} {:>15s} {:>15s}'.format (
+             str (column), line ['dtype'], int (line ['nulls']),
+             int (line ['distinct']), str (line ['min']), str (line ['max'])))
+    print ()
+    for column, line in report.iterrows ():
+      if (isinstance (line ['values'], list)):
+        print (column, line ['values'])
 
-  print ()
-  for column in df.columns:
-    nUnique = df [column].nunique ()
-  for column, nUnique in zip (df.columns, nUniques):
-      if (nUnique < 10):
-        print (column, df [column].unique ())
-      else:
-        print('{:35s} {:15d}  '.format(column, nUnique))
-
-  my_objects = list (df.select_dtypes ( ['object']).columns)
+  my_objects = list (report.index [report ['dtype'].isin (['object', 'str'])])
   print ('\nObjects: (select encoding method)')
   print ('\nCheck for high cardinality.')
   print ('Column | # of different values | values')
   for column in my_objects:
-    print (column, '|', df [column].nunique (), '|', df [column].unique ())
-  print ('Objects:', list (df.select_dtypes (['object']).columns), '\n')
+    print (column, '|', report ['distinct'] [column], '|',
+           report ['values'] [column])
+  print ('Objects:', my_objects, '\n')
+  print (str (time.time () - startTime), 's to profile dataset.')
+  return report
+
+def _constant_values (df):
+  '''
+  Parameters:
+  -----------
+  df: pandas.DataFrame
+
+  Returns:
+  --------
+  constants: dict
+    column -> (constant, value). constant is True when the column has only
+    one (or zero) different non-NaN value, value is that value (NaN if the
+    column is empty). Numerical columns are checked with a single min/max
+    pass (min == max), the others by comparing against their first value.
+
+  Examples:
+  ---------
+  >>> _constant_values (pd.DataFrame ({'a': [1, 1], 'b': ['x', 'y']}))
+  {'a': (True, 1), 'b': (False, 'x')}
+  '''
+  constants = {}
+  numeric = df.select_dtypes (include = ['number', 'bool']).columns
+  if (len (numeric) > 0):
+    minimum = df [numeric].min ()
+    maximum = df [numeric].max ()
+    for column in numeric:
+      constants [column] = (not (minimum [column] < maximum [column]),
+                            minimum [column])
+  for column in df.columns:
+    if (column in constants):
+      continue
+    values = df [column]
+    if (isinstance (values.dtype, pd.CategoricalDtype)):
+      codes = values.cat.codes.values
+      codes = codes [codes >= 0]
+      constants [column] = ((codes.size == 0) or (codes.min () == codes.max ()),
+                            values.cat.categories [codes [0]]
+                            if (codes.size > 0) else np.nan)
+      continue
+    values = values.values
+    values = values [~pd.isna (values)]
+    if (values.size == 0):
+      constants [column] = (True, np.nan)
+    else:
+      constants [column] = (bool ((values == values [0]).all ()), values [0])
+  return {column: constants [column] for column in df.columns}
+
+class ConstantColumns:
+  '''
+  Finds the columns with only one (or zero) different non-NaN value. Works
+  on a whole dataframe or incrementally, one chunk at a time, so constant
+  columns are known before the full dataset is loaded.
+
+  Attributes:
+  -----------
+  values: dict
+    column -> single value seen so far (NaN if none), for the columns that
+    are still constant.
+
+  varying: set
+    Columns with at least two different values.
+
+  Examples:
+  ---------
+  >>> detector = ConstantColumns ()
+  >>> for chunk in pd.read_csv ('IoT-File_1.csv', chunksize = 100000):
+  ...   detector.update (chunk)
+  >>> df = pd.read_csv ('IoT-File_1.csv', usecols = lambda column:
+  ...                   column not in detector.columns)
+  '''
+  def __init__ (self):
+    self.values = {}
+    self.varying = set ()
+
+  def update (self, chunk):
+    candidates = [column for column in chunk.columns
+                  if column not in self.varying]
+    for column, (constant, value) in _constant_values (
+                                     chunk [candidates]).items ():
+      seen = self.values.get (column, np.nan)
+      if ((not constant) or
+          ((not pd.isna (seen)) and (not pd.isna (value)) and (seen != value))):
+        self.varying.add (column)
+        self.values.pop (column, None)
+      elif (pd.isna (seen)):
+        self.values [column] = value
+    return self
+
+  @property
+  def columns (self):
+    return list (self.values)
 
 def remove_columns_with_one_value (df, verbose = True):
   '''
@@ -108,29 +694,17 @@ def remove_columns_with_one_value (df, verbose = True):
 
   Examples:
   ---------
-  >>> df, log = remove_nan_columns (df, verbose = False)
+  >>> df, log = remove_columns_with_one_value (df, verbose = False)
   '''
   nColumns = len (df.columns)
-  nUniques = []
-  if (verbose):
-    print ('\nColumn | # of different values (before dropping).')
-  for column in df.columns:
-    nUnique = df [column].nunique ()
-    nUniques.append (nUnique)
-    if (verbose):
-      print (column, '|', nUnique)
-
+  detector = ConstantColumns ().update (df)
   if (verbose):
     print ('\nRemoving attributes that have only one (or zero) sampled value.')
-  for column, nUnique in zip (df.columns, nUniques):
-    if (nUnique <= 1):
-      df.drop (axis = 'columns', columns = column, inplace = True)
-
-  if (verbose):
-    print ('\nColumn | # of different values (after dropping).')
-    for column in df.columns:
-      nUnique = df [column].nunique ()
-      print (column, '|', nUnique)
+    print ('Column | value')
+    for column in detector.columns:
+      print (column, '|', detector.values [column])
+  ### K: A single drop, instead of one (copying) drop per column.
+  df.drop (axis = 'columns', columns = detector.columns, inplace = True)
 
   log = 'While removing single value columns: '
   if ((len (df.columns)) == nColumns):
@@ -140,6 +714,53 @@ def remove_columns_with_one_value (df, verbose = True):
 
   return df, log
 
+class NullCounter:
+  '''
+  Counts the NaN values of each column. Works on a whole dataframe or
+  incrementally, one chunk (or file) at a time, so the columns with too many
+  NaN values are known before the dataset is loaded.
+
+  Attributes:
+  -----------
+  rows: int
+    Lines seen so far.
+
+  nulls: pandas.Series
+    column -> NaN values seen so far.
+
+  Examples:
+  ---------
+  >>> counter = NullCounter ()
+  >>> for chunk in pd.read_csv ('IoT-File_1.csv', chunksize = 100000):
+  ...   counter.update (chunk)
+  >>> df = pd.read_csv ('IoT-File_1.csv', usecols = counter.keep (1/2))
+  '''
+  def __init__ (self):
+    self.rows = 0
+    self.nulls = pd.Series (dtype = np.int64)
+
+  def update (self, chunk):
+    nulls = chunk.isna ().sum ()
+    order = list (self.nulls.index) + [column for column in nulls.index
+                                       if column not in self.nulls.index]
+    self.nulls = self.nulls.add (nulls, fill_value = 0).reindex (order)
+    self.nulls = self.nulls.astype (np.int64)
+    self.rows += len (chunk)
+    return self
+
+  def keep (self, threshold):
+    '''
+    Columns with at least rows // (1/threshold) non NaN values (the same rule
+    as dropna (thresh = ...) in remove_nan_columns).
+    '''
+    minimum = self.rows // (1/threshold)
+    return [column for column, nulls in self.nulls.items ()
+            if (self.rows - nulls >= minimum)]
+
+  def drop (self, threshold):
+    kept = set (self.keep (threshold))
+    return [column for column in self.nulls.index if column not in kept]
+
 def remove_nan_columns (df, threshold, verbose = True):
   '''
   Parameters:
@@ -147,6 +768,7 @@ def remove_nan_columns (df, threshold, verbose = True):
   df: pandas.DataFrame
 
   threshold: float
+    Keep the columns with at least this fraction of non NaN values.
 
   verbose: bool, default = True
 
@@ -161,18 +783,19 @@ def remove_nan_columns (df, threshold, verbose = True):
   >>> df, log = remove_nan_columns (df, 1/2, verbose = False)
   '''
   nColumns = len (df.columns)
+  counter = NullCounter ().update (df)
   if (verbose):
     print ('Removing attributes with more than half NaN values.')
     print ('\nColumn | NaN values')
-    print (df.isnull ().sum ())
+    print (counter.nulls)
 
-  threshold = 1/threshold
-  df = df.dropna (axis = 'columns', thresh = df.shape [0] // threshold)
+  df = df.drop (columns = counter.drop (threshold))
 
   if (verbose):
-    print ('Dataframe contains NaN values:', df.isnull ().values.any ())
+    nulls = counter.nulls [df.columns]
+    print ('Dataframe contains NaN values:', bool (nulls.any ()))
     print ('\nColumn | NaN values (after dropping columns)')
-    print (df.isnull ().sum ())
+    print (nulls)
 
   log = 'While removing nan value columns: '
   if ((len (df.columns)) == nColumns):
@@ -201,3 +824,1643 @@ def display_feature_distribution (df, features):
     print ('Values:', df [feature].unique ())
     print ('Distribution:')
     print (df [feature].value_counts ())
+
+### K: Bump when clean_dataset changes, so old cache entries are not reused.
+CACHE_VERSION = 5
+
+def hash_files (file_names, cache_directory = None):
+  '''
+  Parameters:
+  -----------
+  file_names: list of str
+
+  cache_directory: str, default = None
+    If given, file digests are remembered (by path, size and modification
+    time) in cache_directory/digests.json, so files are only hashed once.
+
+  Returns:
+  --------
+  digest: str
+    SHA-1 of the names, sizes and contents of the files.
+
+  Examples:
+  ---------
+  >>> digest = hash_files (['IoT-File_1.csv', 'IoT-File_2.csv'])
+  '''
+  known = {}
+  digests_file = None
+  if (cache_directory is not None):
+    digests_file = os.path.join (cache_directory, 'digests.json')
+    if (os.path.isfile (digests_file)):
+      with open (digests_file) as f:
+        known = json.load (f)
+
+  my_hash = hashlib.sha1 ()
+  for file_name in file_names:
+    stat = os.stat (file_name)
+    stamp = '{}:{}:{}'.format (os.path.abspath (file_name), stat.st_size,
+                               stat.st_mtime_ns)
+    if (stamp not in known):
+      file_hash = hashlib.sha1 ()
+      with open (file_name, 'rb') as f:
+        for block in iter (lambda: f.read (2**20), b''):
+          file_hash.update (block)
+      known [stamp] = file_hash.hexdigest ()
+    my_hash.update ('{}:{}:{}'.format (os.path.basename (file_name),
+                                       stat.st_size, known [stamp]).encode ())
+
+  if (digests_file is not None):
+    os.makedirs (cache_directory, exist_ok = True)
+    ### K: Written aside and renamed, a concurrent run never reads half a file.
+    temporary = '{}.{}.tmp'.format (digests_file, os.getpid ())
+    with open (temporary, 'w') as f:
+      json.dump (known, f, indent = 1)
+    os.replace (temporary, digests_file)
+  return my_hash.hexdigest ()
+
+def publish_directory (temporary, directory):
+  '''
+  Parameters:
+  -----------
+  temporary: str
+    Complete entry, written aside.
+
+  directory: str
+    Final name. An incomplete entry (no meta.json) is replaced. If another
+    run published a complete one first, it is kept and temporary is removed.
+
+  Returns:
+  --------
+  NULL
+  '''
+  if (not os.path.isfile (os.path.join (directory, 'meta.json'))):
+    shutil.rmtree (directory, ignore_errors = True)
+  try:
+    os.replace (temporary, directory)
+  except OSError:
+    shutil.rmtree (temporary, ignore_errors = True)
+
+def save_columnar (df, directory):
+  '''
+  Parameters:
+  -----------
+  df: pandas.DataFrame
+
+  directory: str
+    One .npy file per column (and one for the index) plus meta.json.
+    Categorical and object columns are stored as integer codes (object
+    columns are restored as object by load_columnar).
+
+  Returns:
+  --------
+  NULL
+
+  Examples:
+  ---------
+  >>> save_columnar (df, 'cache/0a1b2c')
+  '''
+  ### K: Unique temporary directory, runs started at the same time (other
+  ### seeds) may be writing the same entry.
+  parent = os.path.dirname (os.path.abspath (directory))
+  os.makedirs (parent, exist_ok = True)
+  temporary = tempfile.mkdtemp (dir = parent,
+                                prefix = os.path.basename (directory) + '.tmp')
+  meta = {'index': df.index.name, 'shape': list (df.shape), 'columns': []}
+  np.save (os.path.join (temporary, 'index.npy'), df.index.to_numpy ())
+  for number, column in enumerate (df.columns):
+    values = df [column]
+    entry = {'name': column, 'file': '{}.npy'.format (number)}
+    if ((pd.api.types.is_object_dtype (values.dtype)) or
+        (isinstance (values.dtype, pd.StringDtype))):
+      entry ['object'] = True
+      values = values.astype ('category')
+    if (isinstance (values.dtype, pd.CategoricalDtype)):
+      entry ['categories'] = [str (category)
+                              for category in values.cat.categories]
+      values = values.cat.codes
+    np.save (os.path.join (temporary, entry ['file']), values.to_numpy ())
+    meta ['columns'].append (entry)
+  with open (os.path.join (temporary, 'meta.json'), 'w') as f:
+    json.dump (meta, f, indent = 1)
+  publish_directory (temporary, directory)
+
+def load_columnar (directory, mmap_mode = None):
+  '''
+  Parameters:
+  -----------
+  directory: str
+    Written by save_columnar.
+
+  mmap_mode: str, default = None
+    Passed to numpy.load ('r' maps the columns instead of reading them).
+
+  Returns:
+  --------
+  df: pandas.DataFrame
+
+  Examples:
+  ---------
+  >>> df = load_columnar ('cache/0a1b2c')
+  '''
+  with open (os.path.join (directory, 'meta.json')) as f:
+    meta = json.load (f)
+  data = {}
+  for entry in meta ['columns']:
+    values = np.load (os.path.join (directory, entry ['file']),
+                      mmap_mode = mmap_mode)
+    if ('categories' in entry):
+      values = pd.Categorical.from_codes (values, entry ['categories'])
+      if (entry.get ('object')):
+        values = np.asarray (values, dtype = object)
+    data [entry ['name']] = values
+  index = pd.Index (np.load (os.path.join (directory, 'index.npy')),
+                    name = meta ['index'])
+  return pd.DataFrame (data, index = index, copy = False)
+
+def _factorize (values, as_string = False):
+  '''
+  Parameters:
+  -----------
+  values: pandas.Series
+
+  as_string: bool, default = False
+    Convert the distinct values (not every line) to str, so 80 and '80' are
+    the same category and NaN becomes 'nan'.
+
+  Returns:
+  --------
+  codes: numpy.ndarray
+    Position of each line in uniques.
+
+  uniques: pandas.Index (object)
+    Distinct values in order of appearance, NaN included.
+
+  Examples:
+  ---------
+  >>> codes, uniques = _factorize (df ['sport'], as_string = True)
+  '''
+  codes, uniques = pd.factorize (values)
+  uniques = pd.Index (np.asarray (uniques, dtype = object), dtype = object)
+  missing = codes < 0
+  if (missing.any ()):
+    codes = np.where (missing, len (uniques), codes)
+    uniques = uniques.append (pd.Index ([np.nan], dtype = object))
+  if (as_string):
+    string_codes, uniques = pd.factorize (np.array ([str (value)
+                                                     for value in uniques],
+                                                    dtype = object))
+    codes = string_codes [codes]
+    uniques = pd.Index (np.asarray (uniques, dtype = object), dtype = object)
+  return codes, uniques
+
+def _json_scalar (value):
+  ### K: numpy scalars (np.int64 categories) are saved as the Python scalar,
+  ### so they are loaded back with their type and still match the data.
+  if (isinstance (value, np.generic)):
+    return value.item ()
+  return str (value)
+
+class CategoricalVocabulary:
+  '''
+  Ordinal encoding with vocabularies built in order of appearance, from a
+  whole frame or incrementally, one chunk at a time. Each chunk is
+  factorized once; only its distinct values are looked up, so no line is
+  converted to str. Vocabularies can be saved next to a model and applied
+  to new batches: categories that were never seen get the reserved code.
+
+  Parameters:
+  -----------
+  columns: list of str
+
+  string_columns: list of str, default = ()
+    Subset of columns whose values are compared as str (see _factorize).
+
+  unseen: float, default = -1
+    Code for categories that are not in the vocabulary.
+
+  Examples:
+  ---------
+  >>> vocabulary = CategoricalVocabulary (['proto', 'sport'], ['sport'])
+  >>> for chunk in chunks:
+  ...   vocabulary.update (chunk)
+  >>> vocabulary.save ('model/vocabulary.json')
+  >>> X = CategoricalVocabulary.load ('model/vocabulary.json').transform (batch)
+  '''
+  def __init__ (self, columns, string_columns = (), unseen = -1):
+    self.columns = list (columns)
+    self.string_columns = list (string_columns)
+    self.unseen = unseen
+    self.vocabularies = {column: pd.Index ([], dtype = object)
+                         for column in self.columns}
+
+  def update (self, chunk):
+    for column in self.columns:
+      if (column not in chunk.columns):
+        continue
+      _, uniques = _factorize (chunk [column], column in self.string_columns)
+      vocabulary = self.vocabularies [column]
+      new = uniques [vocabulary.get_indexer (uniques) < 0]
+      if (len (new) > 0):
+        self.vocabularies [column] = vocabulary.append (new)
+    return self
+
+  def transform (self, chunk):
+    '''
+    Encodes the columns of chunk in place (as float64) and returns it.
+    '''
+    for column in self.columns:
+      if (column not in chunk.columns):
+        continue
+      codes, uniques = _factorize (chunk [column],
+                                   column in self.string_columns)
+      mapping = self.vocabularies [column].get_indexer (uniques)
+      mapping = np.where (mapping < 0, self.unseen, mapping)
+      chunk [column] = mapping.astype (np.float64) [codes]
+    return chunk
+
+  def fit_transform (self, chunk):
+    return self.update (chunk).transform (chunk)
+
+  def save (self, file_name):
+    directory = os.path.dirname (file_name)
+    if (directory):
+      os.makedirs (directory, exist_ok = True)
+    with open (file_name, 'w') as f:
+      json.dump ({'columns': self.columns,
+                  'string_columns': self.string_columns,
+                  'unseen': self.unseen,
+                  'vocabularies': {column: vocabulary.tolist () for
+                                   column, vocabulary
+                                   in self.vocabularies.items ()}},
+                 f, indent = 1, default = _json_scalar)
+
+  @classmethod
+  def load (cls, file_name):
+    with open (file_name) as f:
+      saved = json.load (f)
+    vocabulary = cls (saved ['columns'], saved ['string_columns'],
+                      saved ['unseen'])
+    for column, values in saved ['vocabularies'].items ():
+      vocabulary.vocabularies [column] = pd.Index (values, dtype = object)
+    return vocabulary
+
+def clean_dataset (df, columns_to_remove, nan_threshold, categorical_columns,
+                   string_columns = (), verbose = True, vocabulary = None):
+  '''
+  Parameters:
+  -----------
+  df: pandas.DataFrame
+
+  columns_to_remove: list of str
+
+  nan_threshold: float
+    Same as remove_nan_columns.
+
+  categorical_columns: list of str
+    Ordinal encoded.
+
+  string_columns: list of str, default = ()
+    Subset of categorical_columns compared as str when encoding.
+
+  verbose: bool, default = True
+
+  vocabulary: CategoricalVocabulary, default = None
+    Filled with the categories of df, so the caller can save it. A new one is
+    used (and thrown away) if None.
+
+  Returns:
+  --------
+  df: pandas.DataFrame
+
+  Examples:
+  ---------
+  >>> df = clean_dataset (df, ['saddr'], 1/2, ['proto', 'sport'], ['sport'])
+  '''
+  df, log = remove_columns_with_one_value (df, verbose = False)
+  print (log)
+  if (verbose):
+    print ('Removing columns:', list (columns_to_remove))
+  df.drop (axis = 'columns', columns = columns_to_remove, inplace = True,
+           errors = 'ignore')
+  df, log = remove_nan_columns (df, nan_threshold, verbose = False)
+  print (log)
+
+  if (verbose):
+    print ('Encoding categorical features (ordinal encoding).')
+  if (vocabulary is None):
+    vocabulary = CategoricalVocabulary (categorical_columns, string_columns)
+  df = vocabulary.fit_transform (df)
+  if (verbose):
+    print ('Objects:', list (df.select_dtypes ( ['object']).columns))
+  return df
+
+def load_clean_dataset (file_schema, file_range, index_column, nan_values,
+                        columns_to_remove, nan_threshold, categorical_columns,
+                        string_columns = (), cache_directory = None,
+                        verbose = True, n_jobs = 1, schema = None,
+                        compact = False, vocabulary_file = None):
+  '''
+  Parameters:
+  -----------
+  file_schema, file_range, index_column, nan_values, n_jobs, schema:
+    Same as load_dataset.
+
+  compact: bool, default = False
+    Downcast the cleaned frame with compact_dataset (after encoding, which
+    produces float64 columns).
+
+  columns_to_remove, nan_threshold, categorical_columns, string_columns:
+    Same as clean_dataset.
+
+  cache_directory: str, default = None
+    The cleaned frame is stored there, keyed by the hash of the source files
+    and of the parameters above. Warm runs do not parse any CSV. None
+    disables the cache.
+
+  vocabulary_file: str, default = None
+    Save the categorical vocabulary (CategoricalVocabulary) there, e.g. next
+    to the model, to encode new data consistently. It is also kept in the
+    cache entry.
+
+  verbose: bool, default = True
+
+  Returns:
+  --------
+  df: pandas.DataFrame
+
+  Examples:
+  ---------
+  >>> df = load_clean_dataset ('IoT-File_{}.csv', 4, 'package_ID', ['?'],
+                               ['saddr'], 1/2, ['proto'], cache_directory = 'cache')
+  '''
+  if (cache_directory is None):
+    df = load_dataset (file_schema, file_range, index_column, nan_values,
+                       verbose = verbose, n_jobs = n_jobs, schema = schema)
+    vocabulary = CategoricalVocabulary (categorical_columns, string_columns)
+    df = clean_dataset (df, columns_to_remove, nan_threshold,
+                        categorical_columns, string_columns, verbose,
+                        vocabulary)
+    if (vocabulary_file is not None):
+      vocabulary.save (vocabulary_file)
+    if (compact):
+      df = compact_dataset (df, verbose = verbose)
+    return df
+
+  file_names = [file_schema.format (str (file_number))
+                for file_number in range (1, file_range + 1)]
+  parameters = {'version': CACHE_VERSION,
+                'index_column': index_column,
+                'nan_values': list (nan_values),
+                'columns_to_remove': list (columns_to_remove),
+                'nan_threshold': nan_threshold,
+                'categorical_columns': list (categorical_columns),
+                'string_columns': list (string_columns),
+                'schema': schema,
+                'compact': compact}
+  my_hash = hashlib.sha1 (hash_files (file_names, cache_directory).encode ())
+  my_hash.update (json.dumps (parameters, sort_keys = True,
+                              default = str).encode ())
+  key = my_hash.hexdigest ()
+  directory = os.path.join (cache_directory, key)
+
+  if (os.path.isfile (os.path.join (directory, 'meta.json'))):
+    if (verbose):
+      print ('Loading cleaned dataset from cache:', directory)
+    if (vocabulary_file is not None):
+      CategoricalVocabulary.load (os.path.join (
+        directory, 'vocabulary.json')).save (vocabulary_file)
+    return load_columnar (directory)
+
+  df = load_dataset (file_schema, file_range, index_column, nan_values,
+                     verbose = verbose, n_jobs = n_jobs, schema = schema)
+  vocabulary = CategoricalVocabulary (categorical_columns, string_columns)
+  df = clean_dataset (df, columns_to_remove, nan_threshold,
+                      categorical_columns, string_columns, verbose, vocabulary)
+  if (compact):
+    df = compact_dataset (df, verbose = verbose)
+  save_columnar (df, directory)
+  vocabulary.save (os.path.join (directory, 'vocabulary.json'))
+  if (vocabulary_file is not None):
+    vocabulary.save (vocabulary_file)
+  with open (os.path.join (directory, 'source.json'), 'w') as f:
+    json.dump ({'files': [os.path.abspath (file_name)
+                          for file_name in file_names],
+                'parameters': parameters,
+                'created': time.strftime ('%Y-%m-%d %H:%M:%S')},
+               f, indent = 1, default = str)
+  if (verbose):
+    print ('Cleaned dataset cached at:', directory)
+  return df
+
+def list_cache (cache_directory):
+  '''
+  Parameters:
+  -----------
+  cache_directory: str
+
+  Returns:
+  --------
+  entries: list of dict
+    key, shape, size (bytes), created and the source files of every entry.
+
+  Examples:
+  ---------
+  >>> entries = list_cache ('cache')
+  '''
+  entries = []
+  if (not os.path.isdir (cache_directory)):
+    return entries
+  for key in sorted (os.listdir (cache_directory)):
+    directory = os.path.join (cache_directory, key)
+    if (not os.path.isfile (os.path.join (directory, 'meta.json'))):
+      continue
+    with open (os.path.join (directory, 'meta.json')) as f:
+      meta = json.load (f)
+    source = {}
+    if (os.path.isfile (os.path.join (directory, 'source.json'))):
+      with open (os.path.join (directory, 'source.json')) as f:
+        source = json.load (f)
+    size = sum (os.path.getsize (os.path.join (directory, name))
+                for name in os.listdir (directory))
+    entries.append ({'key': key, 'shape': meta ['shape'], 'size': size,
+                     'created': source.get ('created'),
+                     'files': source.get ('files', [])})
+  return entries
+
+def clear_cache (cache_directory, key = None):
+  '''
+  Parameters:
+  -----------
+  cache_directory: str
+
+  key: str, default = None
+    Entry to remove (a prefix is enough). None removes every entry.
+
+  Returns:
+  --------
+  removed: list of str
+
+  Examples:
+  ---------
+  >>> removed = clear_cache ('cache', '0a1b')
+  '''
+  removed = []
+  for entry in list_cache (cache_directory):
+    if ((key is None) or (entry ['key'].startswith (key))):
+      shutil.rmtree (os.path.join (cache_directory, entry ['key']))
+      removed.append (entry ['key'])
+  if (key is None):
+    digests_file = os.path.join (cache_directory, 'digests.json')
+    if (os.path.isfile (digests_file)):
+      os.remove (digests_file)
+  return removed
+
+def feature_store (store_directory, build, state, parameters = None,
+                   file_names = (), verbose = True):
+  '''
+  Parameters:
+  -----------
+  store_directory: str
+    One subdirectory per entry.
+
+  build: callable
+    Returns a dict of numpy arrays (final X_train, y_train, X_val...). Only
+    called when the entry does not exist yet. Everything it creates
+    (dataframes, intermediate copies) is released when it returns. Its
+    source code is part of the key, so any edit to it builds a new entry.
+
+  state: int
+    Random state used by build (split, sampling).
+
+  parameters: dict, default = None
+    Everything else the arrays depend on, in particular the module level
+    constants build reads (target, columns, number of features, split
+    sizes...).
+
+  file_names: list of str, default = ()
+    Source files, their content hash is part of the key.
+
+  verbose: bool, default = True
+
+  Returns:
+  --------
+  arrays: dict of numpy.memmap
+    Read-only views of the stored .npy files (model.fit still converts them
+    to tensors).
+
+  Examples:
+  ---------
+  >>> arrays = feature_store ('cache/features', build_features, STATE,
+                              {'script': 'autoencoder', 'k': 9})
+  >>> X_train, y_train = arrays ['X_train'], arrays ['y_train']
+  '''
+  try:
+    source = inspect.getsource (build)
+  except (OSError, TypeError):
+    source = getattr (build, '__qualname__', repr (build))
+  my_hash = hashlib.sha1 (hash_files (file_names, store_directory).encode ())
+  my_hash.update (json.dumps ({'version': CACHE_VERSION, 'state': state,
+                               'parameters': parameters, 'build': source},
+                              sort_keys = True, default = str).encode ())
+  directory = os.path.join (store_directory, '{}_{}'.format (
+                            state, my_hash.hexdigest () [:16]))
+
+  if (not os.path.isfile (os.path.join (directory, 'meta.json'))):
+    startTime = time.time ()
+    arrays = build ()
+    os.makedirs (store_directory, exist_ok = True)
+    prefix = os.path.basename (directory) + '.tmp'
+    temporary = tempfile.mkdtemp (dir = store_directory, prefix = prefix)
+    for name, values in arrays.items ():
+      np.save (os.path.join (temporary, name + '.npy'),
+               np.ascontiguousarray (values))
+    meta = {'shape': {name: list (np.shape (values))
+                      for name, values in arrays.items ()},
+            'state': state, 'parameters': parameters}
+    with open (os.path.join (temporary, 'meta.json'), 'w') as f:
+      json.dump (meta, f, indent = 1, default = str)
+    with open (os.path.join (temporary, 'source.json'), 'w') as f:
+      json.dump ({'files': [os.path.abspath (file_name)
+                            for file_name in file_names],
+                  'created': time.strftime ('%Y-%m-%d %H:%M:%S')},
+                 f, indent = 1)
+    del arrays
+    publish_directory (temporary, directory)
+    if (verbose):
+      print (str (time.time () - startTime), 's to build features, stored at:',
+             directory)
+  elif (verbose):
+    print ('Loading features from store:', directory)
+
+  with open (os.path.join (directory, 'meta.json')) as f:
+    meta = json.load (f)
+  return {name: np.load (os.path.join (directory, name + '.npy'),
+                         mmap_mode = 'r')
+          for name in meta ['shape']}
+
+def stream_dataset (file_schema, file_range, index_column, nan_values, schema,
+                    chunksize = 500000, verbose = True):
+  '''
+  Parameters:
+  -----------
+  file_schema, file_range, index_column, nan_values, schema:
+    Same as load_dataset (schema is required).
+
+  chunksize: int, default = 500000
+    Lines per chunk. Memory is bounded by the chunk, not by the dataset.
+
+  verbose: bool, default = True
+
+  Returns:
+  --------
+  chunks: generator of pandas.DataFrame
+
+  Examples:
+  ---------
+  >>> for chunk in stream_dataset ('IoT-File_{}.csv', 74, 'package_ID', ['?'],
+                                   load_schema ('IoT-Features.csv')):
+  ...   print (chunk.shape)
+  '''
+  for file_number in range (1, file_range + 1):
+    file_name = file_schema.format (str (file_number))
+    if (verbose):
+      print ('Streaming', file_name)
+    ### K: Any chunk may contain NaN values, so integers are read as floats.
+    reader = pd.read_csv (file_name, chunksize = chunksize,
+                          **_read_csv_arguments (file_name, index_column,
+                                                 nan_values, schema,
+                                                 relax_integers = True))
+    with reader:
+      for chunk in reader:
+        yield chunk
+
+def find_nan_columns (file_schema, file_range, index_column, nan_values, schema,
+                      threshold, chunksize = 500000, verbose = True):
+  '''
+  Parameters:
+  -----------
+  file_schema, file_range, index_column, nan_values, schema, chunksize:
+    Same as stream_dataset.
+
+  threshold: float
+    Same as remove_nan_columns.
+
+  verbose: bool, default = True
+
+  Returns:
+  --------
+  schema: dict
+    Copy of schema that also drops the columns with too many NaN values, so
+    load_dataset never parses them.
+
+  counter: NullCounter
+
+  Examples:
+  ---------
+  >>> schema, counter = find_nan_columns ('IoT-File_{}.csv', 74, 'package_ID',
+                                          ['?'], schema, 1/2)
+  '''
+  counter = NullCounter ()
+  for chunk in stream_dataset (file_schema, file_range, index_column,
+                               nan_values, schema, chunksize, verbose = False):
+    counter.update (chunk)
+  ### K: The index is never a candidate, it is not a column of the chunks.
+  drop = counter.drop (threshold)
+  if (verbose):
+    print ('NaN columns found while streaming', counter.rows, 'lines:', drop)
+  schema = dict (schema)
+  schema ['drop'] = list (schema ['drop']) + drop
+  schema ['dtype'] = {column: column_type
+                      for column, column_type in schema ['dtype'].items ()
+                      if column not in drop}
+  return schema, counter
+
+def _split_mask (index, test_size, state):
+  '''
+  Parameters:
+  -----------
+  index: numpy.ndarray of int
+
+  test_size: float
+
+  state: int
+
+  Returns:
+  --------
+  mask: numpy.ndarray of bool
+    True for test samples. Depends only on the index value and the state,
+    so every pass over the data agrees on the split.
+
+  Examples:
+  ---------
+  >>> mask = _split_mask (chunk.index.values, 3/10, 0)
+  '''
+  with np.errstate (over = 'ignore'):
+    h = index.astype (np.uint64) + np.uint64 (state) * np.uint64 (0x9E3779B97F4A7C15)
+    h = (h ^ (h >> np.uint64 (30))) * np.uint64 (0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64 (27))) * np.uint64 (0x94D049BB133111EB)
+    h = h ^ (h >> np.uint64 (31))
+  return (h >> np.uint64 (11)) / float (2**53) < test_size
+
+class StreamingPipeline:
+  '''
+  Cleaning, ordinal encoding, standard scaling and SelectKBest (f_classif)
+  fitted in a single pass over a stream of chunks. Only per-column
+  accumulators are kept in memory.
+
+  Parameters:
+  -----------
+  target: str
+
+  categorical_columns: list of str
+    Encoded with codes assigned in order of appearance
+    (CategoricalVocabulary, saved with pipeline.vocabulary.save).
+
+  string_columns: list of str, default = ()
+    Subset of categorical_columns compared as str (NaN becomes 'nan').
+
+  nan_threshold: float, default = 1/2
+    Same as remove_nan_columns.
+
+  number_of_features: int, default = 9
+
+  test_size: float, default = 3/10
+    Statistics are fitted on train samples only.
+
+  state: int, default = 0
+
+  Examples:
+  ---------
+  >>> chunks = lambda: stream_dataset (FILE_NAME, 74, INDEX_COLUMN, NAN_VALUES, schema)
+  >>> pipeline = StreamingPipeline ('attack', ['proto']).fit (chunks)
+  >>> batches = pipeline.batches (chunks, 5000, subset = 'train')
+  >>> model.fit (batches, steps_per_epoch = pipeline.steps (5000, 'train'))
+  '''
+  def __init__ (self, target, categorical_columns, string_columns = (),
+                nan_threshold = 1/2, number_of_features = 9,
+                test_size = 3/10, state = 0):
+    self.target = target
+    self.categorical_columns = list (categorical_columns)
+    self.string_columns = list (string_columns)
+    self.nan_threshold = nan_threshold
+    self.number_of_features = number_of_features
+    self.test_size = test_size
+    self.state = state
+    ### K: Categories first seen in the test split are added while fitting.
+    self.vocabulary = CategoricalVocabulary (self.categorical_columns,
+                                             self.string_columns,
+                                             unseen = np.nan)
+
+  def _encode (self, chunk, grow):
+    if (grow):
+      self.vocabulary.update (chunk)
+    return self.vocabulary.transform (chunk)
+
+  def _subset (self, chunk, subset):
+    if (subset is None):
+      return chunk
+    mask = _split_mask (chunk.index.to_numpy (), self.test_size, self.state)
+    if (subset == 'train'):
+      return chunk [~mask]
+    return chunk [mask]
+
+  def fit (self, make_chunks):
+    '''
+    Parameters:
+    -----------
+    make_chunks: callable
+      Returns a new generator of chunks (like stream_dataset).
+
+    Returns:
+    --------
+    self: StreamingPipeline
+    '''
+    self.rows = {'train': 0, 'test': 0}
+    self.columns = None
+    for chunk in make_chunks ():
+      chunk = self._encode (chunk, grow = True)
+      mask = _split_mask (chunk.index.to_numpy (), self.test_size, self.state)
+      self.rows ['test'] += int (mask.sum ())
+      self.rows ['train'] += int ((~mask).sum ())
+      chunk = chunk [~mask]
+      if (self.columns is None):
+        self.columns = [column for column in chunk.columns
+                        if column != self.target]
+        self.classes = []
+        n_columns = len (self.columns)
+        self.nulls = np.zeros (n_columns)
+        self.minimum = np.full (n_columns, np.inf)
+        self.maximum = np.full (n_columns, -np.inf)
+        self.sums = np.zeros (n_columns)
+        self.squares = np.zeros (n_columns)
+        self.class_counts = np.zeros ((0, n_columns))
+        self.class_sums = np.zeros ((0, n_columns))
+        self.class_squares = np.zeros ((0, n_columns))
+      if (chunk.shape [0] == 0):
+        continue
+
+      X = chunk [self.columns].to_numpy (dtype = np.float64)
+      y = chunk [self.target].to_numpy ()
+      missing = np.isnan (X)
+      self.nulls += missing.sum (axis = 0)
+      with np.errstate (invalid = 'ignore'):
+        self.minimum = np.fmin (self.minimum, np.nanmin (X, axis = 0))
+        self.maximum = np.fmax (self.maximum, np.nanmax (X, axis = 0))
+      X = np.where (missing, 0, X)
+      self.sums += X.sum (axis = 0)
+      self.squares += np.square (X).sum (axis = 0)
+      for label in np.unique (y):
+        if (label not in self.classes):
+          self.classes.append (label)
+          empty = np.zeros ((1, len (self.columns)))
+          self.class_counts = np.vstack ((self.class_counts, empty))
+          self.class_sums = np.vstack ((self.class_sums, empty))
+          self.class_squares = np.vstack ((self.class_squares, empty))
+        number = self.classes.index (label)
+        rows = y == label
+        self.class_counts [number] += (~missing [rows]).sum (axis = 0)
+        self.class_sums [number] += X [rows].sum (axis = 0)
+        self.class_squares [number] += np.square (X [rows]).sum (axis = 0)
+
+    ### K: Same rules as remove_columns_with_one_value and remove_nan_columns.
+    n = self.rows ['train']
+    counts = n - self.nulls
+    constant = (counts == 0) | (self.minimum == self.maximum)
+    mostly_nan = counts < (n // (1 / self.nan_threshold))
+    kept = ~constant & ~mostly_nan
+    self.dropped_columns = [column for column, keep
+                            in zip (self.columns, kept) if not keep]
+
+    safe_counts = np.maximum (counts, 1)
+    self.mean_ = self.sums / safe_counts
+    self.scale_ = np.sqrt (np.maximum (self.squares / safe_counts -
+                                       np.square (self.mean_), 0))
+    self.scale_ [self.scale_ == 0] = 1
+
+    ### K: One-way ANOVA F (f_classif) from the per class sums.
+    n_classes = len (self.classes)
+    with np.errstate (divide = 'ignore', invalid = 'ignore'):
+      total = np.square (self.sums) / safe_counts
+      between = (np.square (self.class_sums) /
+                 np.maximum (self.class_counts, 1)).sum (axis = 0) - total
+      within = self.squares - total - between
+      self.scores_ = ((between / max (n_classes - 1, 1)) /
+                      (within / np.maximum (counts - n_classes, 1)))
+    self.scores_ [~kept] = np.nan
+    scores = np.where (np.isnan (self.scores_), -np.inf, self.scores_)
+    k = min (self.number_of_features, int (kept.sum ()))
+    selected = np.zeros (len (self.columns), dtype = bool)
+    selected [np.argsort (scores, kind = 'mergesort') [len (scores) - k:]] = True
+    self.selected = np.flatnonzero (selected)
+    self.selected_columns = [self.columns [i] for i in self.selected]
+    return self
+
+  def transform (self, chunk, subset = None):
+    '''
+    Parameters:
+    -----------
+    chunk: pandas.DataFrame
+
+    subset: {'train', 'test', None}, default = None
+
+    Returns:
+    --------
+    X: numpy.ndarray of float32
+      Scaled, selected features. Missing values become 0 (the train mean).
+
+    y: numpy.ndarray
+    '''
+    chunk = self._subset (chunk, subset)
+    chunk = self._encode (chunk [self.selected_columns + [self.target]].copy (),
+                          grow = False)
+    X = chunk [self.selected_columns].to_numpy (dtype = np.float64)
+    X = (X - self.mean_ [self.selected]) / self.scale_ [self.selected]
+    X [np.isnan (X)] = 0
+    return X.astype (np.float32), chunk [self.target].to_numpy ()
+
+  def steps (self, batch_size, subset = 'train'):
+    '''
+    Returns:
+    --------
+    steps: int
+      Batches per pass (steps_per_epoch for keras).
+    '''
+    return int (math.ceil (self.rows [subset] / batch_size))
+
+  def batches (self, make_chunks, batch_size, subset = 'train', loop = True):
+    '''
+    Parameters:
+    -----------
+    make_chunks: callable
+
+    batch_size: int
+
+    subset: {'train', 'test', None}, default = 'train'
+
+    loop: bool, default = True
+      Start again after the last chunk (keras expects endless generators).
+
+    Returns:
+    --------
+    batches: generator of (X, y)
+    '''
+    while (True):
+      buffer_X, buffer_y, buffered = [], [], 0
+      for chunk in make_chunks ():
+        X, y = self.transform (chunk, subset)
+        buffer_X.append (X)
+        buffer_y.append (y)
+        buffered += X.shape [0]
+        if (buffered < batch_size):
+          continue
+        X, y = np.concatenate (buffer_X), np.concatenate (buffer_y)
+        end = (X.shape [0] // batch_size) * batch_size
+        for start in range (0, end, batch_size):
+          yield X [start:start + batch_size], y [start:start + batch_size]
+        buffer_X, buffer_y, buffered = [X [end:]], [y [end:]], X.shape [0] - end
+      if (buffered > 0):
+        yield np.concatenate (buffer_X), np.concatenate (buffer_y)
+      if (not loop):
+        return
+
+def stratified_subsample (y, size, state = 0):
+  '''
+  Parameters:
+  -----------
+  y: numpy.ndarray
+    Labels.
+
+  size: int or float
+    Number of rows to keep (or fraction of the rows if < 1). Every class keeps
+    the same fraction of its rows, and at least one.
+
+  state: int, default = 0
+
+  Returns:
+  --------
+  indices: numpy.ndarray (int64)
+    Sorted row indices.
+
+  Examples:
+  ---------
+  >>> indices = stratified_subsample (y_train, 0.1)
+  '''
+  y = np.asarray (y).ravel ()
+  fraction = size if (size < 1) else min (1, size / len (y))
+  random = np.random.RandomState (state)
+  _, codes, counts = np.unique (y, return_inverse = True, return_counts = True)
+  order = np.argsort (codes.ravel (), kind = 'stable')
+  indices = []
+  for members in np.split (order, np.cumsum (counts) [:-1]):
+    size = max (1, int (round (fraction * len (members))))
+    indices.append (random.choice (members, size, replace = False))
+  return np.sort (np.concatenate (indices))
+
+def _binned_mutual_info (x, codes, classes, bins, strategy):
+  x = np.asarray (x, dtype = np.float64)
+  if (strategy == 'quantile'):
+    ### K: Repeated quantiles collapse, so discrete features get one bin per
+    ### value (up to bins values).
+    edges = np.unique (np.quantile (x, np.linspace (0, 1, bins + 1) [1:-1]))
+  else:
+    edges = np.linspace (x.min (), x.max (), bins + 1) [1:-1]
+  binned = np.searchsorted (edges, x, side = 'right')
+  ### K: Contingency table (bin x class) in one bincount.
+  joint = np.bincount (binned * classes + codes,
+                       minlength = (len (edges) + 1) * classes)
+  joint = joint.reshape (-1, classes) / len (x)
+  expected = (joint.sum (axis = 1, keepdims = True) *
+              joint.sum (axis = 0, keepdims = True))
+  nonzero = joint > 0
+  return np.sum (joint [nonzero] * np.log (joint [nonzero] /
+                                           expected [nonzero]))
+
+def binned_mutual_info (X, y, bins = 32, strategy = 'quantile', n_jobs = 1,
+                        subsample = None, state = 0):
+  '''
+  Mutual information between each feature and the label, estimated from a
+  contingency table of binned values. A drop-in score_func for SelectKBest
+  (use functools.partial to set the parameters), much faster than
+  mutual_info_classif (nearest neighbors) on large sets.
+
+  Parameters:
+  -----------
+  X: numpy.ndarray
+    Finite values (impute and remove infinities first).
+
+  y: numpy.ndarray
+    Labels.
+
+  bins: int, default = 32
+    Maximum number of bins per feature.
+
+  strategy: str, default = 'quantile'
+    'quantile' (bins with the same number of rows, robust to heavy tails) or
+    'uniform' (bins with the same width).
+
+  n_jobs: int, default = 1
+    Threads, one feature per task. -1 means one thread per CPU.
+
+  subsample: int or float, default = None
+    Score a stratified subsample of this size (or fraction) instead of every
+    row.
+
+  state: int, default = 0
+    Random state for the subsample.
+
+  Returns:
+  --------
+  scores: numpy.ndarray
+    Mutual information (nats) of each feature.
+
+  Examples:
+  ---------
+  >>> from functools import partial
+  >>> fs = SelectKBest (score_func = partial (binned_mutual_info, n_jobs = -1),
+  ...                   k = 10)
+  >>> scores = binned_mutual_info (X_train, y_train, subsample = 100000)
+  '''
+  y = np.asarray (y).ravel ()
+  if (subsample is not None):
+    rows = stratified_subsample (y, subsample, state)
+    X, y = X [rows], y [rows]
+  _, codes = np.unique (y, return_inverse = True)
+  codes = codes.ravel ()
+  classes = codes.max () + 1
+  if (n_jobs == -1):
+    n_jobs = os.cpu_count ()
+  score = lambda j: _binned_mutual_info (X [:, j], codes, classes, bins,
+                                         strategy)
+  if (n_jobs <= 1):
+    return np.array ([score (j) for j in range (X.shape [1])])
+  with ThreadPoolExecutor (max_workers = n_jobs) as executor:
+    return np.array (list (executor.map (score, range (X.shape [1]))))
+
+def _chi2_min_max (X, y):
+  ### K: chi2 needs X >= 0, so it is computed as if X had been scaled with
+  ### MinMaxScaler (0, 1), from the per class sums (X is not copied).
+  _, codes = np.unique (np.asarray (y).ravel (), return_inverse = True)
+  codes = codes.ravel ()
+  minimum, maximum = X.min (axis = 0), X.max (axis = 0)
+  scale = np.where (maximum > minimum, maximum - minimum, 1)
+  class_counts = np.bincount (codes).astype (np.float64)
+  class_sums = np.stack ([np.bincount (codes, weights = X [:, j],
+                                       minlength = len (class_counts))
+                          for j in range (X.shape [1])], axis = 1)
+  observed = (class_sums - class_counts [:, None] * minimum) / scale
+  expected = (class_counts / class_counts.sum ()) [:, None] * observed.sum (
+             axis = 0)
+  with np.errstate (divide = 'ignore', invalid = 'ignore'):
+    return (np.square (observed - expected) / expected).sum (axis = 0)
+
+def _f_classif_scores (X, y):
+  return f_classif (X, y) [0]
+
+SCORERS = {'f_classif': _f_classif_scores, 'chi2': _chi2_min_max,
+           'mutual_info': partial (binned_mutual_info, n_jobs = -1)}
+
+def array_fingerprint (*arrays):
+  '''
+  Parameters:
+  -----------
+  arrays: numpy.ndarray
+
+  Returns:
+  --------
+  fingerprint: str
+    SHA-1 of the shapes, dtypes and contents of the arrays.
+
+  Examples:
+  ---------
+  >>> key = array_fingerprint (X_train, y_train)
+  '''
+  my_hash = hashlib.sha1 ()
+  for values in arrays:
+    values = np.ascontiguousarray (values)
+    my_hash.update ('{}:{}'.format (values.shape, values.dtype).encode ())
+    my_hash.update (values.view (np.uint8).ravel ())
+  return my_hash.hexdigest ()
+
+def feature_scores (X, y, scorers = ('f_classif', 'chi2', 'mutual_info'),
+                    cache_directory = None, verbose = True):
+  '''
+  Parameters:
+  -----------
+  X: numpy.ndarray
+    Train features, after scaling.
+
+  y: numpy.ndarray
+
+  scorers: list of str, default = ('f_classif', 'chi2', 'mutual_info')
+    Names from SCORERS.
+
+  cache_directory: str, default = None
+    Scores are stored in cache_directory/scores/, keyed by the fingerprint
+    of X and y, and only the missing scorers are computed. Every script,
+    model and seed that ends up with the same split reuses them.
+
+  verbose: bool, default = True
+
+  Returns:
+  --------
+  scores: dict
+    scorer -> numpy.ndarray with one score per feature.
+
+  Examples:
+  ---------
+  >>> scores = feature_scores (X_train, y_train, cache_directory = 'cache/')
+  >>> fs = SelectKBest (PrecomputedScores (scores ['f_classif']), k = 9)
+  '''
+  scores = {}
+  file_name = None
+  if (cache_directory is not None):
+    file_name = os.path.join (cache_directory, 'scores',
+                              array_fingerprint (X, y) [:16] + '.json')
+    if (os.path.isfile (file_name)):
+      with open (file_name) as f:
+        scores = {name: np.array (values, dtype = np.float64)
+                  for name, values in json.load (f).items ()}
+
+  missing = [name for name in scorers if name not in scores]
+  for name in missing:
+    startTime = time.time ()
+    scores [name] = np.asarray (SCORERS [name] (X, y), dtype = np.float64)
+    if (verbose):
+      print (str (time.time () - startTime), 'to compute', name, 'scores.')
+  if (missing and file_name is not None):
+    os.makedirs (os.path.dirname (file_name), exist_ok = True)
+    ### K: NaN is not valid json, store it as null.
+    with open (file_name + '.tmp', 'w') as f:
+      json.dump ({name: [None if np.isnan (value) else float (value)
+                         for value in values]
+                  for name, values in scores.items ()}, f)
+    os.replace (file_name + '.tmp', file_name)
+  elif (verbose and file_name is not None):
+    print ('Loading feature scores from cache:', file_name)
+  return {name: scores [name] for name in scorers}
+
+class PrecomputedScores:
+  '''
+  score_func for SelectKBest that returns scores computed beforehand (by
+  feature_scores), so fitting the selector does not go over the data again.
+
+  Examples:
+  ---------
+  >>> fs = SelectKBest (PrecomputedScores (scores ['f_classif']), k = 9)
+  >>> X_train = fs.fit_transform (X_train, y_train)
+  '''
+  def __init__ (self, scores):
+    self.scores = np.asarray (scores, dtype = np.float64)
+
+  def __call__ (self, X, y):
+    if (X.shape [1] != len (self.scores)):
+      raise ValueError ('Scores were computed for {} features, X has {}.'
+                        .format (len (self.scores), X.shape [1]))
+    return self.scores
+
+def rank_features (scores, names = None):
+  '''
+  Parameters:
+  -----------
+  scores: numpy.ndarray
+
+  names: list, default = None
+    Defaults to the feature positions.
+
+  Returns:
+  --------
+  ranking: list of (name, score)
+    Sorted by increasing score (best feature last), with a single argsort.
+    NaN scores come first.
+
+  Examples:
+  ---------
+  >>> for feature, score in rank_features (fs.scores_):
+  ...   print ('Feature %d: %f' % (feature, score))
+  '''
+  scores = np.asarray (scores, dtype = np.float64)
+  if (names is None):
+    names = range (len (scores))
+  names = list (names)
+  order = np.argsort (np.where (np.isnan (scores), -np.inf, scores),
+                      kind = 'mergesort')
+  return [(names [i], scores [i]) for i in order]
+
+### K: Seeds of the repeated experiments (std_dev.py averages them).
+STATES = [0, 10, 100, 1000, 10000]
+
+def share_arrays (arrays):
+  '''
+  Parameters:
+  -----------
+  arrays: dict of numpy.ndarray
+    Numeric arrays (object arrays can not be shared).
+
+  Returns:
+  --------
+  memories: list of multiprocessing.shared_memory.SharedMemory
+    Keep them while the arrays are in use, then close and unlink them.
+
+  descriptors: dict
+    name -> (shared memory name, shape, dtype), for attach_arrays.
+
+  Examples:
+  ---------
+  >>> memories, descriptors = share_arrays ({'X': X, 'y': y})
+  '''
+  memories = []
+  descriptors = {}
+  for name, values in arrays.items ():
+    values = np.asarray (values)
+    if (values.dtype.hasobject):
+      raise ValueError ('Can not share object array: ' + name)
+    memory = shared_memory.SharedMemory (create = True,
+                                         size = max (values.nbytes, 1))
+    np.ndarray (values.shape, dtype = values.dtype,
+                buffer = memory.buf) [...] = values
+    memories.append (memory)
+    descriptors [name] = (memory.name, values.shape, values.dtype.str)
+  return memories, descriptors
+
+_SHARED_ARRAYS = {}
+
+def attach_arrays (descriptors):
+  '''
+  Parameters:
+  -----------
+  descriptors: dict
+    Returned by share_arrays.
+
+  Returns:
+  --------
+  arrays: dict of numpy.ndarray
+    Read-only views of the shared memory, nothing is copied. Also kept in
+    _SHARED_ARRAYS for the process pool workers.
+  '''
+  arrays = {}
+  for name, (memory_name, shape, dtype) in descriptors.items ():
+    memory = shared_memory.SharedMemory (name = memory_name)
+    values = np.ndarray (shape, dtype = dtype, buffer = memory.buf)
+    values.flags.writeable = False
+    arrays [name] = values
+    _SHARED_ARRAYS [name] = (memory, values)
+  return arrays
+
+def _run_state (experiment, state):
+  ### K: Output is captured so the logs of each seed come out whole and in
+  ### order (std_dev.py parses them).
+  output = io.StringIO ()
+  arrays = {name: values for name, (_, values) in _SHARED_ARRAYS.items ()}
+  with contextlib.redirect_stdout (output):
+    result = experiment (arrays, state)
+  return result, output.getvalue ()
+
+def run_states (prepare, experiment, states = STATES, n_jobs = -1,
+                verbose = True):
+  '''
+  Loads and preprocesses the dataset once and runs one experiment per seed
+  in a process pool. The base arrays live in shared memory, the workers
+  read them without copying.
+
+  Parameters:
+  -----------
+  prepare: callable
+    Returns a dict of numeric numpy arrays (X, y...). Called once.
+
+  experiment: callable
+    experiment (arrays, state) splits, fits and evaluates for one seed and
+    returns something picklable (metrics). Must be defined at module level,
+    with the script body under if (__name__ == '__main__').
+
+  states: list of int, default = STATES
+
+  n_jobs: int, default = -1
+    Processes. -1 means one per seed (up to the number of CPUs). With 1,
+    every seed runs in this process, without shared memory.
+
+  verbose: bool, default = True
+    Print the output of each seed (in the order of states).
+
+  Returns:
+  --------
+  results: dict
+    state -> value returned by experiment.
+
+  Examples:
+  ---------
+  >>> results = run_states (prepare, experiment, STATES)
+  '''
+  states = list (states)
+  if (n_jobs == -1):
+    n_jobs = os.cpu_count ()
+  n_jobs = max (1, min (n_jobs, len (states)))
+  startTime = time.time ()
+  arrays = prepare ()
+  if (verbose):
+    print (str (time.time () - startTime), 's to prepare the dataset.')
+
+  results = {}
+  if (n_jobs == 1):
+    for state in states:
+      if (verbose):
+        print ('STATE:', state)
+      results [state] = experiment (arrays, state)
+    return results
+
+  memories, descriptors = share_arrays (arrays)
+  del arrays
+  try:
+    with ProcessPoolExecutor (max_workers = n_jobs,
+                              initializer = attach_arrays,
+                              initargs = (descriptors,)) as executor:
+      futures = [executor.submit (_run_state, experiment, state)
+                 for state in states]
+      for state, future in zip (states, futures):
+        results [state], output = future.result ()
+        if (verbose):
+          print ('STATE:', state)
+          print (output, end = '')
+  finally:
+    for memory in memories:
+      memory.close ()
+      memory.unlink ()
+  return results
+
+def memmap_arrays (arrays, directory):
+  '''
+  Parameters:
+  -----------
+  arrays: dict of numpy.ndarray
+    Numeric arrays (object arrays can not be mapped).
+
+  directory: str
+    Where the .npy files are written, named by array_fingerprint (an array
+    that is already there is not written again).
+
+  Returns:
+  --------
+  mapped: dict of numpy.memmap
+    Read-only. joblib sends a memmap to its workers as a reference to the
+    file (not the data), each worker maps the same pages.
+
+  Examples:
+  ---------
+  >>> mapped = memmap_arrays ({'X': X_train, 'y': y_train}, 'cache/memmap/')
+  '''
+  os.makedirs (directory, exist_ok = True)
+  mapped = {}
+  for name, values in arrays.items ():
+    values = np.ascontiguousarray (values)
+    if (values.dtype.hasobject):
+      raise ValueError ('Can not map object array: ' + name)
+    file_name = os.path.join (directory,
+                              array_fingerprint (values) [:16] + '.npy')
+    if (not os.path.isfile (file_name)):
+      with open (file_name + '.tmp', 'wb') as f:
+        np.save (f, values)
+      os.replace (file_name + '.tmp', file_name)
+    mapped [name] = np.load (file_name, mmap_mode = 'r')
+  return mapped
+
+def memmap_search (search, X, y, directory = None, verbose = True,
+                   **fit_params):
+  '''
+  Fits a GridSearchCV (or any search with n_jobs) on a memmapped copy of X
+  and y. Each task receives the file reference and its fold indices, instead
+  of a pickled copy of the whole training set, so the cost of starting the
+  tasks does not grow with the dataset times the grid.
+
+  Parameters:
+  -----------
+  search: sklearn.model_selection.GridSearchCV
+    Or RandomizedSearchCV, HalvingGridSearchCV... any search with fit (X, y).
+
+  X: pandas.DataFrame or numpy.ndarray
+    Converted to float64, column names are lost: a ColumnTransformer in the
+    pipeline must select its columns by position.
+
+  y: pandas.Series or numpy.ndarray
+
+  directory: str, default = None
+    Where the arrays are mapped (reused by later searches on the same
+    arrays). Defaults to a temporary directory, removed after the fit.
+
+  verbose: bool, default = True
+
+  fit_params:
+    Passed to search.fit.
+
+  Returns:
+  --------
+  search: fitted search
+
+  Examples:
+  ---------
+  >>> grid = GridSearchCV (estimator = clf, param_grid = param_grid,
+  ...                      scoring = 'f1', n_jobs = -1, cv = cv)
+  >>> grid_result = memmap_search (grid, X_train_df, y_train_df)
+  '''
+  if (isinstance (X, pd.DataFrame)):
+    X = X.to_numpy (dtype = np.float64)
+  if (isinstance (y, (pd.Series, pd.DataFrame))):
+    y = y.to_numpy ()
+  temporary = directory is None
+  if (temporary):
+    directory = tempfile.mkdtemp (prefix = 'search_')
+  try:
+    startTime = time.time ()
+    mapped = memmap_arrays ({'X': X, 'y': y}, directory)
+    if (verbose):
+      print (str (time.time () - startTime), 's to map',
+             X.shape, 'to', directory)
+    search.fit (mapped ['X'], mapped ['y'], **fit_params)
+    del mapped
+  finally:
+    if (temporary):
+      shutil.rmtree (directory, ignore_errors = True)
+  return search
+
+@contextlib.contextmanager
+def fold_cache (directory = None, verbose = 0):
+  '''
+  Cache for the transformer steps of a Pipeline (Pipeline (memory = ...))
+  during a search. The fitted transformers and their outputs are keyed by
+  their parameters and by the rows they are fitted on (the fold), so the
+  preprocessing of a fold is computed once and reused by every classifier
+  configuration that shares the same upstream parameters.
+
+  Parameters:
+  -----------
+  directory: str, default = None
+    Where joblib keeps the cache (it is kept after the search). Defaults to
+    a temporary directory, removed on exit.
+
+  verbose: int, default = 0
+    Passed to joblib.Memory.
+
+  Returns:
+  --------
+  memory: joblib.Memory
+
+  Examples:
+  ---------
+  >>> with fold_cache () as memory:
+  ...   clf.set_params (memory = memory)
+  ...   grid_result = memmap_search (grid, X_train_df, y_train_df)
+  '''
+  temporary = directory is None
+  if (temporary):
+    directory = tempfile.mkdtemp (prefix = 'pipeline_')
+  try:
+    yield Memory (directory, verbose = verbose)
+  finally:
+    if (temporary):
+      shutil.rmtree (directory, ignore_errors = True)
+
+def halving_budgets (min_budget, max_budget, factor = 3):
+  '''
+  Parameters:
+  -----------
+  min_budget, max_budget: int
+    Smallest budget of the first rung and budget of the last rung (rows,
+    epochs...).
+
+  factor: int, default = 3
+
+  Returns:
+  --------
+  budgets: list of int
+    Increasing budgets, one per rung, max_budget divided by powers of factor.
+
+  Examples:
+  ---------
+  >>> halving_budgets (8, 200)
+  [22, 67, 200]
+  '''
+  rungs = int (math.floor (math.log (max_budget / min_budget, factor) + 1e-9))
+  return [max (1, int (round (max_budget / factor ** rung)))
+          for rung in range (rungs, -1, -1)]
+
+def successive_halving (evaluate, candidates, min_budget, max_budget,
+                        factor = 3, verbose = True):
+  '''
+  Successive halving: every candidate is evaluated with the smallest budget,
+  only the best 1/factor move to the next rung (factor times the budget),
+  until the survivors get max_budget. Most candidates are dropped after a
+  fraction of the data or of the epochs.
+
+  Parameters:
+  -----------
+  evaluate: callable
+    evaluate (index, params, budget) -> score (higher is better). index
+    identifies the candidate across rungs. SubsampleEvaluator (sklearn
+    estimators, budget = rows) and EpochEvaluator (Keras model factories,
+    budget = epochs). If it has a prune (indices) method, it is called with
+    the survivors of each rung. If it has a map (trials) method, a whole
+    rung is handed to it at once (TrialScheduler, in the autoencoder
+    evaluation unit, runs it in parallel).
+
+  candidates: dict or list of dict
+    A param_grid (as in GridSearchCV) or the list of parameters to try.
+
+  min_budget, max_budget: int
+
+  factor: int, default = 3
+
+  verbose: bool, default = True
+
+  Returns:
+  --------
+  result: dict
+    best_params, best_score and history (one (rung, budget, params, score)
+    per evaluation).
+
+  Examples:
+  ---------
+  >>> evaluate = SubsampleEvaluator (clf, X_train_df, y_train_df, cv = cv)
+  >>> result = successive_halving (evaluate, param_grid,
+  ...                              len (X_train_df) // 27, len (X_train_df))
+  >>> print (result ['best_params'])
+  '''
+  if (isinstance (candidates, dict)):
+    candidates = list (ParameterGrid (candidates))
+  candidates = list (candidates)
+  survivors = list (range (len (candidates)))
+  history = []
+  budgets = halving_budgets (min_budget, max_budget, factor)
+  startTime = time.time ()
+  for rung, budget in enumerate (budgets):
+    if (hasattr (evaluate, 'map')):
+      results = evaluate.map ([(index, candidates [index], budget)
+                               for index in survivors])
+    else:
+      results = ((index, evaluate (index, candidates [index], budget))
+                 for index in survivors)
+    ### K: Printed as the evaluations finish.
+    scores = {}
+    for index, score in results:
+      scores [index] = score
+      history.append ((rung, budget, candidates [index], scores [index]))
+      if (verbose):
+        print ('Rung %d (budget %d): %f with: %r' % (rung, budget,
+               scores [index], candidates [index]))
+    ### K: NaN scores go last.
+    survivors = sorted (survivors, key = lambda index:
+                        -np.inf if np.isnan (scores [index])
+                        else scores [index], reverse = True)
+    if (rung < len (budgets) - 1):
+      survivors = survivors [:max (1, int (math.ceil (len (survivors) /
+                                                      factor)))]
+    if (hasattr (evaluate, 'prune')):
+      evaluate.prune (survivors)
+  best = survivors [0]
+  if (verbose):
+    print (str (time.time () - startTime), 's to search',
+           len (candidates), 'candidates.')
+  return {'best_params': candidates [best], 'best_score': scores [best],
+          'history': history}
+
+class SubsampleEvaluator:
+  '''
+  evaluate for successive_halving: cross validation score of a sklearn
+  estimator (a Pipeline) fitted on a stratified subsample of budget rows.
+
+  Parameters:
+  -----------
+  estimator: sklearn estimator
+    Cloned for each evaluation, candidates are set with set_params.
+
+  X, y: pandas or numpy
+
+  cv, scoring, n_jobs:
+    As in cross_val_score.
+
+  state: int, default = 0
+    Random state of the subsamples.
+
+  Examples:
+  ---------
+  >>> evaluate = SubsampleEvaluator (clf, X_train_df, y_train_df, cv = cv,
+  ...                                scoring = 'f1', n_jobs = -1)
+  '''
+  def __init__ (self, estimator, X, y, cv = 5, scoring = None, n_jobs = None,
+                state = 0):
+    self.estimator = estimator
+    self.X, self.y = X, y
+    self.cv, self.scoring, self.n_jobs = cv, scoring, n_jobs
+    self.state = state
+
+  def __call__ (self, index, params, budget):
+    X, y = self.X, self.y
+    if (budget < len (y)):
+      rows = stratified_subsample (np.asarray (y), budget, self.state)
+      X = X.iloc [rows] if hasattr (X, 'iloc') else X [rows]
+      y = y.iloc [rows] if hasattr (y, 'iloc') else y [rows]
+    estimator = clone (self.estimator).set_params (**params)
+    scores = cross_val_score (estimator, X, y, cv = self.cv,
+                              scoring = self.scoring, n_jobs = self.n_jobs)
+    return scores.mean ()
+
+def _keras_trial (model, data, batch_size, epochs, initial_epoch, score,
+                  verbose):
+  X_train, y_train, X_val, y_val = data
+  model.fit (X_train, y_train, batch_size = batch_size, epochs = epochs,
+             initial_epoch = initial_epoch, verbose = verbose)
+  if (score is None):
+    loss = model.evaluate (X_val, y_val, batch_size = batch_size, verbose = 0)
+    return -(loss [0] if isinstance (loss, list) else loss)
+  return score (y_val, model.predict (X_val, batch_size = batch_size))
+
+class EpochEvaluator:
+  '''
+  evaluate for successive_halving: trains a Keras model up to budget epochs
+  and scores it on the validation set. Survivors resume training from the
+  epoch they stopped at, so the budget of a rung is not paid again.
+
+  Parameters:
+  -----------
+  create_model: callable
+    create_model (**params) returns a compiled model. batch_size and epochs
+    are not passed to it (batch_size is used for fit, epochs is the budget).
+
+  X_train, y_train, X_val, y_val: numpy.ndarray
+    For an autoencoder, y_train = X_train and y_val = X_val.
+
+  score: callable, default = None
+    score (y_val, y_pred), higher is better. Defaults to minus the
+    validation loss.
+
+  verbose: int, default = 0
+    Passed to model.fit.
+
+  Examples:
+  ---------
+  >>> evaluate = EpochEvaluator (create_model, X_train, X_train, X_val, X_val)
+  >>> result = successive_halving (evaluate, param_grid, 8, 200)
+  '''
+  def __init__ (self, create_model, X_train, y_train, X_val, y_val,
+                score = None, verbose = 0):
+    self.create_model = create_model
+    self.X_train, self.y_train = X_train, y_train
+    self.X_val, self.y_val = X_val, y_val
+    self.score = score
+    self.verbose = verbose
+    self.models = {}
+
+  def __call__ (self, index, params, budget):
+    params = dict (params)
+    batch_size = params.pop ('batch_size', None)
+    params.pop ('epochs', None)
+    model, epochs = self.models.get (index, (None, 0))
+    if (model is None):
+      model = self.create_model (**params)
+    self.models [index] = (model, budget)
+    return _keras_trial (model, [self.X_train, self.y_train, self.X_val,
+                                 self.y_val], batch_size, budget, epochs,
+                         self.score, self.verbose)
+
+  def prune (self, survivors):
+    ### K: Models of dropped candidates are released.
+    for index in list (self.models):
+      if (index not in survivors):
+        del self.models [index]
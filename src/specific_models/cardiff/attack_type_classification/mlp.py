@@ -12,7 +12,8 @@ import pandas as pd
 import numpy as np
 import sys
 import matplotlib.pyplot as plt
-from scipy.io import arff
+sys.path.append ('..')
+from unit import load_arff, encode_labels
 
 
 ###############################################################################
@@ -31,19 +32,11 @@ FILE_NAME = IOT_DIRECTORY + IOT_ATTACK_TYPE_FILENAME
 ###############################################################################
 pd.set_option ('display.max_rows', None)
 pd.set_option ('display.max_columns', 5)
-data = arff.loadarff (FILE_NAME)
-df = pd.DataFrame (data [0])
+### K: Nominal attributes are read as categoricals, no byte strings to decode.
+df = load_arff (FILE_NAME, fill_value = np.nan)
 print ('Dataframe shape (lines, collumns):', df.shape, '\n')
 print ('First 5 entries:\n', df [:5], '\n')
 
-### Decode byte strings into ordinary strings:
-print ('Decoding byte strings into ordinary strings.')
-strings = df.select_dtypes ( [np.object])
-strings = strings.stack ().str.decode ('utf-8').unstack ()
-for column in strings:
-  df [column] = strings [column]
-print ('Done.\n')
-
 ###############################################################################
 ## Display generic (dataset independent) information
 ###############################################################################
@@ -68,9 +61,8 @@ print ('Label distribution:\n', df ['class_attack_type'].value_counts ())
 ###############################################################################
 ## Data pre-processing
 ###############################################################################
-df.replace (['NaN', 'NaT'], np.nan, inplace = True)
-df.replace ('?', np.nan, inplace = True)
-df.replace ('Infinity', np.nan, inplace = True)
+## '?', 'NaN' and 'NaT' are parsed as missing values, infinities are
+## replaced by NaN while loading (fill_value)
 
 ###############################################################################
 ### Remove columns with only one value
@@ -175,8 +167,8 @@ print ('Objects:', list (df.select_dtypes ( ['object']).columns), '\n')
 print ('\nHandling categorical attributes (label encoding).')
 print ('ip.flags.df and ip.flags.mf have been incorrectly read as objects.')
 print ('Converting them to numeric.')
-df ['ip.flags.df'] = pd.to_numeric (df ['ip.flags.df'])
-df ['ip.flags.mf'] = pd.to_numeric (df ['ip.flags.mf'])
+df ['ip.flags.df'] = df ['ip.flags.df'].astype (float)
+df ['ip.flags.mf'] = df ['ip.flags.mf'].astype (float)
 
 ### K: 'packet_type': {in, out} -> {0, 1}
 from sklearn.preprocessing import LabelEncoder
@@ -200,11 +192,8 @@ df.drop (axis = 'columns', columns = 'class_is_malicious', inplace = True)
 ###############################################################################
 print ('Encoding label.')
 print ('Label types before conversion:', df ['class_attack_type'].unique ())
-df ['class_attack_type'] = df ['class_attack_type'].replace ('N/A', 0)
-df ['class_attack_type'] = df ['class_attack_type'].replace ('DoS', 1)
-df ['class_attack_type'] = df ['class_attack_type'].replace ('iot-toolkit', 2)
-df ['class_attack_type'] = df ['class_attack_type'].replace ('MITM', 3)
-df ['class_attack_type'] = df ['class_attack_type'].replace ('Scanning', 4)
+df ['class_attack_type'] = encode_labels (df ['class_attack_type'],
+                                          'multiclass')
 print ('Label types after conversion:', df ['class_attack_type'].unique ())
 
 
@@ -254,18 +243,20 @@ print ('y_test_df shape:', y_test_df.shape)
 #print ('\nTest:')
 #print (X_test_df.isnull ().sum ())
 
-from sklearn.impute import SimpleImputer
-for myColumn, myStrategy in zip (columsWithMissingValues, imputingStrategies):
-  myImputer = SimpleImputer (missing_values = np.nan, strategy = myStrategy)
-  myImputer.fit (X_train_df [myColumn].values.reshape (-1, 1))
-  X_train_df [myColumn] = myImputer.transform (X_train_df [myColumn].values.reshape (-1, 1))
-  X_val_df [myColumn] = myImputer.transform (X_val_df [myColumn].values.reshape (-1, 1))
-  X_test_df [myColumn] = myImputer.transform (X_test_df [myColumn].values.reshape (-1, 1))
-
-# Round ip.ttl
-X_train_df ['ip.ttl'] = X_train_df ['ip.ttl'].round (decimals = 0)
-X_val_df ['ip.ttl'] = X_val_df ['ip.ttl'].round (decimals = 0)
-X_test_df ['ip.ttl'] = X_test_df ['ip.ttl'].round (decimals = 0)
+### K: One imputer for all the columns, fitted on the train set only. It
+### works in place on the numpy blocks, so they are extracted here.
+from unit import ColumnImputer
+X_train = X_train_df.to_numpy (dtype = np.float64, copy = True)
+X_val = X_val_df.to_numpy (dtype = np.float64, copy = True)
+X_test = X_test_df.to_numpy (dtype = np.float64, copy = True)
+myImputer = ColumnImputer (dict (zip (columsWithMissingValues,
+                                     imputingStrategies)), n_jobs = -1)
+myImputer.fit (X_train, columns = list (X_train_df.columns))
+TTL = X_train_df.columns.get_loc ('ip.ttl')
+for X in [X_train, X_val, X_test]:
+  myImputer.transform (X)
+  # Round ip.ttl
+  X [:, TTL] = X [:, TTL].round (decimals = 0)
 
 #print ('\n\nColumn | NaN values (before imputing)')
 #print ('\nTrain:')
@@ -278,12 +269,9 @@ X_test_df ['ip.ttl'] = X_test_df ['ip.ttl'].round (decimals = 0)
 ###############################################################################
 ## Convert dataframe to a numpy array
 ###############################################################################
-print ('\nConverting dataframe to numpy array.')
-X_train = X_train_df.values
+print ('\nConverting dataframe to numpy array (labels).')
 y_train = y_train_df.values
-X_val = X_val_df.values
 y_val = y_val_df.values
-X_test = X_test_df.values
 y_test = y_test_df.values
 print ('X_train shape:', X_train.shape)
 print ('y_train shape:', y_train.shape)
@@ -309,48 +297,26 @@ X_val = scaler.transform (X_val)
 ## Handle imbalanced data
 ###############################################################################
 ### K: 10,000 samples per attack
+### K: Only index arrays are drawn, the resampled sets are never copied.
 from collections import Counter
-from imblearn.over_sampling import RandomOverSampler
-from imblearn.under_sampling import RandomUnderSampler
+from unit import BalancedSampler
 print ('\nHandling imbalanced label distribution.')
 
 ### Only oversample
-myOversampler = RandomOverSampler (sampling_strategy = 'not majority',
-                                   random_state = STATE)
-X_over, y_over = myOversampler.fit_resample (X_train, y_train)
+myOversampler = BalancedSampler ('over', state = STATE).fit (y_train)
 
 ### Only undersample
-myUndersampler = RandomUnderSampler (sampling_strategy = 'not minority',
-                                     random_state = STATE)
-X_under, y_under = myUndersampler.fit_resample (X_train, y_train)
+myUndersampler = BalancedSampler ('under', state = STATE).fit (y_train)
 
 ### Balanced
 MAX_SAMPLES = int (1e4)
-labels = dict (Counter (y_train))
-sampleDictOver = {'N/A': max (labels ['N/A'], MAX_SAMPLES),
-                  'Scanning': max (labels ['Scanning'], MAX_SAMPLES),
-                  'DoS': max (labels ['DoS'], MAX_SAMPLES),
-                  'MITM': max (labels ['MITM'], MAX_SAMPLES),
-                  'iot-toolkit': max (labels ['iot-toolkit'], MAX_SAMPLES)
-                 }
-balancedOverSampler = RandomOverSampler (sampling_strategy = sampleDictOver,
-                                         random_state = STATE)
-X_bal, y_bal = balancedOverSampler.fit_resample (X_train, y_train)
-labels = dict (Counter (y_bal))
-sampleDictUnder = {'N/A': min (labels ['N/A'], MAX_SAMPLES),
-                   'Scanning': min (labels ['Scanning'], MAX_SAMPLES),
-                   'DoS': min (labels ['DoS'], MAX_SAMPLES),
-                   'MITM': min (labels ['MITM'], MAX_SAMPLES),
-                   'iot-toolkit': min (labels ['iot-toolkit'], MAX_SAMPLES)
-                  }
-balancedUnderSampler = RandomUnderSampler (sampling_strategy = sampleDictUnder,
-                                           random_state = STATE)
-X_bal, y_bal = balancedUnderSampler.fit_resample (X_bal, y_bal)
+balancedSampler = BalancedSampler ('capped', max_samples = MAX_SAMPLES,
+                                   state = STATE).fit (y_train)
 
 print ('Real:', Counter (y_train))
-print ('Over:', Counter (y_over))
-print ('Under:', Counter (y_under))
-print ('Balanced:', Counter (y_bal))
+print ('Over:', myOversampler.counts ())
+print ('Under:', myUndersampler.counts ())
+print ('Balanced:', balancedSampler.counts ())
 
 
 ###############################################################################
@@ -404,6 +370,13 @@ history = model.fit (X_train, y_train,
                      verbose = 2, # 1 = progress bar, not useful for logging
                      validation_data = (X_val, y_val)
                     )
+### K: Balanced mini-batches drawn straight from X_train:
+#history = model.fit (balancedSampler.batches (X_train, y_train, BATCH_SIZE),
+#                     steps_per_epoch = balancedSampler.steps (BATCH_SIZE),
+#                     epochs = NUMBER_OF_EPOCHS,
+#                     verbose = 2,
+#                     validation_data = (X_val, y_val)
+#                    )
 
 
 ###############################################################################
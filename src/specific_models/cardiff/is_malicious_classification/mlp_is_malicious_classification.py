@@ -6,7 +6,8 @@ import pandas as pd
 import numpy as np
 import sys
 import matplotlib.pyplot as plt
-from scipy.io import arff
+sys.path.append ('..')
+from unit import load_arff
 
 
 ###############################################################################
@@ -25,19 +26,11 @@ FILE_NAME = IOT_DIRECTORY + IOT_IS_MALICIOUS_FILENAME
 ###############################################################################
 pd.set_option ('display.max_rows', None)
 pd.set_option ('display.max_columns', 5)
-data = arff.loadarff (FILE_NAME)
-df = pd.DataFrame (data [0])
+### K: Nominal attributes are read as categoricals, no byte strings to decode.
+df = load_arff (FILE_NAME, fill_value = np.nan)
 print ('Dataframe shape (lines, collumns):', df.shape, '\n')
 print ('First 5 entries:\n', df [:5], '\n')
 
-### Decode byte strings into ordinary strings:
-print ('Decoding byte strings into ordinary strings.')
-strings = df.select_dtypes ( [np.object])
-strings = strings.stack ().str.decode ('utf-8').unstack ()
-for column in strings:
-  df [column] = strings [column]
-print ('Done.\n')
-
 ###############################################################################
 ## Display generic (dataset independent) information
 ###############################################################################
@@ -62,9 +55,8 @@ print ('Label distribution:\n', df ['class_is_malicious'].value_counts ())
 ###############################################################################
 ## Perform some form of basic preprocessing
 ###############################################################################
-df.replace ( ['NaN', 'NaT'], np.nan, inplace = True)
-df.replace ('?', np.nan, inplace = True)
-df.replace ('Infinity', np.nan, inplace = True)
+## '?', 'NaN' and 'NaT' are parsed as missing values, infinities are
+## replaced by NaN while loading (fill_value)
 
 ## Remove NaN values
 print ('Column | NaN values')
@@ -138,8 +130,8 @@ df.drop (axis = 'columns', columns = 'class_attack_type', inplace = True)
 ### K: 'class_is_malicious' also
 print ('ip.flags.df and ip.flags.mf have been incorrectly read as objects.')
 print ('Converting them to numeric.')
-df ['ip.flags.df'] = pd.to_numeric (df ['ip.flags.df'])
-df ['ip.flags.mf'] = pd.to_numeric (df ['ip.flags.mf'])
+df ['ip.flags.df'] = df ['ip.flags.df'].astype (float)
+df ['ip.flags.mf'] = df ['ip.flags.mf'].astype (float)
 print ('Objects:', list (df.select_dtypes ( ['object']).columns), '\n')
 
 
@@ -147,7 +139,7 @@ print ('Objects:', list (df.select_dtypes ( ['object']).columns), '\n')
 ## Encode Label
 ###############################################################################
 print ('Encoding label.')
-df ['class_is_malicious'] = pd.to_numeric (df ['class_is_malicious'])
+df ['class_is_malicious'] = df ['class_is_malicious'].astype (float)
 
 
 ###############################################################################
@@ -6,7 +6,7 @@ import pandas as pd
 import numpy as np
 import sys
 import matplotlib.pyplot as plt
-from scipy.io import arff
+from unit import load_arff, encode_labels
 
 
 ###############################################################################
@@ -25,8 +25,8 @@ FILE_NAME = IOT_DIRECTORY + IOT_ATTACK_TYPE_FILENAME
 ###############################################################################
 pd.set_option ('display.max_rows', None)
 pd.set_option ('display.max_columns', 5)
-data = arff.loadarff (FILE_NAME)
-df = pd.DataFrame (data [0])
+### K: Nominal attributes are read as categoricals, no byte strings to decode.
+df = load_arff (FILE_NAME, fill_value = np.nan)
 print ('Dataframe shape (lines, collumns):', df.shape, '\n')
 print ('First 5 entries:\n', df [:5], '\n')
 
@@ -34,14 +34,6 @@ print ('First 5 entries:\n', df [:5], '\n')
 #df = df.sample (frac = 0.1, replace = True, random_state = STATE)
 #print ('Using fractured dataframe.')
 
-### Decode byte strings into ordinary strings:
-print ('Decoding byte strings into ordinary strings.')
-strings = df.select_dtypes ( [np.object])
-strings = strings.stack ().str.decode ('utf-8').unstack ()
-for column in strings:
-  df [column] = strings [column]
-print ('Done.\n')
-
 ###############################################################################
 ## Display generic (dataset independent) information
 ###############################################################################
@@ -67,9 +59,8 @@ print ('Label distribution:\n', df ['class_attack_type'].value_counts ())
 ###############################################################################
 ## Perform some form of basic preprocessing
 ###############################################################################
-df.replace ( ['NaN', 'NaT'], np.nan, inplace = True)
-df.replace ('?', np.nan, inplace = True)
-df.replace ('Infinity', np.nan, inplace = True) ## Maybe other text values
+## '?', 'NaN' and 'NaT' are parsed as missing values, infinities are
+## replaced by NaN while loading (fill_value)
 ## Remove NaN values
 print ('Column | NaN values')
 print (df.isnull ().sum ())
@@ -120,11 +111,8 @@ print ('\n\n', df.nunique ())
 ###############################################################################
 print ('Enconding label.')
 print ('Label types before conversion:', df ['class_attack_type'].unique ())
-df ['class_attack_type'] = df ['class_attack_type'].replace ('N/A', 0)
-df ['class_attack_type'] = df ['class_attack_type'].replace ('DoS', 1)
-df ['class_attack_type'] = df ['class_attack_type'].replace ('iot-toolkit', 2)
-df ['class_attack_type'] = df ['class_attack_type'].replace ('MITM', 3)
-df ['class_attack_type'] = df ['class_attack_type'].replace ('Scanning', 4)
+df ['class_attack_type'] = encode_labels (df ['class_attack_type'],
+                                          'multiclass')
 print ('Label types after conversion:', df ['class_attack_type'].unique ())
 
 
@@ -160,8 +148,8 @@ df.drop (axis = 'columns', columns = 'class_is_malicious', inplace = True)
 ### just convert them instead of treating them as categorical.
 print ('ip.flags.df and ip.flags.mf have been incorrectly read as objects.')
 print ('Converting them to numeric.')
-df ['ip.flags.df'] = pd.to_numeric (df ['ip.flags.df'])
-df ['ip.flags.mf'] = pd.to_numeric (df ['ip.flags.mf'])
+df ['ip.flags.df'] = df ['ip.flags.df'].astype (float)
+df ['ip.flags.mf'] = df ['ip.flags.mf'].astype (float)
 print (df.nunique ())
 print ('Objects:', list (df.select_dtypes ( ['object']).columns), '\n')
 
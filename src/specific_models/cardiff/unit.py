@@ -0,0 +1,591 @@
+# Author: Kaylani Bochie
+# github.com/kaylani2
+# kaylani AT gta DOT ufrj DOT br
+
+import os
+import csv
+import json
+import shutil
+import hashlib
+import tempfile
+import warnings
+import pandas as pd
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+### K: Bump when load_arff changes, so old cache entries are not reused.
+CACHE_VERSION = 3
+NUMERIC_TYPES = ['numeric', 'real', 'integer']
+### K: Label registry for class_attack_type. Binary is attack or not, which
+### agrees with class_is_malicious.
+CARDIFF_ATTACKS = ['DoS', 'iot-toolkit', 'MITM', 'Scanning']
+LABELS = {'binary': dict ([('N/A', 0)] +
+                          [(attack, 1) for attack in CARDIFF_ATTACKS]),
+          'multiclass': dict ([('N/A', 0)] +
+                              [(attack, code + 1) for code, attack
+                               in enumerate (CARDIFF_ATTACKS)])}
+
+def hash_files (file_names, cache_directory = None):
+  '''
+  Parameters:
+  -----------
+  file_names: list of str
+
+  cache_directory: str, default = None
+    If given, file digests are remembered (by path, size and modification
+    time) in cache_directory/digests.json, so files are only hashed once.
+
+  Returns:
+  --------
+  digest: str
+    SHA-1 of the names, sizes and contents of the files.
+
+  Examples:
+  ---------
+  >>> digest = hash_files (['IoT-File_1.csv', 'IoT-File_2.csv'])
+  '''
+  known = {}
+  digests_file = None
+  if (cache_directory is not None):
+    digests_file = os.path.join (cache_directory, 'digests.json')
+    if (os.path.isfile (digests_file)):
+      with open (digests_file) as f:
+        known = json.load (f)
+
+  my_hash = hashlib.sha1 ()
+  for file_name in file_names:
+    stat = os.stat (file_name)
+    stamp = '{}:{}:{}'.format (os.path.abspath (file_name), stat.st_size,
+                               stat.st_mtime_ns)
+    if (stamp not in known):
+      file_hash = hashlib.sha1 ()
+      with open (file_name, 'rb') as f:
+        for block in iter (lambda: f.read (2**20), b''):
+          file_hash.update (block)
+      known [stamp] = file_hash.hexdigest ()
+    my_hash.update ('{}:{}:{}'.format (os.path.basename (file_name),
+                                       stat.st_size, known [stamp]).encode ())
+
+  if (digests_file is not None):
+    os.makedirs (cache_directory, exist_ok = True)
+    ### K: Written aside and renamed, a concurrent run never reads half a file.
+    temporary = '{}.{}.tmp'.format (digests_file, os.getpid ())
+    with open (temporary, 'w') as f:
+      json.dump (known, f, indent = 1)
+    os.replace (temporary, digests_file)
+  return my_hash.hexdigest ()
+
+def publish_directory (temporary, directory):
+  '''
+  Parameters:
+  -----------
+  temporary: str
+    Complete entry, written aside.
+
+  directory: str
+    Final name. An incomplete entry (no meta.json) is replaced. If another
+    run published a complete one first, it is kept and temporary is removed.
+
+  Returns:
+  --------
+  NULL
+  '''
+  if (not os.path.isfile (os.path.join (directory, 'meta.json'))):
+    shutil.rmtree (directory, ignore_errors = True)
+  try:
+    os.replace (temporary, directory)
+  except OSError:
+    shutil.rmtree (temporary, ignore_errors = True)
+
+def save_columnar (df, directory):
+  '''
+  Parameters:
+  -----------
+  df: pandas.DataFrame
+
+  directory: str
+    One .npy file per column (and one for the index) plus meta.json.
+    Categorical and object columns are stored as integer codes (object
+    columns are restored as object by load_columnar).
+
+  Returns:
+  --------
+  NULL
+
+  Examples:
+  ---------
+  >>> save_columnar (df, 'cache/0a1b2c')
+  '''
+  ### K: Unique temporary directory, runs started at the same time (other
+  ### seeds) may be writing the same entry.
+  parent = os.path.dirname (os.path.abspath (directory))
+  os.makedirs (parent, exist_ok = True)
+  temporary = tempfile.mkdtemp (dir = parent,
+                                prefix = os.path.basename (directory) + '.tmp')
+  meta = {'index': df.index.name, 'shape': list (df.shape), 'columns': []}
+  np.save (os.path.join (temporary, 'index.npy'), df.index.to_numpy ())
+  for number, column in enumerate (df.columns):
+    values = df [column]
+    entry = {'name': column, 'file': '{}.npy'.format (number)}
+    if ((pd.api.types.is_object_dtype (values.dtype)) or
+        (isinstance (values.dtype, pd.StringDtype))):
+      entry ['object'] = True
+      values = values.astype ('category')
+    if (isinstance (values.dtype, pd.CategoricalDtype)):
+      entry ['categories'] = [str (category)
+                              for category in values.cat.categories]
+      values = values.cat.codes
+    np.save (os.path.join (temporary, entry ['file']), values.to_numpy ())
+    meta ['columns'].append (entry)
+  with open (os.path.join (temporary, 'meta.json'), 'w') as f:
+    json.dump (meta, f, indent = 1)
+  publish_directory (temporary, directory)
+
+def load_columnar (directory, mmap_mode = None):
+  '''
+  Parameters:
+  -----------
+  directory: str
+    Written by save_columnar.
+
+  mmap_mode: str, default = None
+    Passed to numpy.load ('r' maps the columns instead of reading them).
+
+  Returns:
+  --------
+  df: pandas.DataFrame
+
+  Examples:
+  ---------
+  >>> df = load_columnar ('cache/0a1b2c')
+  '''
+  with open (os.path.join (directory, 'meta.json')) as f:
+    meta = json.load (f)
+  data = {}
+  for entry in meta ['columns']:
+    values = np.load (os.path.join (directory, entry ['file']),
+                      mmap_mode = mmap_mode)
+    if ('categories' in entry):
+      values = pd.Categorical.from_codes (values, entry ['categories'])
+      if (entry.get ('object')):
+        values = np.asarray (values, dtype = object)
+    data [entry ['name']] = values
+  index = pd.Index (np.load (os.path.join (directory, 'index.npy')),
+                    name = meta ['index'])
+  return pd.DataFrame (data, index = index, copy = False)
+
+def _split_arff (text):
+  '''
+  Parameters:
+  -----------
+  text: str
+    Comma separated ARFF values, optionally quoted with ' or ".
+
+  Returns:
+  --------
+  values: list of str
+
+  Examples:
+  ---------
+  >>> values = _split_arff ("'in', out, '0'")
+  '''
+  quote = "'" if ("'" in text) else '"'
+  reader = csv.reader ([text], quotechar = quote, skipinitialspace = True)
+  return [value.strip () for value in next (reader)]
+
+def read_arff_header (f):
+  '''
+  Parameters:
+  -----------
+  f: file
+    Open ARFF file. It is left positioned at the first line after @data.
+
+  Returns:
+  --------
+  attributes: list of (str, str or list of str)
+    Attribute name and type ('numeric', 'string', 'date' or the list of
+    nominal values).
+
+  Examples:
+  ---------
+  >>> with open ('AttackTypeClassification.arff') as f:
+  ...   attributes = read_arff_header (f)
+  '''
+  attributes = []
+  for line in f:
+    line = line.strip ()
+    if ((not line) or (line.startswith ('%'))):
+      continue
+    keyword = line.split (None, 1) [0].lower ()
+    if (keyword == '@data'):
+      return attributes
+    if (keyword != '@attribute'):
+      continue
+    line = line.split (None, 1) [1].strip ()
+    if (line [0] in '\'"'):
+      end = line.index (line [0], 1)
+      name, kind = line [1:end], line [end + 1:].strip ()
+    else:
+      name, kind = line.split (None, 1)
+    if (kind.startswith ('{')):
+      kind = _split_arff (kind [1:kind.rindex ('}')])
+    else:
+      kind = kind.split () [0].lower ()
+      if (kind in NUMERIC_TYPES):
+        kind = 'numeric'
+      elif (kind not in ['string', 'date']):
+        raise ValueError ('Unsupported ARFF attribute type: ' + kind)
+    attributes.append ((name, kind))
+  raise ValueError ('ARFF file has no @data section.')
+
+class _ArffData:
+  ### K: File-like view of the @data section without the % comment lines,
+  ### for read_csv (its comment option would also cut unquoted values).
+  def __init__ (self, f):
+    self.lines = (line for line in f if not line.lstrip ().startswith ('%'))
+    self.buffer = ''
+
+  def read (self, size = -1):
+    while ((size < 0) or (len (self.buffer) < size)):
+      line = next (self.lines, None)
+      if (line is None):
+        break
+      self.buffer += line
+    if (size < 0):
+      size = len (self.buffer)
+    data, self.buffer = self.buffer [:size], self.buffer [size:]
+    return data
+
+def load_arff (file_name, use_cache = True, cache_directory = None,
+               fill_value = None, verbose = True):
+  '''
+  Parameters:
+  -----------
+  file_name: str
+
+  use_cache: bool, default = True
+    Store the parsed frame (keyed by the contents of the file) and reuse it
+    on the next runs.
+
+  cache_directory: str, default = None
+    None means a cache directory next to the ARFF file.
+
+  fill_value: scalar, default = None
+    Replaces NaN and infinities in the numeric attributes, see
+    sanitize_numeric. Use numpy.nan to only get rid of the infinities.
+
+  verbose: bool, default = True
+
+  Returns:
+  --------
+  df: pandas.DataFrame
+    Numeric attributes are float64 columns, nominal attributes are
+    categoricals (codes plus the declared values, undeclared values are
+    missing and raise a warning), string and date attributes are objects.
+    Comment lines (%) in the @data section are skipped. '?' is a missing
+    value everywhere, so are 'NaN' in numeric attributes and 'NaN' and 'NaT'
+    in string and date attributes. Sentinels are converted while parsing, no
+    column is scanned again for them.
+
+  Examples:
+  ---------
+  >>> df = load_arff ('AttackTypeClassification.arff')
+  >>> df = load_arff ('AttackTypeClassification.arff', fill_value = np.nan)
+  '''
+  if (cache_directory is None):
+    cache_directory = os.path.join (os.path.dirname (file_name), 'cache')
+  if (use_cache):
+    my_hash = hashlib.sha1 (hash_files ([file_name], cache_directory).encode ())
+    my_hash.update (str (CACHE_VERSION).encode ())
+    directory = os.path.join (cache_directory, my_hash.hexdigest ())
+    if (os.path.isfile (os.path.join (directory, 'meta.json'))):
+      if (verbose):
+        print ('Loading dataset from cache:', directory)
+      df = load_columnar (directory)
+      if (fill_value is not None):
+        sanitize_numeric (df, fill_value, verbose)
+      return df
+
+  with open (file_name) as f:
+    attributes = read_arff_header (f)
+    names = [name for name, _ in attributes]
+    dtype = {}
+    na_values = {}
+    for name, kind in attributes:
+      if (kind == 'numeric'):
+        dtype [name] = np.float64
+        na_values [name] = ['?', 'NaN', 'nan']
+      elif (isinstance (kind, list)):
+        ### K: Declared values are set after parsing, to catch the others.
+        dtype [name] = 'category'
+        na_values [name] = ['?']
+      else:
+        dtype [name] = object
+        na_values [name] = ['?', 'NaN', 'NaT']
+    ### K: Only the @data section is parsed, straight into the final types.
+    df = pd.read_csv (_ArffData (f), header = None, names = names,
+                      dtype = dtype, na_values = na_values,
+                      keep_default_na = False, quotechar = "'",
+                      skipinitialspace = True, skip_blank_lines = True,
+                      low_memory = False)
+  for name, kind in attributes:
+    if (isinstance (kind, list)):
+      unknown = df [name].cat.categories.difference (kind)
+      if (len (unknown) > 0):
+        warnings.warn ('{}: {} values not declared in @attribute {} are read '
+                       'as missing.'.format (name,
+                       df [name].isin (unknown).sum (), list (unknown)))
+      df [name] = df [name].cat.set_categories (kind)
+  if (verbose):
+    print ('Read', file_name, df.shape)
+
+  if (use_cache):
+    save_columnar (df, directory)
+    if (verbose):
+      print ('Dataset cached at:', directory)
+  if (fill_value is not None):
+    sanitize_numeric (df, fill_value, verbose)
+  return df
+
+def sanitize_numeric (df, fill_value = np.nan, verbose = True):
+  '''
+  Same as sanitize_numeric in cicids/unit.py. load_arff calls it on the
+  parsed or cached frame, the cache keeps the raw values.
+
+  Examples:
+  ---------
+  >>> replaced = sanitize_numeric (df, fill_value = 0)
+  '''
+  floating = df.select_dtypes (include = 'floating').columns
+  replaced = pd.Series (0, index = floating, dtype = np.int64)
+  for dtype in df.dtypes [floating].unique ():
+    columns = floating [df.dtypes [floating] == dtype]
+    values = df [columns].to_numpy (dtype = dtype, copy = True)
+    mask = ~np.isfinite (values)
+    counts = mask.sum (axis = 0)
+    replaced [columns] = counts
+    if (counts.any ()):
+      values [mask] = fill_value
+      df [columns] = values
+  if (verbose and replaced.any ()):
+    print ('Non-finite values replaced by {}:\n{}\n'.format (
+           fill_value, replaced [replaced > 0].to_string ()))
+  return replaced
+
+def encode_labels (labels, mapping = 'binary', unknown = None):
+  '''
+  Same as encode_labels in cicids/unit.py. The benign lines are labeled
+  'N/A' (code 0 in both variants of LABELS).
+
+  Examples:
+  ---------
+  >>> df ['class_attack_type'] = encode_labels (df ['class_attack_type'],
+  ...                                           'multiclass')
+  '''
+  if (isinstance (mapping, str)):
+    mapping = LABELS [mapping]
+  codes, uniques = pd.factorize (labels)
+  uniques = [label.strip () if isinstance (label, str) else label
+             for label in uniques]
+  unknownLabels = [label for label in uniques if label not in mapping]
+  if ((codes == -1).any () and None not in mapping):
+    unknownLabels.append (None)
+  if (unknownLabels and unknown is None):
+    raise ValueError ('Labels not in the mapping: {}'.format (unknownLabels))
+  missing = mapping.get (None, unknown)
+  table = np.array ([mapping.get (label, unknown) for label in uniques] +
+                    [0 if missing is None else missing])
+  return pd.Series (table [codes], index = labels.index, name = labels.name)
+
+class ColumnImputer:
+  '''
+  Replaces the NaN values of several columns, each with its own strategy, in
+  place. The statistics are computed in one pass over the train block, so
+  only information from the train set is used (no leakage). Plain attributes
+  only, so it can be pickled and reused for inference.
+
+  Parameters:
+  -----------
+  strategies: dict
+    column -> 'mean', 'median', 'most_frequent' or a constant value.
+
+  n_jobs: int, default = 1
+    Threads used by transform, one column per task. -1 means one thread per
+    CPU (numpy releases the GIL while masking).
+
+  Attributes:
+  -----------
+  indices: list of int
+    Position of each column in the blocks.
+
+  statistics: numpy.ndarray
+    Value used for each column.
+
+  Examples:
+  ---------
+  >>> imputer = ColumnImputer ({'ip.len': 'median', 'ip.ttl': 'mean'})
+  >>> imputer.fit (X_train, columns = list (X_train_df.columns))
+  >>> for X in [X_train, X_val, X_test]:
+  ...   imputer.transform (X)
+  '''
+  def __init__ (self, strategies, n_jobs = 1):
+    self.strategies = dict (strategies)
+    self.n_jobs = n_jobs
+
+  def fit (self, X, columns = None):
+    '''
+    X: numpy.ndarray or pandas.DataFrame (columns are then taken from it).
+
+    columns: list of str, default = None
+      Column names of the numpy block.
+    '''
+    if (isinstance (X, pd.DataFrame)):
+      columns, X = list (X.columns), X.to_numpy (dtype = np.float64)
+    columns = list (columns)
+    self.indices = [columns.index (column) for column in self.strategies]
+    block = np.asarray (X [:, self.indices], dtype = np.float64)
+    missing = np.isnan (block)
+    self.statistics = np.empty (len (self.indices))
+    for strategy, reducer in [('mean', np.nanmean), ('median', np.nanmedian)]:
+      selected = [j for j, value in enumerate (self.strategies.values ())
+                  if (isinstance (value, str) and value == strategy)]
+      if (selected):
+        self.statistics [selected] = reducer (block [:, selected], axis = 0)
+    for j, strategy in enumerate (self.strategies.values ()):
+      if (not isinstance (strategy, str)):
+        self.statistics [j] = strategy
+      elif (strategy == 'most_frequent'):
+        ### K: Ties go to the smallest value, like SimpleImputer.
+        values, counts = np.unique (block [~missing [:, j], j],
+                                    return_counts = True)
+        self.statistics [j] = (values [np.argmax (counts)] if (values.size)
+                               else np.nan)
+      elif (strategy not in ['mean', 'median']):
+        raise ValueError ('Unknown imputing strategy: ' + strategy)
+    return self
+
+  def _impute (self, X, j):
+    column = X [:, self.indices [j]]
+    column [np.isnan (column)] = self.statistics [j]
+
+  def transform (self, X):
+    '''
+    X: numpy.ndarray (float)
+      Same column layout as the fitted block. Modified in place.
+    '''
+    n_jobs = os.cpu_count () if (self.n_jobs == -1) else self.n_jobs
+    if (n_jobs <= 1):
+      for j in range (len (self.indices)):
+        self._impute (X, j)
+    else:
+      with ThreadPoolExecutor (max_workers = n_jobs) as executor:
+        list (executor.map (lambda j: self._impute (X, j),
+                            range (len (self.indices))))
+    return X
+
+  def fit_transform (self, X, columns = None):
+    return self.fit (X, columns).transform (X)
+
+class BalancedSampler:
+  '''
+  Resamples a labeled set by drawing row indices only: the resampled set is
+  never materialized. Use the indices to slice when a copy is really needed,
+  weights to fit sklearn models (an oversampled row is a row with a larger
+  weight) and batches to feed Keras balanced mini-batches.
+
+  Parameters:
+  -----------
+  strategy: str or dict, default = 'over'
+    'over': every class up to the majority count (originals are kept).
+    'under': every class down to the minority count.
+    'capped': every class to max_samples, oversampling the smaller ones and
+    undersampling the larger ones.
+    A dict maps label -> number of samples.
+
+  max_samples: int, default = None
+    Used by 'capped'.
+
+  state: int, default = 0
+
+  Attributes:
+  -----------
+  classes: numpy.ndarray
+    Labels, sorted.
+
+  members: list of numpy.ndarray
+    Row indices of each class.
+
+  targets: numpy.ndarray
+    Number of samples drawn for each class.
+
+  Examples:
+  ---------
+  >>> sampler = BalancedSampler ('capped', max_samples = 10000).fit (y_train)
+  >>> model.fit (X_train, y_train, sample_weight = sampler.weights ())
+  >>> model.fit (sampler.batches (X_train, y_train_one_hot, 64),
+  ...            steps_per_epoch = sampler.steps (64), epochs = 4)
+  '''
+  def __init__ (self, strategy = 'over', max_samples = None, state = 0):
+    self.strategy = strategy
+    self.max_samples = max_samples
+    self.random = np.random.RandomState (state)
+
+  def fit (self, y):
+    self.size = len (y)
+    self.classes, codes, counts = np.unique (y, return_inverse = True,
+                                             return_counts = True)
+    ### K: One sort groups the rows of every class.
+    order = np.argsort (codes.ravel (), kind = 'stable')
+    self.members = np.split (order, np.cumsum (counts) [:-1])
+    if (isinstance (self.strategy, dict)):
+      self.targets = np.array ([self.strategy.get (label, count)
+                                for label, count in zip (self.classes, counts)])
+    elif (self.strategy == 'over'):
+      self.targets = np.full (len (counts), counts.max ())
+    elif (self.strategy == 'under'):
+      self.targets = np.full (len (counts), counts.min ())
+    elif (self.strategy == 'capped'):
+      self.targets = np.full (len (counts), self.max_samples)
+    else:
+      raise ValueError ('Unknown sampling strategy: ' + str (self.strategy))
+    return self
+
+  def counts (self):
+    return dict (zip (self.classes, self.targets))
+
+  def indices (self):
+    '''
+    Returns:
+    --------
+    indices: numpy.ndarray (int64)
+      Rows of the resampled set, grouped by class. A new draw on each call.
+    '''
+    indices = []
+    for members, target in zip (self.members, self.targets):
+      if (target >= len (members)):
+        extra = self.random.choice (members, target - len (members))
+        indices.append (np.concatenate ( (members, extra)))
+      else:
+        indices.append (self.random.choice (members, target, replace = False))
+    return np.concatenate (indices).astype (np.int64)
+
+  def weights (self):
+    return np.bincount (self.indices (), minlength = self.size)
+
+  def steps (self, batch_size):
+    return int (np.ceil (self.targets.sum () / batch_size))
+
+  def batches (self, X, y, batch_size = 32):
+    '''
+    Endless (x, y) generator for Keras. Every epoch draws new indices and
+    shuffles them, only one batch is copied from X and y at a time.
+
+    y: numpy.ndarray
+      Targets as the model expects them (one hot encoded, for instance), in
+      the same row order as the labels given to fit.
+    '''
+    while (True):
+      indices = self.random.permutation (self.indices ())
+      for start in range (0, len (indices), batch_size):
+        batch = np.sort (indices [start:start + batch_size])
+        yield X [batch], y [batch]
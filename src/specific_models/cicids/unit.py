@@ -0,0 +1,279 @@
+# Author: Kaylani Bochie
+# github.com/kaylani2
+# kaylani AT gta DOT ufrj DOT br
+
+import time
+import pandas as pd
+import numpy as np
+
+CICIDS_DIRECTORY = '../../../datasets/cicids/MachineLearningCVE/'
+### K: All eight days, in capture order.
+CICIDS_FILES = ['Monday-WorkingHours.pcap_ISCX.csv',
+                'Tuesday-WorkingHours.pcap_ISCX.csv',
+                'Wednesday-workingHours.pcap_ISCX.csv',
+                'Thursday-WorkingHours-Morning-WebAttacks.pcap_ISCX.csv',
+                'Thursday-WorkingHours-Afternoon-Infilteration.pcap_ISCX.csv',
+                'Friday-WorkingHours-Morning.pcap_ISCX.csv',
+                'Friday-WorkingHours-Afternoon-PortScan.pcap_ISCX.csv',
+                'Friday-WorkingHours-Afternoon-DDos.pcap_ISCX.csv']
+TARGET = 'Label'
+### K: The web attack labels contain a non UTF-8 dash.
+ENCODING = 'latin-1'
+### K: Label registry. The multiclass codes of the Wednesday (DoS) labels are
+### the ones used by the older scripts, the other days follow. The web attack
+### labels use the latin-1 dash ('\x96').
+CICIDS_ATTACKS = ['DoS slowloris', 'DoS Slowhttptest', 'DoS Hulk',
+                  'DoS GoldenEye', 'Heartbleed', 'FTP-Patator', 'SSH-Patator',
+                  'Web Attack \x96 Brute Force', 'Web Attack \x96 XSS',
+                  'Web Attack \x96 Sql Injection', 'Infiltration', 'Bot',
+                  'PortScan', 'DDoS']
+LABELS = {'binary': dict ([('BENIGN', 0)] +
+                          [(attack, 1) for attack in CICIDS_ATTACKS]),
+          'multiclass': dict ([('BENIGN', 0)] +
+                              [(attack, code + 1) for code, attack
+                               in enumerate (CICIDS_ATTACKS)])}
+
+
+def normalize_columns (df):
+  '''
+  Parameters:
+  -----------
+  df: pandas.DataFrame
+    Modified in place.
+
+  Returns:
+  --------
+  df: pandas.DataFrame
+    Same dataframe, without the pesky spaces around the column names
+    (' Label' -> 'Label').
+
+  Examples:
+  ---------
+  >>> df = normalize_columns (pd.read_csv (file_name))
+  '''
+  df.columns = df.columns.str.strip ()
+  return df
+
+
+def count_labels (file_names, target = TARGET):
+  '''
+  Parameters:
+  -----------
+  file_names: list of str
+
+  target: str, default = 'Label'
+    Label column, after normalization.
+
+  Returns:
+  --------
+  counts: pandas.Series
+    Number of lines for each label across all files. Only the label column is
+    parsed.
+
+  Examples:
+  ---------
+  >>> count_labels ([CICIDS_DIRECTORY + CICIDS_FILES [2]])
+  '''
+  counts = pd.Series (dtype = np.int64)
+  for file_name in file_names:
+    labels = pd.read_csv (file_name, encoding = ENCODING,
+                          usecols = lambda column: column.strip () == target)
+    counts = counts.add (labels.iloc [:, 0].value_counts (), fill_value = 0)
+  return counts.astype (np.int64)
+
+
+def load_cicids (directory = CICIDS_DIRECTORY, files = CICIDS_FILES,
+                 fraction = None, per_label = None, state = 0,
+                 chunksize = 200000, target = TARGET, fill_value = None,
+                 verbose = True):
+  '''
+  Parameters:
+  -----------
+  directory: str
+
+  files: list of str, default = CICIDS_FILES (all days)
+
+  fraction: float, default = None
+    Keep this fraction of the lines of each label (stratified). Requires a
+    first pass over the label column to count them.
+
+  per_label: int or dict, default = None
+    Keep at most this many lines of each label (a dict maps label -> count).
+    Labels missing from the dict are kept whole. Takes precedence over
+    fraction. With neither, every line is kept.
+
+  state: int, default = 0
+    Random state for the reservoirs.
+
+  chunksize: int, default = 200000
+    Lines parsed at a time. Only the chunk and the reservoirs live in memory.
+
+  target: str, default = 'Label'
+
+  fill_value: scalar, default = None
+    Replaces NaN and infinities ('Infinity' in Flow Bytes/s and Flow
+    Packets/s) in the floating point columns, once, after sampling. See
+    sanitize_numeric.
+
+  verbose: bool, default = True
+
+  Returns:
+  --------
+  df: pandas.DataFrame
+    Normalized column names, lines in file order, indexed by their position
+    across the concatenated files. Lines without a label (trailing empty
+    lines in some days) are skipped.
+
+  Examples:
+  ---------
+  >>> df = load_cicids (files = ['Wednesday-workingHours.pcap_ISCX.csv'],
+  ...                   fraction = 0.1)
+  >>> df = load_cicids (per_label = 10000, fill_value = 0)
+  '''
+  file_names = [directory + file_name for file_name in files]
+  capacity = None
+  if (per_label is not None):
+    if (isinstance (per_label, dict)):
+      capacity = dict (per_label)
+    else:
+      capacity = {label: int (per_label)
+                  for label in count_labels (file_names, target).index}
+  elif (fraction is not None):
+    counts = count_labels (file_names, target)
+    capacity = {label: max (1, int (round (fraction * count)))
+                for label, count in counts.items ()}
+
+  ### K: Reservoir sampling with random priorities: each line draws a key and
+  ### each label keeps the lines with the smallest keys seen so far. That is a
+  ### uniform sample without replacement, and lines whose key is above a full
+  ### reservoir's largest key are dropped before they are copied.
+  random = np.random.RandomState (state)
+  reservoirs = {}
+  offset = 0
+  for file_name in file_names:
+    startTime = time.time ()
+    lines = 0
+    for chunk in pd.read_csv (file_name, encoding = ENCODING,
+                              chunksize = chunksize):
+      normalize_columns (chunk)
+      chunk.index = np.arange (offset, offset + len (chunk))
+      offset += len (chunk)
+      lines += len (chunk)
+      chunk = chunk [chunk [target].notna ()]
+      if (capacity is None):
+        reservoirs.setdefault (None, []).append (chunk)
+        continue
+      keys = random.random_sample (len (chunk))
+      thresholds = chunk [target].map (
+        {label: reservoir [1] [-1] for label, reservoir in reservoirs.items ()
+         if len (reservoir [1]) == capacity.get (label)}).fillna (np.inf)
+      keep = keys < thresholds.values
+      chunk, keys = chunk [keep], keys [keep]
+      for label, group in chunk.groupby (target, sort = False):
+        group_keys = keys [chunk [target].values == label]
+        if (label in reservoirs):
+          group = pd.concat ([reservoirs [label] [0], group])
+          group_keys = np.concatenate ([reservoirs [label] [1], group_keys])
+        if (label in capacity):
+          order = np.argsort (group_keys, kind = 'stable') [:capacity [label]]
+          group, group_keys = group.iloc [order], group_keys [order]
+        reservoirs [label] = (group, group_keys)
+    if (verbose):
+      print (file_name, lines, 'lines,', round (time.time () - startTime, 2),
+             's')
+
+  if (capacity is None):
+    df = pd.concat (reservoirs [None])
+  else:
+    df = pd.concat ([reservoir [0] for reservoir in reservoirs.values ()])
+    df.sort_index (inplace = True)
+  if (fill_value is not None):
+    sanitize_numeric (df, fill_value, verbose)
+  if (verbose):
+    print ('Sampled label distribution:\n', df [target].value_counts (), '\n')
+  return df
+
+
+def sanitize_numeric (df, fill_value = np.nan, verbose = True):
+  '''
+  Parameters:
+  -----------
+  df: pandas.DataFrame
+    Modified in place.
+
+  fill_value: scalar, default = numpy.nan
+    Replaces NaN and infinities (already parsed as floats) in the floating
+    point columns. Integer columns can not hold either and object columns
+    are left alone.
+
+  verbose: bool, default = True
+
+  Returns:
+  --------
+  replaced: pandas.Series (int64)
+    Number of values replaced in each floating point column.
+
+  Examples:
+  ---------
+  >>> replaced = sanitize_numeric (df, fill_value = 0)
+  '''
+  floating = df.select_dtypes (include = 'floating').columns
+  replaced = pd.Series (0, index = floating, dtype = np.int64)
+  ### K: One pass per dtype block, columns are only written back if
+  ### something was replaced.
+  for dtype in df.dtypes [floating].unique ():
+    columns = floating [df.dtypes [floating] == dtype]
+    values = df [columns].to_numpy (dtype = dtype, copy = True)
+    mask = ~np.isfinite (values)
+    counts = mask.sum (axis = 0)
+    replaced [columns] = counts
+    if (counts.any ()):
+      values [mask] = fill_value
+      df [columns] = values
+  if (verbose and replaced.any ()):
+    print ('Non-finite values replaced by {}:\n{}\n'.format (
+           fill_value, replaced [replaced > 0].to_string ()))
+  return replaced
+
+
+def encode_labels (labels, mapping = 'binary', unknown = None):
+  '''
+  Parameters:
+  -----------
+  labels: pandas.Series
+    Raw labels. Surrounding spaces are ignored.
+
+  mapping: str or dict, default = 'binary'
+    A variant from LABELS ('binary', 'multiclass') or a dict label ->
+    code. The None key, if present, is the code for missing labels.
+
+  unknown: scalar, default = None
+    Code for labels missing from the mapping. With None, unknown labels raise
+    a ValueError instead of being silently left as strings.
+
+  Returns:
+  --------
+  codes: pandas.Series
+    Same index and name as labels.
+
+  Examples:
+  ---------
+  >>> df ['Label'] = encode_labels (df ['Label'], 'multiclass')
+  '''
+  if (isinstance (mapping, str)):
+    mapping = LABELS [mapping]
+  ### K: One factorize pass over the column, the lookup is done on the
+  ### distinct labels only and the codes are taken back in one go.
+  codes, uniques = pd.factorize (labels)
+  uniques = [label.strip () if isinstance (label, str) else label
+             for label in uniques]
+  unknownLabels = [label for label in uniques if label not in mapping]
+  if ((codes == -1).any () and None not in mapping):
+    unknownLabels.append (None)
+  if (unknownLabels and unknown is None):
+    raise ValueError ('Labels not in the mapping: {}'.format (unknownLabels))
+  ### K: The last entry is taken by the missing labels (code -1).
+  missing = mapping.get (None, unknown)
+  table = np.array ([mapping.get (label, unknown) for label in uniques] +
+                    [0 if missing is None else missing])
+  return pd.Series (table [codes], index = labels.index, name = labels.name)
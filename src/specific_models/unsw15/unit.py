@@ -0,0 +1,218 @@
+# Author: Kaylani Bochie
+# github.com/kaylani2
+# kaylani AT gta DOT ufrj DOT br
+
+import os
+import multiprocessing
+import time
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+UNSW_NB15_DIRECTORY = r'../datasets/unsw-nb15/UNSW-NB15 - CSV Files/'
+UNSW_NB15_FILES = ['UNSW-NB15_1.csv', 'UNSW-NB15_2.csv', 'UNSW-NB15_3.csv',
+                   'UNSW-NB15_4.csv']
+### K: The parts have no header, these are the 49 features from
+### NUSW-NB15_features.csv, in file order.
+UNSW_NB15_DTYPES = {'srcip': object, 'sport': object, 'dstip': object,
+                    'dsport': object, 'proto': object, 'state': object,
+                    'dur': np.float64, 'sbytes': np.int64,
+                    'dbytes': np.int64, 'sttl': np.int64, 'dttl': np.int64,
+                    'sloss': np.int64, 'dloss': np.int64, 'service': object,
+                    'Sload': np.float64, 'Dload': np.float64,
+                    'Spkts': np.int64, 'Dpkts': np.int64, 'swin': np.int64,
+                    'dwin': np.int64, 'stcpb': np.int64, 'dtcpb': np.int64,
+                    'smeansz': np.int64, 'dmeansz': np.int64,
+                    'trans_depth': np.int64, 'res_bdy_len': np.int64,
+                    'Sjit': np.float64, 'Djit': np.float64,
+                    'Stime': np.int64, 'Ltime': np.int64,
+                    'Sintpkt': np.float64, 'Dintpkt': np.float64,
+                    'tcprtt': np.float64, 'synack': np.float64,
+                    'ackdat': np.float64, 'is_sm_ips_ports': np.int64,
+                    'ct_state_ttl': np.int64, 'ct_flw_http_mthd': np.float64,
+                    'is_ftp_login': np.float64, 'ct_ftp_cmd': np.float64,
+                    'ct_srv_src': np.int64, 'ct_srv_dst': np.int64,
+                    'ct_dst_ltm': np.int64, 'ct_src_ltm': np.int64,
+                    'ct_src_dport_ltm': np.int64,
+                    'ct_dst_sport_ltm': np.int64,
+                    'ct_dst_src_ltm': np.int64, 'attack_cat': object,
+                    'Label': np.int64}
+UNSW_NB15_COLUMNS = list (UNSW_NB15_DTYPES)
+PORT_COLUMNS = ['sport', 'dsport']
+### K: Infinities become NaN while parsing, blank cells too.
+NAN_VALUES = ['Infinity', '-Infinity', 'inf', '-inf', ' ']
+### K: Label registry for attack_cat. Normal traffic has no category (None
+### key). Some parts spell 'Backdoor' and others 'Backdoors'.
+UNSW_NB15_ATTACKS = ['Analysis', 'Backdoors', 'DoS', 'Exploits', 'Fuzzers',
+                     'Generic', 'Reconnaissance', 'Shellcode', 'Worms']
+LABELS = {'binary': dict ([(None, 0), ('Backdoor', 1)] +
+                          [(attack, 1) for attack in UNSW_NB15_ATTACKS]),
+          'multiclass': dict ([(None, 0), ('Backdoor', 2)] +
+                              [(attack, code + 1) for code, attack
+                               in enumerate (UNSW_NB15_ATTACKS)])}
+
+
+def parse_ports (values, missing = -1):
+  '''
+  Parameters:
+  -----------
+  values: pandas.Series
+    Ports as read from the file: decimal strings, a few hexadecimal ones
+    ('0xc0a8', '0x20205321') and '-' for flows without ports.
+
+  missing: int, default = -1
+    Value used for ports that are not numbers at all.
+
+  Returns:
+  --------
+  ports: pandas.Series (int64)
+
+  Examples:
+  ---------
+  >>> parse_ports (pd.Series (['80', '0xc0a8', '-']))
+  0       80
+  1    49320
+  2       -1
+  dtype: int64
+  '''
+  ports = pd.to_numeric (values, errors = 'coerce')
+  ### K: Only the few values that are not decimal go through Python.
+  hexadecimal = ports.isna () & values.str.startswith ('0x', na = False)
+  if (hexadecimal.any ()):
+    ports [hexadecimal] = values [hexadecimal].map (lambda port: int (port, 16))
+  return ports.fillna (missing).astype (np.int64)
+
+
+def _read_part (file_name, fill_value = None):
+  '''
+  Parameters:
+  -----------
+  file_name: str
+
+  fill_value: scalar, default = None
+    Replaces NaN (and infinities) in the numeric columns.
+
+  Returns:
+  --------
+  df: pandas.DataFrame
+
+  elapsed: float
+
+  size: int
+
+  Examples:
+  ---------
+  >>> df, elapsed, size = _read_part ('UNSW-NB15_1.csv', fill_value = 0)
+  '''
+  startTime = time.time ()
+  arguments = dict (header = None, names = UNSW_NB15_COLUMNS,
+                    na_values = NAN_VALUES, low_memory = False)
+  try:
+    df = pd.read_csv (file_name, dtype = UNSW_NB15_DTYPES, **arguments)
+  except ValueError:
+    ### K: Integer columns can not hold NaN values, read them as floats.
+    dtypes = {column: (np.float64 if dtype is np.int64 else dtype)
+              for column, dtype in UNSW_NB15_DTYPES.items ()}
+    df = pd.read_csv (file_name, dtype = dtypes, **arguments)
+  for column in PORT_COLUMNS:
+    df [column] = parse_ports (df [column])
+  if (fill_value is not None):
+    numeric = df.select_dtypes (include = 'number').columns
+    df [numeric] = df [numeric].fillna (fill_value)
+  return df, time.time () - startTime, os.path.getsize (file_name)
+
+
+def _fork_context ():
+  ### K: The scripts call the loaders at module level, without a __main__
+  ### guard, so spawned (or forkserver) workers would run the whole script
+  ### again. Where fork is not available the files are read in this process.
+  if ('fork' in multiprocessing.get_all_start_methods ()):
+    return multiprocessing.get_context ('fork')
+  return None
+
+def load_unsw (directory = UNSW_NB15_DIRECTORY, files = UNSW_NB15_FILES,
+               fill_value = None, n_jobs = 1, verbose = True):
+  '''
+  Parameters:
+  -----------
+  directory: str
+
+  files: list of str, default = UNSW_NB15_FILES (all four parts)
+
+  fill_value: scalar, default = None
+    Replaces NaN in the numeric columns of each part. Infinities are read as
+    NaN, so they are replaced as well.
+
+  n_jobs: int, default = 1
+    Number of processes used to parse the parts. -1 means one process per
+    CPU. The parts are concatenated once, after all of them have been read.
+    Forked processes only, the parts are read one by one where fork is not
+    available (Windows).
+
+  verbose: bool, default = True
+
+  Returns:
+  --------
+  df: pandas.DataFrame
+    The 49 named columns, ports as int64 (hexadecimal ports converted, -1
+    for '-').
+
+  Examples:
+  ---------
+  >>> df = load_unsw (n_jobs = -1, fill_value = 0)
+  >>> df = load_unsw (files = ['UNSW-NB15_1.csv'])
+  '''
+  file_names = [directory + file_name for file_name in files]
+  if (n_jobs == -1):
+    n_jobs = os.cpu_count ()
+  context = _fork_context ()
+  if (context is None):
+    n_jobs = 1
+  n_jobs = max (1, min (n_jobs, len (file_names)))
+
+  startTime = time.time ()
+  if (n_jobs == 1):
+    results = [_read_part (file_name, fill_value) for file_name in file_names]
+  else:
+    with ProcessPoolExecutor (max_workers = n_jobs,
+                              mp_context = context) as executor:
+      results = list (executor.map (_read_part, file_names,
+                                    [fill_value] * len (file_names)))
+
+  if (verbose):
+    print ('\nFile | lines | seconds | MB/s')
+    for file_name, (aux, elapsed, size) in zip (file_names, results):
+      elapsed = max (elapsed, 1e-9)
+      print ('{:20s} {:10d} {:8.2f} {:8.2f}'.format (
+             os.path.basename (file_name), aux.shape [0], elapsed,
+             size / 2**20 / elapsed))
+  df = pd.concat ([aux for aux, _, _ in results], ignore_index = True)
+  if (verbose):
+    print ('Total:', df.shape [0], 'lines in',
+           round (time.time () - startTime, 2), 's.\n')
+  return df
+
+
+def encode_labels (labels, mapping = 'binary', unknown = None):
+  '''
+  Same as encode_labels in cicids/unit.py. attack_cat is empty for the
+  normal lines, the None key of LABELS gives them code 0.
+
+  Examples:
+  ---------
+  >>> df ['attack_cat'] = encode_labels (df ['attack_cat'], 'multiclass')
+  '''
+  if (isinstance (mapping, str)):
+    mapping = LABELS [mapping]
+  codes, uniques = pd.factorize (labels)
+  uniques = [label.strip () if isinstance (label, str) else label
+             for label in uniques]
+  unknownLabels = [label for label in uniques if label not in mapping]
+  if ((codes == -1).any () and None not in mapping):
+    unknownLabels.append (None)
+  if (unknownLabels and unknown is None):
+    raise ValueError ('Labels not in the mapping: {}'.format (unknownLabels))
+  missing = mapping.get (None, unknown)
+  table = np.array ([mapping.get (label, unknown) for label in uniques] +
+                    [0 if missing is None else missing])
+  return pd.Series (table [codes], index = labels.index, name = labels.name)
@@ -18,6 +18,7 @@
 import pandas as pd
 import numpy as np
 import sys
+from unit import load_unsw, encode_labels
 
 ###############################################################################
 ## Define constants 
@@ -27,26 +28,18 @@ import sys
 # Random state for reproducibility
 STATE = 0
 np.random.seed(10)
-# List of available attacks on the dataset
-ATTACKS = ['Exploits',
-          'Generic',
-          ' Fuzzers',
-          'DoS',
-          'Analysis',
-          'Worms',
-          'Reconnaissance',
-          'Backdoors',
-          'Shellcode']
+# Available attacks are listed in unit.LABELS
 
 # Especific to the repository 
 UNSW_NB15_DIRECTORY = r'../datasets/unsw-nb15/UNSW-NB15 - CSV Files/'
 UNSW_NB15_FIRST = 'UNSW-NB15_1.csv'
+UNSW_NB15_SECOND = 'UNSW-NB15_2.csv'
+UNSW_NB15_THIRD = 'UNSW-NB15_3.csv'
+UNSW_NB15_FOURTH = 'UNSW-NB15_4.csv'
 
-# Only UNSW_NB15_FIRST is being used on this model
-
-# UNSW_NB15_SECOND = 'UNSW-NB15_2.csv'
-# UNSW_NB15_THIRD = 'UNSW-NB15_3.csv'
-# UNSW_NB15_FOURTH = 'UNSW-NB15_4.csv'
+# Only UNSW_NB15_FIRST is being used on this model, add the other parts to
+# UNSW_NB15_FILES to read them (in parallel)
+UNSW_NB15_FILES = [UNSW_NB15_FIRST]
 
 
 # In[32]:
@@ -55,47 +48,21 @@ UNSW_NB15_FIRST = 'UNSW-NB15_1.csv'
 ###############################################################################
 ## Load dataset
 ###############################################################################
-df = pd.read_csv (UNSW_NB15_DIRECTORY + UNSW_NB15_FIRST)
+## The parts have no header: the 49 column names, hex ports (parsed as
+## integers) and infinities (read as NaN, then filled with 0) are all handled
+## while reading
+df = load_unsw (UNSW_NB15_DIRECTORY, files = UNSW_NB15_FILES, fill_value = 0,
+                n_jobs = -1)
 
 # Fraction dataframe for quicker testing (copying code is hard)
 df = df.sample (frac = 0.1, replace = True, random_state = 0)
 
-columns_label = np.array([ 'srcip','sport','dstip',
-                          'dsport','proto','state',
-                          'dur','sbytes','dbytes',
-                          'sttl','dttl','sloss',
-                          'dloss','service','Sload',
-                          'Dload','Spkts','Dpkts',
-                          'swin','dwin','stcpb',
-                          'dtcpb','smeansz','dmeansz',
-                          'trans_depth','res_bdy_len','Sjit',
-                          'Djit','Stime','Ltime',
-                          'Sintpkt','Dintpkt','tcprtt',
-                          'synack','ackdat','is_sm_ips_ports',
-                          'ct_state_ttl','ct_flw_http_mthd','is_ftp_login',
-                          'ct_ftp_cmd','ct_srv_src','ct_srv_dst',
-                          'ct_dst_ltm','ct_src_ltm','ct_src_dport_ltm',
-                          'ct_dst_sport_ltm','ct_dst_src_ltm','attack_cat',
-                          'Label'])
-
-## Add the columns label to our dataset
-df.columns = columns_label
-
 ## Counting number of null data
 nanColumns = [i for i in df.columns if df [i].isnull ().any ()]
 
-## Remove NaN and inf values
-df.replace ('Infinity', np.nan, inplace = True) ## Or other text values
-df.replace (np.inf, np.nan, inplace = True) ## Remove infinity
-df.replace (np.nan, 0, inplace = True)
-
-## Remove error values, especific from the dataset
-df.replace ('0xc0a8', 0, inplace = True)
-df.replace ('0x20205321', 0, inplace = True)
-
-## For binary comparison: Attack or not Attack
-for attack in ATTACKS:
-    df['attack_cat'] = df ['attack_cat'].replace(attack, 1) 
+## For binary comparison: Attack or not Attack (normal traffic has no attack
+## category)
+df['attack_cat'] = encode_labels(df['attack_cat'], 'binary')
 
 # In this case we drop the last column. 'attack_cat' will be our target
 df.drop(['Label'], axis=1)